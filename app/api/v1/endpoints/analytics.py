@@ -1,15 +1,137 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import Dict, List
-from app.db.imessage import IMessageDB
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from contextlib import contextmanager
+from datetime import datetime
+from typing import AsyncIterator, Iterator, List, Optional
+import json
+from app.db.errors import InvalidArgument
+from app.db.executor import IMessageDBBusy, Reservation
+from app.db.search_index import SearchUnavailable
+from app.db.imessage import (
+    DEFAULT_MESSAGE_FIELDS,
+    MESSAGE_FIELDS,
+    AsyncIMessageDB,
+    IMessageDB,
+    get_shared_async_db,
+    get_worker_pool,
+)
 from app.core.auth import get_current_user
-from app.schemas.analytics import MessageStats, WordFrequency, WordFrequencyList
+from app.core.metrics import TimedRoute, current_trace
+from app.core.settings import settings
+from app.services.cache import ResponseCache, get_response_cache
+from app.services.export import EXPORT_FORMATS, EXPORT_TABLES, iter_export_chunks
+from app.schemas.analytics import (
+    ActivityHistogram,
+    ChatParticipant,
+    ChatParticipants,
+    ChatStats,
+    ContactLeaderboard,
+    ContactStatsBatch,
+    ContactStatsBatchRequest,
+    MessagePage,
+    MessageStats,
+    ResponseTimes,
+    ResponseTimesByContact,
+    SearchResults,
+    WordFrequency,
+    WordFrequencyList,
+)
+
+async def profile_request(request: Request, current_user = Depends(get_current_user)) -> None:
+    """Profile the request if ?profile=1 is given by an admin.
+
+    The profile summaries of the database calls it makes are added to the
+    JSON response under "profile" (see app.core.metrics).
+
+    Raises:
+        HTTPException: 403 if a user not in ADMIN_EMAILS asks for a profile
+    """
+    if request.query_params.get("profile") != "1":
+        return
+    if current_user.get("email") not in settings.ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=403,
+            detail="Profiling is restricted to admins"
+        )
+    trace = current_trace()
+    if trace is not None:
+        trace.profile = True
+
+
+router = APIRouter(route_class=TimedRoute, dependencies=[Depends(profile_request)])
+
+
+@contextmanager
+def imessage_errors() -> Iterator[None]:
+    """Turn errors raised while reading chat.db into HTTP errors.
+
+    Raises:
+        HTTPException: 400 for InvalidArgument, 503 when the search index
+            or chat.db is unavailable or the worker pool is saturated (with
+            Retry-After), 500 for anything else, including other ValueErrors
+    """
+    try:
+        yield
+    except HTTPException:
+        raise
+    except InvalidArgument as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except SearchUnavailable:
+        raise HTTPException(
+            status_code=503,
+            detail="Search index not available"
+        )
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=503,
+            detail="iMessage database not accessible"
+        )
+    except IMessageDBBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="iMessage database is busy, retry shortly",
+            headers={"Retry-After": "1"}
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error accessing message data: {str(e)}"
+        )
+
+
+async def get_imessage(request: Request) -> AsyncIterator[AsyncIMessageDB]:
+    """Yield the iMessage accessor for a request.
+
+    Serves from the shared snapshot/read-only accessor unless
+    IMESSAGE_ACCESS_MODE is "copy", in which case a private copy is made for
+    this request only. Blocking work runs on the shared worker pool. A
+    streaming response that still reads from a private copy after the
+    endpoint returns sets request.state.closes_imessage and closes it itself.
+    """
+    copy_per_request = settings.IMESSAGE_ACCESS_MODE == "copy"
+    with imessage_errors():
+        if copy_per_request:
+            pool = get_worker_pool()
+            db = AsyncIMessageDB(IMessageDB(), pool)
+            await db.connect()
+        else:
+            db = await get_shared_async_db()
+    try:
+        yield db
+    finally:
+        if copy_per_request and not getattr(request.state, "closes_imessage", False):
+            await db.close()
 
-router = APIRouter()
 
 @router.get("/contacts/{contact_id}/stats", response_model=MessageStats)
 async def get_contact_stats(
     contact_id: str,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db: AsyncIMessageDB = Depends(get_imessage),
+    cache: ResponseCache = Depends(get_response_cache)
 ) -> MessageStats:
     """Get message statistics for a specific contact.
     
@@ -19,51 +141,464 @@ async def get_contact_stats(
     Returns:
         MessageStats containing sent and received message counts
     """
-    try:
-        with IMessageDB() as db:
-            stats = db.get_message_count_by_contact(contact_id)
-            return MessageStats(**stats)
-    except FileNotFoundError:
-        raise HTTPException(
-            status_code=503,
-            detail="iMessage database not accessible"
+    with imessage_errors():
+        stats = await cache.get_or_compute(
+            "stats",
+            db.get_version,
+            {"contact_id": contact_id},
+            lambda: db.get_message_count_by_contact(contact_id)
         )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error accessing message data: {str(e)}"
+        return MessageStats(**stats)
+
+@router.get("/contacts", response_model=ContactLeaderboard)
+async def get_contact_leaderboard(
+    sort: str = Query(
+        "messages",
+        pattern="^(messages|sent|received|first_message|last_message|messages_per_day|average_length)$"
+    ),
+    limit: int = Query(50, ge=1, le=5000),
+    current_user = Depends(get_current_user),
+    db: AsyncIMessageDB = Depends(get_imessage),
+    cache: ResponseCache = Depends(get_response_cache)
+) -> ContactLeaderboard:
+    """Rank contacts by their message totals.
+    
+    Served from a per-contact rollup in the sidecar database, which is
+    updated incrementally, so ranking every contact is a single read.
+    
+    Args:
+        sort: Ranking key: "messages" (default), "sent", "received",
+            "first_message", "last_message", "messages_per_day" or
+            "average_length"
+        limit: Number of contacts to return (default: 50)
+        
+    Returns:
+        ContactLeaderboard with the top contacts, highest first
+    """
+    with imessage_errors():
+        contacts = await cache.get_or_compute(
+            "contact-leaderboard",
+            db.get_version,
+            {"sort": sort, "limit": limit},
+            lambda: db.get_contact_leaderboard(sort, limit)
+        )
+        return ContactLeaderboard(contacts=contacts)
+
+
+@router.post("/contacts/stats:batch", response_model=ContactStatsBatch)
+async def get_contact_stats_batch(
+    request: ContactStatsBatchRequest,
+    current_user = Depends(get_current_user),
+    db: AsyncIMessageDB = Depends(get_imessage),
+    cache: ResponseCache = Depends(get_response_cache)
+) -> ContactStatsBatch:
+    """Get message statistics for many contacts in one request.
+    
+    Args:
+        request: Phone numbers or emails of the contacts
+        
+    Returns:
+        ContactStatsBatch mapping each contact to its sent and received counts
+    """
+    with imessage_errors():
+        stats = await cache.get_or_compute(
+            "stats-batch",
+            db.get_version,
+            {"contact_ids": request.contact_ids},
+            lambda: db.get_message_counts_by_contacts(request.contact_ids)
+        )
+        return ContactStatsBatch(
+            stats={
+                contact_id: MessageStats(**counts)
+                for contact_id, counts in stats.items()
+            }
         )
 
 @router.get("/contacts/{contact_id}/word-frequency", response_model=WordFrequencyList)
 async def get_word_frequency(
     contact_id: str,
-    limit: int = 10,
-    current_user = Depends(get_current_user)
+    limit: int = Query(10, ge=1, le=1000),
+    approximate: bool = False,
+    current_user = Depends(get_current_user),
+    db: AsyncIMessageDB = Depends(get_imessage),
+    cache: ResponseCache = Depends(get_response_cache)
 ) -> WordFrequencyList:
     """Get most common words used in conversations with a contact.
     
     Args:
         contact_id: Phone number or email of the contact
         limit: Number of top words to return (default: 10)
+        approximate: Estimate counts from a fixed-size heavy-hitters summary
         
     Returns:
         WordFrequencyList containing word frequency data
     """
-    try:
-        with IMessageDB() as db:
-            frequencies = db.get_word_frequency(contact_id, limit)
-            word_freqs = [
-                WordFrequency(word=word, count=count)
-                for word, count in frequencies
-            ]
-            return WordFrequencyList(frequencies=word_freqs)
-    except FileNotFoundError:
+    with imessage_errors():
+        frequencies = await cache.get_or_compute(
+            "word-frequency",
+            db.get_version,
+            {"contact_id": contact_id, "limit": limit, "approximate": approximate},
+            lambda: db.get_word_frequency(contact_id, limit, approximate)
+        )
+        word_freqs = [
+            WordFrequency(word=word, count=count)
+            for word, count in frequencies
+        ]
+        return WordFrequencyList(frequencies=word_freqs)
+
+@router.get("/chats/{chat_id}/stats", response_model=ChatStats)
+async def get_chat_stats(
+    chat_id: int,
+    current_user = Depends(get_current_user),
+    db: AsyncIMessageDB = Depends(get_imessage),
+    cache: ResponseCache = Depends(get_response_cache)
+) -> ChatStats:
+    """Get message statistics for a chat, including group chats.
+    
+    Args:
+        chat_id: ROWID of the chat
+        
+    Returns:
+        ChatStats containing sent and received message counts and the
+        number of participants
+    """
+    with imessage_errors():
+        stats = await cache.get_or_compute(
+            "chat-stats",
+            db.get_version,
+            {"chat_id": chat_id},
+            lambda: db.get_chat_stats(chat_id)
+        )
+        return ChatStats(**stats)
+
+@router.get("/chats/{chat_id}/word-frequency", response_model=WordFrequencyList)
+async def get_chat_word_frequency(
+    chat_id: int,
+    limit: int = Query(10, ge=1, le=1000),
+    current_user = Depends(get_current_user),
+    db: AsyncIMessageDB = Depends(get_imessage),
+    cache: ResponseCache = Depends(get_response_cache)
+) -> WordFrequencyList:
+    """Get most common words in a chat, from every participant.
+    
+    Args:
+        chat_id: ROWID of the chat
+        limit: Number of top words to return (default: 10)
+        
+    Returns:
+        WordFrequencyList containing word frequency data
+    """
+    with imessage_errors():
+        frequencies = await cache.get_or_compute(
+            "chat-word-frequency",
+            db.get_version,
+            {"chat_id": chat_id, "limit": limit},
+            lambda: db.get_chat_word_frequency(chat_id, limit)
+        )
+        return WordFrequencyList(frequencies=[
+            WordFrequency(word=word, count=count)
+            for word, count in frequencies
+        ])
+
+@router.get("/chats/{chat_id}/participants", response_model=ChatParticipants)
+async def get_chat_participants(
+    chat_id: int,
+    current_user = Depends(get_current_user),
+    db: AsyncIMessageDB = Depends(get_imessage),
+    cache: ResponseCache = Depends(get_response_cache)
+) -> ChatParticipants:
+    """List the members of a chat and how many messages each has sent to it.
+    
+    Args:
+        chat_id: ROWID of the chat
+        
+    Returns:
+        ChatParticipants, most active first
+    """
+    with imessage_errors():
+        participants = await cache.get_or_compute(
+            "chat-participants",
+            db.get_version,
+            {"chat_id": chat_id},
+            lambda: db.get_chat_participants(chat_id)
+        )
+        return ChatParticipants(participants=[
+            ChatParticipant(**participant) for participant in participants
+        ])
+
+@router.get("/contacts/{contact_id}/activity", response_model=ActivityHistogram)
+async def get_contact_activity(
+    contact_id: str,
+    bucket: str = Query("day", pattern="^(hour|day|week)$"),
+    tz: str = "UTC",
+    current_user = Depends(get_current_user),
+    db: AsyncIMessageDB = Depends(get_imessage),
+    cache: ResponseCache = Depends(get_response_cache)
+) -> ActivityHistogram:
+    """Get how many messages were exchanged with a contact over time.
+    
+    Args:
+        contact_id: Phone number or email of the contact
+        bucket: Histogram resolution, "hour", "day" (default) or "week"
+        tz: IANA time zone buckets are aligned to (default: UTC)
+        
+    Returns:
+        ActivityHistogram with sent and received counts per bucket, from
+        the first to the last message
+    """
+    with imessage_errors():
+        activity = await cache.get_or_compute(
+            "activity",
+            db.get_version,
+            {"contact_id": contact_id, "bucket": bucket, "tz": tz},
+            lambda: db.get_activity(contact_id, bucket, tz)
+        )
+        return ActivityHistogram(bucket=bucket, timezone=tz, **activity)
+
+
+@router.get("/contacts/{contact_id}/response-times", response_model=ResponseTimes)
+async def get_contact_response_times(
+    contact_id: str,
+    current_user = Depends(get_current_user),
+    db: AsyncIMessageDB = Depends(get_imessage),
+    cache: ResponseCache = Depends(get_response_cache)
+) -> ResponseTimes:
+    """Get how quickly you and a contact reply to each other.
+    
+    A reply is a message sent right after one from the other side; its
+    latency is the gap between the two.
+    
+    Args:
+        contact_id: Phone number or email of the contact
+        
+    Returns:
+        ResponseTimes with reply counts and p50/p90/p99 latency in seconds
+    """
+    with imessage_errors():
+        times = await cache.get_or_compute(
+            "response-times",
+            db.get_version,
+            {"contact_id": contact_id},
+            lambda: db.get_response_times(contact_id)
+        )
+        return ResponseTimes(**times)
+
+
+@router.get("/response-times", response_model=ResponseTimesByContact)
+async def get_all_response_times(
+    current_user = Depends(get_current_user),
+    db: AsyncIMessageDB = Depends(get_imessage),
+    cache: ResponseCache = Depends(get_response_cache)
+) -> ResponseTimesByContact:
+    """Get reply latency for every contact at once.
+    
+    Contacts are summarized in parallel on a pool of worker processes.
+    
+    Returns:
+        ResponseTimesByContact mapping each contact to its ResponseTimes
+    """
+    with imessage_errors():
+        times = await cache.get_or_compute(
+            "response-times-all",
+            db.get_version,
+            {},
+            lambda: db.get_all_response_times()
+        )
+        return ResponseTimesByContact(contacts=times)
+
+
+@router.get("/word-frequency", response_model=WordFrequencyList)
+async def get_global_word_frequency(
+    limit: int = Query(10, ge=1, le=1000),
+    approximate: bool = False,
+    current_user = Depends(get_current_user),
+    db: AsyncIMessageDB = Depends(get_imessage),
+    cache: ResponseCache = Depends(get_response_cache)
+) -> WordFrequencyList:
+    """Get the most common words across all conversations.
+    
+    Args:
+        limit: Number of top words to return (default: 10)
+        approximate: Estimate counts from a fixed-size heavy-hitters summary
+        
+    Returns:
+        WordFrequencyList containing word frequency data
+    """
+    with imessage_errors():
+        frequencies = await cache.get_or_compute(
+            "global-word-frequency",
+            db.get_version,
+            {"limit": limit, "approximate": approximate},
+            lambda: db.get_global_word_frequency(limit, approximate=approximate)
+        )
+        return WordFrequencyList(frequencies=[
+            WordFrequency(word=word, count=count)
+            for word, count in frequencies
+        ])
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _parse_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return list(DEFAULT_MESSAGE_FIELDS)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in MESSAGE_FIELDS]
+    if unknown:
         raise HTTPException(
-            status_code=503,
-            detail="iMessage database not accessible"
+            status_code=400,
+            detail=f"Unknown message fields: {', '.join(unknown)}"
         )
-    except Exception as e:
+    return requested
+
+
+async def _stream_from_pool(
+    db: AsyncIMessageDB, slot: Reservation, items, close_db: bool
+) -> AsyncIterator:
+    """Drain a blocking generator one item at a time in a reserved pool slot.
+
+    The slot is taken before the response starts (see BoundedExecutor.reserve),
+    so a saturated pool is answered with a 503 rather than a truncated body.
+    """
+    try:
+        while True:
+            item = await slot.run(next, items, None)
+            if item is None:
+                break
+            yield item
+    finally:
+        try:
+            await slot.run(items.close)
+            if close_db:
+                await slot.run(db.db.close)
+        finally:
+            slot.release()
+
+
+async def _stream_ndjson(
+    db: AsyncIMessageDB, slot: Reservation, batches, close_db: bool
+) -> AsyncIterator[bytes]:
+    """Yield one JSON line per message, pulling batches on the worker pool."""
+    async for batch in _stream_from_pool(db, slot, batches, close_db):
+        yield "".join(json.dumps(message) + "\n" for message in batch).encode()
+
+
+@router.get("/contacts/{contact_id}/messages", response_model=MessagePage)
+async def get_contact_messages(
+    contact_id: str,
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    format: Optional[str] = Query(None, pattern="^(json|ndjson)$"),
+    current_user = Depends(get_current_user),
+    db: AsyncIMessageDB = Depends(get_imessage)
+):
+    """List the messages exchanged with a contact, oldest first.
+    
+    Pages are keyed on (date, ROWID): pass next_cursor from one page as
+    cursor to get the next. With format=ndjson (or Accept:
+    application/x-ndjson) every matching message is streamed instead, one
+    JSON object per line, ignoring limit and cursor.
+    
+    Args:
+        contact_id: Phone number or email of the contact
+        limit: Messages per page (default: 100)
+        cursor: next_cursor from the previous page
+        since: Only messages sent at or after this time
+        until: Only messages sent before this time
+        fields: Comma-separated message columns to return (default: id,date,is_from_me,text)
+        format: "json" for a page, "ndjson" to stream everything
+        
+    Returns:
+        MessagePage, or an application/x-ndjson stream
+    """
+    columns = _parse_fields(fields)
+    stream = format == "ndjson" or (
+        format is None and NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+    )
+    with imessage_errors():
+        if stream:
+            batches = await db.iter_message_batches(contact_id, columns, since, until)
+            slot = db.pool.reserve()
+            # The body is produced after the request's dependencies exit
+            close_db = settings.IMESSAGE_ACCESS_MODE == "copy"
+            request.state.closes_imessage = close_db
+            return StreamingResponse(
+                _stream_ndjson(db, slot, batches, close_db),
+                media_type=NDJSON_MEDIA_TYPE
+            )
+        page = await db.get_messages_page(contact_id, limit, cursor, columns, since, until)
+        return MessagePage(**page)
+
+
+@router.get("/export/{table}")
+async def export_table(
+    table: str,
+    request: Request,
+    format: str = Query("parquet", pattern="^(arrow|parquet)$"),
+    batch_size: int = Query(settings.EXPORT_BATCH_SIZE, ge=1, le=1_000_000),
+    current_user = Depends(get_current_user),
+    db: AsyncIMessageDB = Depends(get_imessage)
+) -> StreamingResponse:
+    """Stream a whole chat.db table as Arrow IPC or Parquet.
+    
+    The table is read from one snapshot in batch_size chunks and each chunk
+    is sent as soon as it is encoded, so memory stays bounded however large
+    the table is.
+    
+    Args:
+        table: One of message, handle, chat, chat_message_join, chat_handle_join
+        format: "parquet" (default) or "arrow" (IPC stream)
+        batch_size: Rows per record batch / row group
+        
+    Returns:
+        StreamingResponse with the encoded table
+    """
+    if table not in EXPORT_TABLES:
         raise HTTPException(
-            status_code=500,
-            detail=f"Error accessing message data: {str(e)}"
+            status_code=404,
+            detail=f"Unknown table: {table}"
+        )
+    media_type, extension = EXPORT_FORMATS[format]
+    with imessage_errors():
+        rows = await db.iter_table_rows(table, batch_size)
+        chunks = iter_export_chunks(table, rows, format)
+        slot = db.pool.reserve()
+        close_db = settings.IMESSAGE_ACCESS_MODE == "copy"
+        request.state.closes_imessage = close_db
+        return StreamingResponse(
+            _stream_from_pool(db, slot, chunks, close_db),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{table}.{extension}"'}
         )
+
+
+@router.get("/search", response_model=SearchResults)
+async def search_messages(
+    q: str = Query(..., min_length=1),
+    contact_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user = Depends(get_current_user),
+    db: AsyncIMessageDB = Depends(get_imessage)
+) -> SearchResults:
+    """Search message text, best matches first.
+    
+    Args:
+        q: Words that must all appear in a message
+        contact_id: Only messages exchanged with this contact
+        since: Only messages sent at or after this time
+        limit: Results per page (default: 20)
+        cursor: next_cursor from the previous page
+        
+    Returns:
+        SearchResults with highlighted snippets and the next page's cursor
+    """
+    with imessage_errors():
+        results = await db.search_messages(q, contact_id, since, limit, cursor)
+        return SearchResults(**results)
@@ -4,12 +4,23 @@ from authlib.integrations.starlette_client import OAuthError
 from datetime import timedelta
 from starlette.middleware.sessions import SessionMiddleware
 
-from app.core.auth import oauth, create_access_token
+from app.core.auth import oauth, oauth2_scheme, create_access_token, get_current_user
+from app.core.auth_cache import revoke_api_key, revoke_token
 from app.core.config import settings
+from app.core.settings import settings as app_settings
+from app.models.user import User
 
 router = APIRouter()
 
 
+def get_users_db():
+    """Yield a session on the server database, which holds the API keys."""
+    # Imported here so the API does not need a server database driver
+    # unless API keys are managed
+    from app.db.session import get_db
+    yield from get_db()
+
+
 @router.get("/test")
 async def test_route():
     return {"status": "ok"}
@@ -63,3 +74,42 @@ async def github_auth(request: Request):
             status_code=400,
             detail=f"OAuth error: {error.error}"
         )
+
+
+@router.post("/logout", status_code=204)
+async def logout(
+    token: str = Depends(oauth2_scheme),
+    current_user = Depends(get_current_user)
+) -> Response:
+    """Revoke the bearer token of this request in every API process."""
+    await revoke_token(token)
+    return Response(status_code=204)
+
+
+@router.delete("/users/{email}/api-key", status_code=204)
+async def delete_api_key(
+    email: str,
+    current_user = Depends(get_current_user),
+    db = Depends(get_users_db)
+) -> Response:
+    """Remove a user's API key and drop it from every process's cache.
+
+    Raises:
+        HTTPException: 403 for users not in ADMIN_EMAILS, 404 for unknown users
+    """
+    if current_user.get("email") not in app_settings.ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=403,
+            detail="Revoking API keys is restricted to admins"
+        )
+    user = db.query(User).filter(User.email == email).first()
+    if user is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown user: {email}"
+        )
+    api_key, user.api_key = user.api_key, None
+    db.commit()
+    if api_key:
+        await revoke_api_key(api_key)
+    return Response(status_code=204)
@@ -1,4 +1,7 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, HTTPException, Request
+from app.core.auth_cache import auth_cache_stats
+from app.db.imessage import get_shared_async_db
+from app.services.cache import get_response_cache
 
 router = APIRouter()
 
@@ -16,3 +19,27 @@ async def list_routes(request: Request):
             "methods": route.methods
         })
     return {"routes": routes}
+
+@router.get("/debug/snapshot")
+async def snapshot_metrics():
+    """Report snapshot refresh duration, pages copied and current version."""
+    try:
+        db = (await get_shared_async_db()).db
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=503,
+            detail="iMessage database not accessible"
+        )
+    if db.snapshots is None:
+        return {"mode": db.mode}
+    return {"mode": db.mode, **db.snapshots.metrics()}
+
+@router.get("/debug/cache")
+async def cache_metrics():
+    """Report analytics response cache hit/miss counters."""
+    return get_response_cache().stats()
+
+@router.get("/debug/auth-cache")
+async def auth_cache_metrics():
+    """Report token and API key cache hit rates."""
+    return auth_cache_stats()
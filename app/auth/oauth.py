@@ -3,6 +3,7 @@ from fastapi.security import OAuth2AuthorizationCodeBearer
 from authlib.integrations.starlette_client import OAuth
 from starlette.config import Config
 from app.core.settings import settings
+from app.core.auth_cache import api_key_cache
 from app.db.session import get_db
 from app.models.user import User
 from sqlalchemy.orm import Session
@@ -36,8 +37,15 @@ async def get_current_user(
     api_key: str = Depends(OAuth2AuthorizationCodeBearer(tokenUrl="token")),
     db: Session = Depends(get_db)
 ) -> User:
-    user = db.query(User).filter(User.api_key == api_key,
-                                 User.is_active == True).first()
+    # Active users are cached for AUTH_CACHE_TTL_SECONDS so most requests
+    # never check out a database connection; see revoke_api_key()
+    user = api_key_cache.get(api_key)
+    if user is None:
+        user = db.query(User).filter(User.api_key == api_key,
+                                     User.is_active == True).first()
+        if user:
+            db.expunge(user)
+            api_key_cache.set(api_key, user)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -7,6 +7,7 @@ from authlib.integrations.starlette_client import OAuth
 from starlette.requests import Request
 
 from app.core.config import settings
+from app.core.auth_cache import is_revoked, token_cache, token_ttl
 
 # OAuth setup
 oauth = OAuth()
@@ -44,12 +45,24 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+    if is_revoked(token):
+        raise credentials_exception
+
+    # Tokens that already passed validation are cached until they expire
+    payload = token_cache.get(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except JWTError:
             raise credentials_exception
-    except JWTError:
+        ttl = token_ttl(payload)
+        if ttl is not None:
+            token_cache.set(token, payload, ttl=ttl)
+
+    email: str = payload.get("sub")
+    # A revocation is only remembered until exp, so a token without one
+    # could never be revoked for good
+    if email is None or payload.get("exp") is None:
         raise credentials_exception
     
     # Here you might want to fetch user from database
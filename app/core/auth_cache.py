@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from jose import JWTError, jwt
+
+from app.core.cache import LRUCache
+from app.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - redis is in requirements.txt
+    aioredis = None
+
+# Validated JWTs -> decoded payload, so repeated requests skip jwt.decode.
+# Entries never outlive the token's own exp claim.
+token_cache = LRUCache(max_entries=settings.AUTH_CACHE_MAX_ENTRIES)
+
+# API key -> active User, so repeated requests skip the database lookup
+api_key_cache = LRUCache(
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+    ttl=settings.AUTH_CACHE_TTL_SECONDS
+)
+
+
+def _digest(secret: str) -> str:
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+
+class RevocationList:
+    """Tokens revoked before their exp, remembered until exactly then.
+
+    Checks never leave the process: the list is held in memory, so looking
+    a token up costs no more than a dict lookup. Nothing is evicted early:
+    an entry is dropped only once its token has expired and would be
+    rejected anyway. Tokens without an exp are rejected outright (see
+    get_current_user), so every revocation has an end.
+
+    When REDIS_URL is reachable, revocations are also kept in a Redis
+    sorted set scored by exp and published on a channel. listen() loads the
+    set and then applies what other processes publish, so a revocation
+    reaches every API process; otherwise it applies to this process only.
+    API key revocations are published the same way and clear api_keys in
+    every process.
+    """
+
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        prefix: str = "msg-api:revoked",
+        api_keys: Optional[LRUCache] = None,
+    ):
+        """Initialize an empty list.
+
+        Args:
+            redis_url: Redis connection URL. If empty, only memory is used.
+            prefix: Name of the Redis sorted set; the channel is prefix:events
+            api_keys: Cache of API key lookups to clear on revocation
+        """
+        self.key = prefix
+        self.channel = f"{prefix}:events"
+        self.redis_url = redis_url
+        self.api_keys = api_keys
+        # SHA-256 of the token -> its exp as a Unix timestamp
+        self._expiry: Dict[str, float] = {}
+        # Expired entries are swept once the list doubles, so adds stay O(1)
+        self._sweep_at = 1024
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_checked = not (redis_url and aioredis is not None)
+
+    def _remember(self, digest: str, exp: float) -> None:
+        now = time.time()
+        with self._lock:
+            if len(self._expiry) >= self._sweep_at:
+                self._expiry = {key: expiry for key, expiry in self._expiry.items() if expiry > now}
+                self._sweep_at = max(1024, 2 * len(self._expiry))
+            if exp > now:
+                self._expiry[digest] = exp
+
+    def _forget_api_key(self, digest: str) -> None:
+        if self.api_keys is not None:
+            self.api_keys.delete_where(lambda api_key: _digest(api_key) == digest)
+
+    def _apply(self, event: Dict[str, Any]) -> None:
+        """Apply a revocation published by any process (including this one)."""
+        if "token" in event:
+            self._remember(event["token"], float(event["exp"]))
+        elif "api_key" in event:
+            self._forget_api_key(event["api_key"])
+
+    async def add(self, token: str, exp: float) -> None:
+        """Revoke a token until its exp."""
+        digest = _digest(token)
+        self._remember(digest, exp)
+        if exp > time.time():
+            await self._publish({"token": digest, "exp": exp})
+
+    async def revoke_api_key(self, api_key: str) -> None:
+        """Drop an API key from the api_keys cache of every process."""
+        digest = _digest(api_key)
+        self._forget_api_key(digest)
+        await self._publish({"api_key": digest})
+
+    def contains(self, token: str) -> bool:
+        """Return True if the token was revoked and has not expired yet."""
+        with self._lock:
+            expiry = self._expiry.get(_digest(token))
+        return expiry is not None and expiry > time.time()
+
+    async def _publish(self, event: Dict[str, Any]) -> None:
+        client = await self._client()
+        if client is None:
+            return
+        try:
+            if "token" in event:
+                await client.zadd(self.key, {event["token"]: event["exp"]})
+                await client.zremrangebyscore(self.key, "-inf", time.time())
+            await client.publish(self.channel, json.dumps(event))
+        except Exception as e:
+            logger.warning("Could not share revocation through Redis: %s", e)
+
+    async def listen(self, retry_seconds: float = 5.0) -> None:
+        """Apply revocations published by other processes until cancelled.
+
+        Returns at once without Redis. The revocations still in force are
+        loaded after every (re)subscribe, so none published while this
+        process was disconnected are missed.
+        """
+        client = await self._client()
+        if client is None:
+            return
+        while True:
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    for digest, exp in await client.zrangebyscore(
+                        self.key, time.time(), "+inf", withscores=True
+                    ):
+                        self._remember(digest.decode(), exp)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._apply(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Lost the revocation feed, resubscribing: %s", e)
+            await asyncio.sleep(retry_seconds)
+
+    async def _client(self):
+        if not self._redis_checked:
+            self._redis_checked = True
+            try:
+                client = aioredis.from_url(self.redis_url)
+                await client.ping()
+                self._redis = client
+            except Exception as e:
+                logger.info("Redis unavailable, revocations are per process: %s", e)
+        return self._redis
+
+    def __len__(self) -> int:
+        now = time.time()
+        with self._lock:
+            return sum(1 for expiry in self._expiry.values() if expiry > now)
+
+
+revoked_tokens = RevocationList(redis_url=settings.REDIS_URL, api_keys=api_key_cache)
+
+
+def token_ttl(payload: Dict[str, Any]) -> Optional[float]:
+    """Return how long a validated token may stay cached, or None to skip.
+
+    Bounded by both AUTH_CACHE_TTL_SECONDS and the token's exp claim.
+    """
+    ttl = float(settings.AUTH_CACHE_TTL_SECONDS)
+    exp = payload.get("exp")
+    if exp is not None:
+        ttl = min(ttl, float(exp) - time.time())
+    return ttl if ttl > 0 else None
+
+
+def is_revoked(token: str) -> bool:
+    """Return True if the token has been revoked (never leaves the process)."""
+    return revoked_tokens.contains(token)
+
+
+async def revoke_token(token: str, exp: Optional[float] = None) -> None:
+    """Reject a token from now on, even though its signature is still valid.
+
+    Args:
+        token: Encoded JWT
+        exp: The token's exp claim (default: read from the token). The
+            revocation is remembered until then. A token without one is
+            never accepted, so there is nothing to remember.
+    """
+    token_cache.delete(token)
+    if exp is None:
+        try:
+            exp = jwt.get_unverified_claims(token).get("exp")
+        except JWTError:
+            return
+    if exp is not None:
+        await revoked_tokens.add(token, float(exp))
+
+
+async def revoke_api_key(api_key: str) -> None:
+    """Forget a cached API key in every process so it is checked again."""
+    await revoked_tokens.revoke_api_key(api_key)
+
+
+def auth_cache_stats() -> Dict[str, Any]:
+    """Return hit/miss counters for the token and API key caches."""
+    return {
+        "tokens": token_cache.stats(),
+        "api_keys": api_key_cache.stats(),
+        "revoked_tokens": len(revoked_tokens),
+    }
@@ -0,0 +1,301 @@
+"""
+Request timing, per-phase spans and Prometheus metrics.
+
+MetricsMiddleware times every request and gives it a RequestTrace. Code that
+serves the request records spans into that trace, including code running on
+the worker pool:
+
+    with span("query") as query:
+        rows = session.execute(...).all()
+        query.rows = len(rows)
+
+Each span's exclusive time (minus nested spans), rows and bytes are
+observed in Prometheus histograms served by metrics_endpoint, and the
+request's phases are returned in a Server-Timing header.
+
+With profiling enabled on the trace (see the analytics profile_request
+dependency), every call run through run_profiled() is profiled with
+pyinstrument, or cProfile when it is not installed, and the summaries are
+added to the JSON response under "profile".
+"""
+
+import asyncio
+import cProfile
+import functools
+import io
+import json
+import pstats
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from fastapi.routing import APIRoute
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # pragma: no cover - optional, cProfile is the fallback
+    Profiler = None
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ["method", "route", "status"],
+)
+PHASE_SECONDS = Histogram(
+    "imessage_phase_duration_seconds",
+    "Time spent in each phase of serving a request, excluding nested phases",
+    ["phase"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+ROWS_SCANNED = Histogram(
+    "imessage_rows_scanned",
+    "Rows read from chat.db per phase",
+    ["phase"],
+    buckets=(1, 10, 100, 1000, 10_000, 100_000, 1_000_000, 10_000_000),
+)
+BYTES_COPIED = Histogram(
+    "imessage_bytes_copied",
+    "Bytes copied per phase, e.g. taking a snapshot of chat.db",
+    ["phase"],
+    buckets=(2 ** 20, 2 ** 23, 2 ** 26, 2 ** 28, 2 ** 30, 2 ** 32, 2 ** 34),
+)
+
+# Number of functions listed in a cProfile summary
+PROFILE_FUNCTIONS = 25
+
+
+class Span:
+    """Duration, rows and bytes of one phase of work."""
+
+    def __init__(self, phase: str):
+        self.phase = phase
+        self.seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        # Time spent in nested spans, excluded from seconds
+        self.nested_seconds = 0.0
+
+
+class RequestTrace:
+    """Spans and profiles collected while serving one request."""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self.profile = False
+        self.profiles: List[str] = []
+        # perf_counter() when the endpoint function returned
+        self.endpoint_returned: Optional[float] = None
+
+    def phases(self) -> Dict[str, float]:
+        """Return the total seconds spent in each phase."""
+        totals: Dict[str, float] = {}
+        for recorded in self.spans:
+            totals[recorded.phase] = totals.get(recorded.phase, 0.0) + recorded.seconds
+        return totals
+
+    def server_timing(self) -> str:
+        """Format the phases as a Server-Timing header value."""
+        return ", ".join(
+            f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in self.phases().items()
+        )
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    """Return the trace of the request being served, if any."""
+    return _current_trace.get()
+
+
+def _record(recorded: Span) -> None:
+    PHASE_SECONDS.labels(recorded.phase).observe(recorded.seconds)
+    if recorded.rows:
+        ROWS_SCANNED.labels(recorded.phase).observe(recorded.rows)
+    if recorded.bytes:
+        BYTES_COPIED.labels(recorded.phase).observe(recorded.bytes)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append(recorded)
+
+
+@contextmanager
+def span(phase: str) -> Iterator[Span]:
+    """Time a block of work as one phase.
+
+    Set rows and bytes on the yielded Span to record them too.
+    """
+    recorded = Span(phase)
+    parent = _current_span.get()
+    token = _current_span.set(recorded)
+    started = time.perf_counter()
+    try:
+        yield recorded
+    finally:
+        _current_span.reset(token)
+        elapsed = time.perf_counter() - started
+        if parent is not None:
+            parent.nested_seconds += elapsed
+        recorded.seconds = elapsed - recorded.nested_seconds
+        _record(recorded)
+
+
+def timed_iter(batches: Iterable[Any], phase: str) -> Iterator[Any]:
+    """Yield batches, timing only the work of producing them as a phase.
+
+    For streamed results, where fetching is interleaved with the caller's
+    processing: time spent by the caller between batches is not counted.
+    Each batch's length is added to the span's rows.
+    """
+    recorded = Span(phase)
+    iterator = iter(batches)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed = time.perf_counter() - started
+                recorded.seconds += elapsed
+                parent = _current_span.get()
+                if parent is not None:
+                    parent.nested_seconds += elapsed
+            recorded.rows += len(batch)
+            yield batch
+    finally:
+        _record(recorded)
+
+
+def run_profiled(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Call func, profiling it if the current request asked for a profile."""
+    trace = _current_trace.get()
+    if trace is None or not trace.profile:
+        return func(*args, **kwargs)
+
+    if Profiler is not None:
+        profiler = Profiler(async_mode="disabled")
+        profiler.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.stop()
+            trace.profiles.append(profiler.output_text(unicode=True, color=False))
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(PROFILE_FUNCTIONS)
+        trace.profiles.append(output.getvalue())
+
+
+def _mark_return(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(endpoint)
+    async def timed(*args: Any, **kwargs: Any) -> Any:
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.endpoint_returned = time.perf_counter()
+
+    return timed
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that notes when its (async) endpoint returns.
+
+    Everything between then and the start of the response, i.e. validating
+    and encoding the result, is recorded as the "serialize" phase.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        if asyncio.iscoroutinefunction(endpoint):
+            endpoint = _mark_return(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+class MetricsMiddleware:
+    """Time requests, collect their spans and attach requested profiles."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._route_paths: Optional[Dict[Any, str]] = None
+
+    def _route(self, scope: Scope) -> str:
+        # Label by route template, not the raw path, to bound cardinality
+        if self._route_paths is None:
+            self._route_paths = {
+                route.endpoint: route.path
+                for route in scope["app"].routes
+                if hasattr(route, "endpoint")
+            }
+        return self._route_paths.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        started = time.perf_counter()
+        status = 500
+        held: List[Message] = []
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trace.endpoint_returned is not None:
+                    serialize = Span("serialize")
+                    serialize.seconds = time.perf_counter() - trace.endpoint_returned
+                    _record(serialize)
+                MutableHeaders(scope=message).append("Server-Timing", trace.server_timing())
+                content_type = MutableHeaders(scope=message).get("content-type", "")
+                if trace.profile and content_type.startswith("application/json"):
+                    held.append(message)
+                    return
+            elif held:
+                held.append(message)
+                if not message.get("more_body", False):
+                    for profiled in _attach_profile(held, trace):
+                        await send(profiled)
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            REQUEST_SECONDS.labels(scope["method"], self._route(scope), str(status)).observe(
+                time.perf_counter() - started
+            )
+            _current_trace.reset(token)
+
+
+def _attach_profile(messages: List[Message], trace: RequestTrace) -> List[Message]:
+    """Add the trace's phases and profiles to a buffered JSON response."""
+    start, bodies = messages[0], messages[1:]
+    body = b"".join(message.get("body", b"") for message in bodies)
+    payload = json.loads(body) if body else None
+    if not isinstance(payload, dict):
+        return messages
+    payload["profile"] = {"phases": trace.phases(), "calls": trace.profiles}
+    body = json.dumps(payload).encode()
+    MutableHeaders(scope=start)["content-length"] = str(len(body))
+    return [start, {"type": "http.response.body", "body": body, "more_body": False}]
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    """Serve every registered metric in the Prometheus text format."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
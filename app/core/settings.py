@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings
 from typing import List
 import os
+import tempfile
 
 
 class Settings(BaseSettings):
@@ -19,6 +20,11 @@ class Settings(BaseSettings):
     # Redis Configuration
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
+    # Analytics response cache (Redis, or in-process LRU if Redis is down)
+    CACHE_ENABLED: bool = True
+    CACHE_TTL_SECONDS: int = 300
+    CACHE_MAX_ENTRIES: int = 1024
+
     # OAuth Settings
     GITHUB_CLIENT_ID: str = os.getenv("GITHUB_CLIENT_ID", "")
     GITHUB_CLIENT_SECRET: str = os.getenv("GITHUB_CLIENT_SECRET", "")
@@ -28,9 +34,57 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24  # 24 hours
     ALGORITHM: str = "HS256"
 
+    # Validated tokens and API keys are cached for up to this long (tokens
+    # never past their exp); AUTH_CACHE_MAX_ENTRIES bounds each cache
+    AUTH_CACHE_TTL_SECONDS: int = 300
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+
     # iMessage Database
     IMESSAGE_DB_PATH: str = os.path.expanduser("~/Library/Messages/chat.db")
     SYNC_INTERVAL_MINUTES: int = 15
+    # Mirror chat.db into DATABASE_URL from inside the API process
+    SYNC_ENABLED: bool = False
+    SYNC_BATCH_SIZE: int = 5000
+
+    # iMessage access mode: "snapshot" serves every request from shared
+    # snapshots that are re-copied only when chat.db changes; "readonly" opens
+    # chat.db in place through one shared read-only connection pool; "copy"
+    # restores the legacy behaviour of copying chat.db for every request.
+    IMESSAGE_ACCESS_MODE: str = os.getenv("IMESSAGE_ACCESS_MODE", "snapshot")
+    IMESSAGE_SNAPSHOT_DIR: str = os.getenv(
+        "IMESSAGE_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "msg-api"))
+    # Country calling code assumed for phone numbers given without one
+    DEFAULT_COUNTRY_CODE: str = "1"
+    # Persistent indexes derived from chat.db (word counts, ...)
+    IMESSAGE_SIDECAR_DIR: str = os.getenv(
+        "IMESSAGE_SIDECAR_DIR", os.path.expanduser("~/.msg-api"))
+    # Pages copied per SQLite backup step when refreshing a snapshot
+    IMESSAGE_BACKUP_PAGES_PER_STEP: int = 1024
+    # Add covering indexes and run ANALYZE on each new snapshot (adds index
+    # build time to every snapshot refresh, so off unless opted into)
+    IMESSAGE_PREPARE_SNAPSHOTS: bool = False
+    # Per-connection memory map and page cache for snapshot reads
+    IMESSAGE_MMAP_SIZE: int = 256 * 1024 * 1024
+    IMESSAGE_CACHE_SIZE_KB: int = 64 * 1024
+    # Open the source with SQLite's immutable=1 flag (only safe for a chat.db
+    # that is not being written to, e.g. an exported backup)
+    IMESSAGE_IMMUTABLE: bool = False
+    IMESSAGE_POOL_SIZE: int = 5
+    # Blocking iMessage queries run on a bounded thread pool; once
+    # MAX_WORKERS are busy and MAX_PENDING more are queued, requests get 503
+    IMESSAGE_MAX_WORKERS: int = 4
+    IMESSAGE_MAX_PENDING: int = 32
+    # Worker processes for CPU-bound analytics across all contacts (0 = one
+    # per CPU)
+    IMESSAGE_PROCESS_WORKERS: int = 0
+    # Words tracked per Space-Saving summary for approximate word counts;
+    # estimates exceed true counts by at most (total words / capacity)
+    WORD_SKETCH_CAPACITY: int = 1000
+    # Rows per Arrow record batch / Parquet row group when exporting
+    EXPORT_BATCH_SIZE: int = 50000
+
+    # Users (by email) allowed to profile analytics requests with ?profile=1
+    ADMIN_EMAILS: List[str] = []
 
     class Config:
         case_sensitive = True
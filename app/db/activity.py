@@ -0,0 +1,107 @@
+from datetime import datetime, timezone, tzinfo
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.db.dates import APPLE_EPOCH_OFFSET, NANOSECOND_THRESHOLD
+from app.db.errors import InvalidArgument
+
+BUCKET_SECONDS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+
+# Weeks start on Monday; 1970-01-05 was the first Monday after the Unix epoch
+_WEEK_ORIGIN = 4 * 86400
+
+# Finest step used to locate a UTC offset change inside a day
+_TRANSITION_STEP = 15 * 60
+
+
+def apple_to_unix_seconds(dates: np.ndarray) -> np.ndarray:
+    """Convert an array of message.date values to Unix seconds.
+
+    Handles the nanosecond and second encodings element-wise, like
+    apple_to_datetime() does for a single value.
+    """
+    dates = dates.astype(np.int64, copy=False)
+    seconds = np.where(dates > NANOSECOND_THRESHOLD, dates // 10 ** 9, dates)
+    return seconds + APPLE_EPOCH_OFFSET
+
+
+def _utc_offset(tz: tzinfo, seconds: int) -> int:
+    moment = datetime.fromtimestamp(seconds, timezone.utc).astimezone(tz)
+    return int(moment.utcoffset().total_seconds())
+
+
+def to_local_seconds(utc_seconds: np.ndarray, tz: tzinfo) -> np.ndarray:
+    """Shift Unix seconds to wall-clock seconds in tz.
+
+    The UTC offset is sampled once per day across the range and offset
+    changes (DST) are then pinned down to the quarter hour, so the cost
+    depends on the number of days spanned rather than on the number of
+    messages.
+    """
+    if len(utc_seconds) == 0:
+        return utc_seconds
+    start = int(utc_seconds.min()) // 86400 * 86400
+    end = int(utc_seconds.max()) + 86400
+
+    edges: List[int] = []
+    offsets = [_utc_offset(tz, start)]
+    for day in range(start + 86400, end + 1, 86400):
+        offset = _utc_offset(tz, day)
+        if offset == offsets[-1]:
+            continue
+        moment = day - 86400
+        while _utc_offset(tz, moment) == offsets[-1]:
+            moment += _TRANSITION_STEP
+        edges.append(moment)
+        offsets.append(offset)
+
+    index = np.searchsorted(np.array(edges, dtype=np.int64), utc_seconds, side="right")
+    return utc_seconds + np.array(offsets, dtype=np.int64)[index]
+
+
+def bin_activity(
+    dates: np.ndarray,
+    from_me: np.ndarray,
+    bucket: str = "day",
+    tz: tzinfo = timezone.utc,
+) -> Dict[str, Any]:
+    """Count sent and received messages per hour, day or week.
+
+    Args:
+        dates: message.date values
+        from_me: is_from_me flags, aligned with dates
+        bucket: "hour", "day" or "week" (weeks start on Monday)
+        tz: Time zone bucket boundaries are aligned to
+
+    Returns:
+        Dict with the start of every bucket between the first and last
+        message (ISO 8601, in tz) and aligned "sent" and "received" counts
+
+    Raises:
+        InvalidArgument: If the bucket is unknown
+    """
+    if bucket not in BUCKET_SECONDS:
+        raise InvalidArgument(f"Unknown bucket: {bucket}")
+    if len(dates) == 0:
+        return {"starts": [], "sent": [], "received": []}
+
+    width = BUCKET_SECONDS[bucket]
+    origin = _WEEK_ORIGIN if bucket == "week" else 0
+    local = to_local_seconds(apple_to_unix_seconds(dates), tz)
+    index = (local - origin) // width
+    first = int(index.min())
+    index -= first
+    size = int(index.max()) + 1
+
+    sent_mask = from_me.astype(bool)
+    sent = np.bincount(index[sent_mask], minlength=size)
+    received = np.bincount(index[~sent_mask], minlength=size)
+
+    starts = [
+        datetime.fromtimestamp(origin + (first + i) * width, timezone.utc)
+        .replace(tzinfo=tz)
+        .isoformat()
+        for i in range(size)
+    ]
+    return {"starts": starts, "sent": sent.tolist(), "received": received.tolist()}
@@ -0,0 +1,181 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db.raw import fetch_batches, raw_connection
+from app.db.sidecar import SidecarDB
+from app.models.imessage import Message
+
+_NSSTRING = b"NSString"
+# How far past the class name the '+' introducing the string data may be
+_MAX_PREAMBLE = 16
+# ROWIDs per IN (...) query, below SQLite's default parameter limit
+_LOOKUP_CHUNK = 500
+
+# SQL condition for messages with either a text or an attributedBody
+HAS_TEXT = "(text IS NOT NULL OR attributedBody IS NOT NULL)"
+
+# New messages whose only text is in their attributedBody
+_UNDECODED_SQL = (
+    "SELECT ROWID, attributedBody FROM message "
+    "WHERE ROWID > ? AND ROWID <= ? AND text IS NULL AND attributedBody IS NOT NULL"
+)
+
+
+def decode_attributed_body(blob: Optional[bytes]) -> Optional[str]:
+    """Extract the plain text from a message.attributedBody blob.
+
+    attributedBody is an NSAttributedString serialized with NSArchiver's
+    typedstream format. Only the first NSString is needed, so instead of
+    parsing the whole archive this finds the class name and reads the
+    length-prefixed UTF-8 bytes that follow it, without copying the blob.
+
+    Returns:
+        The message text, or None if the blob holds no string
+    """
+    if not blob:
+        return None
+    data = memoryview(blob)
+    start = blob.find(_NSSTRING)
+    if start < 0:
+        return None
+    plus = blob.find(b"+", start + len(_NSSTRING), start + len(_NSSTRING) + _MAX_PREAMBLE)
+    if plus < 0:
+        return None
+
+    # Lengths below 0x80 fit in one byte; 0x81 and 0x82 introduce a
+    # little-endian 16- or 32-bit length
+    position = plus + 1
+    if position >= len(data):
+        return None
+    marker = data[position]
+    if marker == 0x81:
+        length = int.from_bytes(data[position + 1:position + 3], "little")
+        position += 3
+    elif marker == 0x82:
+        length = int.from_bytes(data[position + 1:position + 5], "little")
+        position += 5
+    else:
+        length = marker
+        position += 1
+    return bytes(data[position:position + length]).decode("utf-8", errors="replace")
+
+
+def message_text(text: Optional[str], attributed_body: Optional[bytes]) -> Optional[str]:
+    """Return message.text, falling back to the decoded attributedBody."""
+    return text if text is not None else decode_attributed_body(attributed_body)
+
+
+class DecodedTextCache:
+    """Text decoded from attributedBody, stored in the sidecar by ROWID.
+
+    On recent macOS versions most messages have a NULL message.text and only
+    an attributedBody. Each one is decoded once, when it is first seen above
+    the ROWID high-water mark, and the sidecar indexes read the cached text
+    from here.
+    """
+
+    NAME = "decoded_text"
+
+    def __init__(self, sidecar: SidecarDB, batch_size: int = 5000):
+        """Initialize the cache, creating its table if needed.
+
+        Args:
+            sidecar: Sidecar database the decoded texts are stored in
+            batch_size: Messages decoded per write to the sidecar
+        """
+        self.sidecar = sidecar
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        with sidecar.connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS decoded_text ("
+                "rowid INTEGER PRIMARY KEY, "
+                "text TEXT NOT NULL)"
+            )
+
+    def update(self, session: Session, blocking: bool = True) -> int:
+        """Decode every new message that has an attributedBody but no text.
+
+        Args:
+            session: Session on the iMessage database to read new messages from
+            blocking: Wait for an update running elsewhere; if False, raise
+                SidecarBusy instead
+
+        Returns:
+            Number of messages decoded
+        """
+        with self.sidecar.write(self._lock, blocking) as conn:
+            last_rowid = self.sidecar.get_high_water(conn, self.NAME)
+            max_rowid = session.query(func.max(Message.id)).scalar() or 0
+            if max_rowid < last_rowid:
+                # The source database was replaced; start over
+                conn.execute("DELETE FROM decoded_text")
+                last_rowid = 0
+            if max_rowid == last_rowid:
+                return 0
+
+            batches = fetch_batches(
+                raw_connection(session), _UNDECODED_SQL, (last_rowid, max_rowid), self.batch_size
+            )
+            decoded = 0
+            for rows in batches:
+                texts = [(rowid, decode_attributed_body(body)) for rowid, body in rows]
+                conn.executemany(
+                    "INSERT OR REPLACE INTO decoded_text (rowid, text) VALUES (?, ?)",
+                    [(rowid, text) for rowid, text in texts if text is not None]
+                )
+                decoded += len(rows)
+
+            self.sidecar.set_high_water(conn, self.NAME, max_rowid)
+            return decoded
+
+    def lookup(self, rowids: Iterable[int]) -> Dict[int, str]:
+        """Return the decoded text of each given ROWID that has one."""
+        rowids = sorted(rowids)
+        if not rowids:
+            return {}
+        with self.sidecar.connect() as conn:
+            if rowids[-1] - rowids[0] < 2 * len(rowids):
+                # Dense, as in an index build: one range scan
+                return dict(conn.execute(
+                    "SELECT rowid, text FROM decoded_text WHERE rowid BETWEEN ? AND ?",
+                    (rowids[0], rowids[-1])
+                ))
+            # Sparse, e.g. one conversation's messages: probe each ROWID
+            found = {}
+            for start in range(0, len(rowids), _LOOKUP_CHUNK):
+                chunk = rowids[start:start + _LOOKUP_CHUNK]
+                found.update(conn.execute(
+                    "SELECT rowid, text FROM decoded_text WHERE rowid IN "
+                    f"({', '.join('?' * len(chunk))})",
+                    chunk
+                ))
+            return found
+
+    def fill(self, rows: Sequence[Sequence], rowid_index: int = 0, text_index: int = 1) -> List[tuple]:
+        """Replace NULL texts in a batch of rows with their decoded text.
+
+        Rows whose text stays NULL (no attributedBody, or nothing to decode)
+        are dropped.
+
+        Args:
+            rows: Rows containing a message ROWID and text
+            rowid_index: Position of the ROWID in each row
+            text_index: Position of the text in each row
+        """
+        missing = [row[rowid_index] for row in rows if row[text_index] is None]
+        decoded = self.lookup(missing) if missing else {}
+        filled = []
+        for row in rows:
+            text = row[text_index]
+            if text is None:
+                text = decoded.get(row[rowid_index])
+                if text is None:
+                    continue
+                row = tuple(row[:text_index]) + (text,) + tuple(row[text_index + 1:])
+            filled.append(tuple(row))
+        return filled
+
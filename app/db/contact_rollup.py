@@ -0,0 +1,251 @@
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db.attributed_body import DecodedTextCache
+from app.db.dates import apple_to_unix_micros
+from app.db.errors import InvalidArgument
+from app.db.handles import HandleMap
+from app.db.raw import fetch_batches, raw_connection
+from app.db.sidecar import SidecarDB
+from app.models.imessage import Message
+
+# Leaderboard sort keys and the rollup expression each one orders by.
+# Messages per day are spread over at least one day, so a contact with a
+# single burst of messages does not top the ranking.
+LEADERBOARD_SORTS = {
+    "messages": "messages",
+    "sent": "sent",
+    "received": "received",
+    "first_message": "first_date",
+    "last_message": "last_date",
+    "messages_per_day": "messages * 86400.0 / MAX(COALESCE(last_date - first_date, 0), 86400)",
+    "average_length": "CAST(text_length AS REAL) / NULLIF(text_messages, 0)",
+}
+
+# Columns of a rollup row, in table order
+ROLLUP_COLUMNS = (
+    "contact_id", "messages", "sent", "received",
+    "first_date", "last_date", "text_length", "text_messages",
+)
+
+# New messages exchanged with a handle, for the incremental update
+_ROLLUP_SCAN_SQL = (
+    "SELECT ROWID, text, handle_id, date, COALESCE(is_from_me, 0) FROM message "
+    "WHERE ROWID > ? AND ROWID <= ? AND handle_id != 0 ORDER BY ROWID"
+)
+
+# Every message exchanged with a handle, for ranking without a sidecar
+CONTACT_MESSAGES_SQL = (
+    "SELECT text, attributedBody, handle_id, date, COALESCE(is_from_me, 0) FROM message "
+    "WHERE handle_id != 0"
+)
+
+
+def summarize_messages(
+    rows: Iterable[Sequence[Any]],
+    contacts: Dict[int, str],
+    totals: Optional[Dict[str, List[int]]] = None,
+) -> Dict[str, List[int]]:
+    """Fold messages into per-contact totals.
+
+    Args:
+        rows: (text, handle_id, date, is_from_me) of each message, with
+            attributedBody texts already decoded
+        contacts: Normalized contact_id of each handle ROWID; messages of
+            other handles are skipped
+        totals: Totals to add to (default: new)
+
+    Returns:
+        Normalized contact_id to [messages, sent, received, first_date,
+        last_date, text_length, text_messages], dates in Unix seconds
+    """
+    totals = {} if totals is None else totals
+    for text, handle_id, date, is_from_me in rows:
+        contact_id = contacts.get(handle_id)
+        if contact_id is None:
+            continue
+        row = totals.get(contact_id)
+        if row is None:
+            row = totals[contact_id] = [0, 0, 0, None, None, 0, 0]
+        row[0] += 1
+        row[1 if is_from_me else 2] += 1
+        if date is not None:
+            seconds = apple_to_unix_micros(date) // 10 ** 6
+            row[3] = seconds if row[3] is None else min(row[3], seconds)
+            row[4] = seconds if row[4] is None else max(row[4], seconds)
+        if text is not None:
+            row[5] += len(text)
+            row[6] += 1
+    return totals
+
+
+def leaderboard_entry(row: Sequence[Any]) -> Dict[str, Any]:
+    """Turn a rollup row (see ROLLUP_COLUMNS) into a leaderboard entry."""
+    contact_id, messages, sent, received, first, last, text_length, text_messages = row
+    span = max(last - first, 86400) if first is not None else 86400
+    return {
+        "contact_id": contact_id,
+        "messages": messages,
+        "sent": sent,
+        "received": received,
+        "first_message": _isoformat(first),
+        "last_message": _isoformat(last),
+        "messages_per_day": messages * 86400 / span,
+        "average_length": text_length / text_messages if text_messages else None,
+    }
+
+
+def rank_contacts(totals: Dict[str, List[int]], sort: str, limit: int) -> List[Dict[str, Any]]:
+    """Rank per-contact totals the way ContactRollup.top() does, in memory."""
+    if sort not in LEADERBOARD_SORTS:
+        raise InvalidArgument(f"Unknown sort key: {sort}")
+    entries = [leaderboard_entry((contact_id, *row)) for contact_id, row in totals.items()]
+    entries.sort(key=lambda entry: entry["contact_id"])
+    # Stable sort: ties stay ordered by contact_id, as in the SQL ORDER BY
+    entries.sort(key=lambda entry: _sort_value(entry[sort]), reverse=True)
+    return entries[:limit]
+
+
+def _sort_value(value: Any) -> Tuple[bool, Any]:
+    # SQLite orders NULL below everything, i.e. last when descending
+    return (value is not None, value)
+
+
+def _isoformat(seconds: Optional[int]) -> Optional[str]:
+    if seconds is None:
+        return None
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+class ContactRollup:
+    """Per-contact message totals stored in the sidecar database.
+
+    Each contact (handles merged by normalized contact_id) has one row of
+    totals, brought up to date from the messages above the ROWID high-water
+    mark. Ranking every contact is then one ORDER BY ... LIMIT n over the
+    rollup instead of a scan per contact.
+    """
+
+    NAME = "contact_rollup"
+
+    def __init__(
+        self,
+        sidecar: SidecarDB,
+        batch_size: int = 5000,
+        decoded: Optional[DecodedTextCache] = None,
+    ):
+        """Initialize the rollup, creating its table if needed.
+
+        Args:
+            sidecar: Sidecar database the rollup is stored in
+            batch_size: Messages folded in between writes to the sidecar
+            decoded: Cache of attributedBody texts (default: one in the sidecar)
+        """
+        self.sidecar = sidecar
+        self.batch_size = batch_size
+        self.decoded = decoded or DecodedTextCache(sidecar, batch_size)
+        self._lock = threading.Lock()
+        with sidecar.connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS contact_rollup ("
+                "contact_id TEXT PRIMARY KEY, "
+                "messages INTEGER NOT NULL, "
+                "sent INTEGER NOT NULL, "
+                "received INTEGER NOT NULL, "
+                "first_date INTEGER, "
+                "last_date INTEGER, "
+                "text_length INTEGER NOT NULL, "
+                "text_messages INTEGER NOT NULL) WITHOUT ROWID"
+            )
+            for column in ("messages", "sent", "received", "last_date"):
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_contact_rollup_{column} "
+                    f"ON contact_rollup ({column} DESC, contact_id)"
+                )
+
+    def update(self, session: Session, handle_map: HandleMap, blocking: bool = True) -> int:
+        """Fold every message added since the last update into the rollup.
+
+        Args:
+            session: Session on the iMessage database to read new messages from
+            handle_map: Contacts of the database version being read
+            blocking: Wait for an update running elsewhere; if False, raise
+                SidecarBusy instead
+
+        Returns:
+            Number of messages read
+        """
+        self.decoded.update(session, blocking)
+        with self.sidecar.write(self._lock, blocking) as conn:
+            last_rowid = self.sidecar.get_high_water(conn, self.NAME)
+            max_rowid = session.query(func.max(Message.id)).scalar() or 0
+            if max_rowid < last_rowid:
+                # The source database was replaced; start over
+                conn.execute("DELETE FROM contact_rollup")
+                last_rowid = 0
+            if max_rowid == last_rowid:
+                return 0
+
+            contacts = handle_map.contacts_by_handle()
+            batches = fetch_batches(
+                raw_connection(session), _ROLLUP_SCAN_SQL, (last_rowid, max_rowid), self.batch_size
+            )
+            read = 0
+            for rows in batches:
+                missing = [rowid for rowid, text, *_ in rows if text is None]
+                decoded = self.decoded.lookup(missing) if missing else {}
+                self._flush(conn, summarize_messages(
+                    (
+                        (decoded.get(rowid) if text is None else text, handle_id, date, is_from_me)
+                        for rowid, text, handle_id, date, is_from_me in rows
+                    ),
+                    contacts
+                ))
+                read += len(rows)
+
+            self.sidecar.set_high_water(conn, self.NAME, max_rowid)
+            return read
+
+    def _flush(self, conn, totals: Dict[str, List[int]]) -> None:
+        conn.executemany(
+            "INSERT INTO contact_rollup VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(contact_id) DO UPDATE SET "
+            "messages = messages + excluded.messages, "
+            "sent = sent + excluded.sent, "
+            "received = received + excluded.received, "
+            "first_date = MIN(COALESCE(first_date, excluded.first_date), "
+            "COALESCE(excluded.first_date, first_date)), "
+            "last_date = MAX(COALESCE(last_date, excluded.last_date), "
+            "COALESCE(excluded.last_date, last_date)), "
+            "text_length = text_length + excluded.text_length, "
+            "text_messages = text_messages + excluded.text_messages",
+            ((contact_id, *row) for contact_id, row in totals.items())
+        )
+
+    def top(self, sort: str = "messages", limit: int = 50) -> List[Dict[str, Any]]:
+        """Return the contacts ranked highest by a sort key.
+
+        Args:
+            sort: One of LEADERBOARD_SORTS
+            limit: Number of contacts to return
+
+        Returns:
+            Leaderboard entries, highest first
+
+        Raises:
+            InvalidArgument: If the sort key is unknown
+        """
+        if sort not in LEADERBOARD_SORTS:
+            raise InvalidArgument(f"Unknown sort key: {sort}")
+        with self.sidecar.connect() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(ROLLUP_COLUMNS)} FROM contact_rollup "
+                f"ORDER BY {LEADERBOARD_SORTS[sort]} DESC, contact_id LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [leaderboard_entry(row) for row in rows]
+
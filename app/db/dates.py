@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+# message.date counts from 2001-01-01 UTC ("Apple epoch"), not 1970
+APPLE_EPOCH = datetime(2001, 1, 1, tzinfo=timezone.utc)
+
+# Since macOS High Sierra dates are stored in nanoseconds rather than
+# seconds; anything this large cannot be a plausible count of seconds
+NANOSECOND_THRESHOLD = 10 ** 11
+
+# Seconds from the Unix epoch to the Apple epoch
+APPLE_EPOCH_OFFSET = 978307200
+
+
+def apple_to_datetime(value: Optional[int]) -> Optional[datetime]:
+    """Convert a message.date value to a timezone-aware UTC datetime."""
+    if value is None:
+        return None
+    if value > NANOSECOND_THRESHOLD:
+        return APPLE_EPOCH + timedelta(microseconds=value // 1000)
+    return APPLE_EPOCH + timedelta(seconds=value)
+
+
+def apple_to_unix_micros(value: Optional[int]) -> Optional[int]:
+    """Convert a message.date value to microseconds since the Unix epoch.
+
+    Cheaper than apple_to_datetime() when the result feeds a columnar
+    timestamp array rather than Python code.
+    """
+    if value is None:
+        return None
+    if value > NANOSECOND_THRESHOLD:
+        return value // 1000 + APPLE_EPOCH_OFFSET * 10 ** 6
+    return (value + APPLE_EPOCH_OFFSET) * 10 ** 6
+
+
+def datetime_to_apple(value: datetime, nanoseconds: bool = True) -> int:
+    """Convert a datetime to a message.date value.
+
+    Naive datetimes are assumed to be UTC.
+
+    Args:
+        value: Datetime to convert
+        nanoseconds: Produce nanoseconds (modern chat.db) instead of seconds
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value - APPLE_EPOCH
+    seconds = delta.days * 86400 + delta.seconds
+    if not nanoseconds:
+        return seconds
+    return seconds * 10 ** 9 + delta.microseconds * 1000
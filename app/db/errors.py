@@ -0,0 +1,7 @@
+class InvalidArgument(ValueError):
+    """Raised when a query is given an argument it cannot accept.
+
+    A ValueError, so existing callers keep working, but a distinct type so
+    the API can answer 400 for bad arguments without also reporting
+    internal ValueErrors as client errors.
+    """
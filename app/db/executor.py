@@ -0,0 +1,129 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class IMessageDBBusy(Exception):
+    """Raised when the iMessage worker pool has no room for another call."""
+
+
+class BoundedExecutor:
+    """Thread pool for blocking iMessage work with backpressure.
+
+    At most max_workers calls run at once and at most max_pending more wait
+    in the queue. Anything beyond that is rejected immediately with
+    IMessageDBBusy instead of queueing without bound.
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 32):
+        """Initialize the pool.
+
+        Args:
+            max_workers: Number of worker threads
+            max_pending: Number of calls allowed to wait for a free worker
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="imessage"
+        )
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run func(*args, **kwargs) on the pool and await its result.
+
+        The call sees the caller's context variables, e.g. the trace of the
+        request it serves.
+
+        Raises:
+            IMessageDBBusy: If every worker is busy and the queue is full
+        """
+        if not self._slots.acquire(blocking=False):
+            raise IMessageDBBusy("iMessage worker pool is saturated")
+        try:
+            return await self._submit(func, *args, **kwargs)
+        finally:
+            self._slots.release()
+
+    def reserve(self) -> "Reservation":
+        """Take one slot for a series of calls, e.g. those feeding a stream.
+
+        The calls made through the reservation never raise IMessageDBBusy,
+        so a streamed response cannot be cut short once it has started.
+
+        Raises:
+            IMessageDBBusy: If every worker is busy and the queue is full
+        """
+        if not self._slots.acquire(blocking=False):
+            raise IMessageDBBusy("iMessage worker pool is saturated")
+        return Reservation(self)
+
+    async def _submit(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(context.run, func, *args, **kwargs)
+        )
+
+    def shutdown(self) -> None:
+        """Wait for running calls to finish and stop the worker threads."""
+        self._executor.shutdown(wait=True)
+
+
+class Reservation:
+    """A BoundedExecutor slot held across calls; see BoundedExecutor.reserve()."""
+
+    def __init__(self, pool: BoundedExecutor):
+        self.pool = pool
+        self._released = False
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run func(*args, **kwargs) on the pool in the reserved slot."""
+        return await self.pool._submit(func, *args, **kwargs)
+
+    def release(self) -> None:
+        """Give the slot back; later calls are harmless no-ops."""
+        if not self._released:
+            self._released = True
+            self.pool._slots.release()
+
+
+# CPU-bound analytics (tokenizing, NumPy passes over every contact) fan out
+# to worker processes, since threads would serialize on the GIL
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_lock = threading.Lock()
+
+
+def get_process_pool(max_workers: int = 0) -> ProcessPoolExecutor:
+    """Return the process-wide pool for CPU-bound work, starting it if needed.
+
+    Workers are spawned rather than forked, so they never inherit the
+    server's threads, locks or open SQLite handles.
+
+    Args:
+        max_workers: Worker processes when the pool is first created
+            (0 means one per CPU)
+    """
+    global _process_pool
+    with _process_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=max_workers or os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    """Stop the process pool, if it was started."""
+    global _process_pool
+    with _process_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=True)
+            _process_pool = None
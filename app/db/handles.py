@@ -0,0 +1,90 @@
+import re
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.imessage import Handle
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_contact_id(contact_id: str, default_country_code: str = "1") -> str:
+    """Normalize a phone number or email so equivalent forms compare equal.
+
+    Emails are lowercased. Phone numbers are converted to E.164, assuming
+    default_country_code for numbers written without one. Short codes and
+    anything else without enough digits are returned with only the
+    formatting stripped.
+
+    Args:
+        contact_id: Phone number or email as typed or stored in handle.id
+        default_country_code: Country calling code for national numbers
+
+    Returns:
+        Normalized contact identifier
+    """
+    value = contact_id.strip()
+    if "@" in value:
+        return value.lower()
+
+    digits = _NON_DIGITS.sub("", value)
+    if len(digits) < 7:
+        return digits or value
+    if value.startswith("+"):
+        return "+" + digits
+    if value.startswith("00"):
+        return "+" + digits[2:]
+    if digits.startswith(default_country_code) and len(digits) > 10:
+        return "+" + digits
+    return "+" + default_country_code + digits.lstrip("0")
+
+
+class HandleMap:
+    """In-memory map of normalized contact_id to every matching handle ROWID.
+
+    One person usually has several handle rows, e.g. one per service
+    (iMessage and SMS) or per formatting of the same number. The map is
+    built once per database version so lookups are O(1) dict hits instead
+    of unindexed scans of handle.id.
+    """
+
+    def __init__(self, version: str, handles: Dict[str, List[int]], default_country_code: str = "1"):
+        """Wrap a prebuilt mapping.
+
+        Args:
+            version: Database version the map was built from
+            handles: Normalized contact_id to handle ROWIDs
+            default_country_code: Country calling code used for lookups
+        """
+        self.version = version
+        self.default_country_code = default_country_code
+        self._handles = handles
+
+    @classmethod
+    def load(cls, session: Session, version: str, default_country_code: str = "1") -> "HandleMap":
+        """Build the map from every row of the handle table."""
+        handles: Dict[str, List[int]] = defaultdict(list)
+        for rowid, contact_id in session.query(Handle.id, Handle.contact_id):
+            if contact_id:
+                handles[normalize_contact_id(contact_id, default_country_code)].append(rowid)
+        return cls(version, dict(handles), default_country_code)
+
+    def resolve(self, contact_id: str) -> List[int]:
+        """Return the handle ROWIDs for a contact, or an empty list."""
+        return self._handles.get(normalize_contact_id(contact_id, self.default_country_code), [])
+
+    def items(self) -> List[Tuple[str, List[int]]]:
+        """Return every (normalized contact_id, handle ROWIDs) pair."""
+        return list(self._handles.items())
+
+    def contacts_by_handle(self) -> Dict[int, str]:
+        """Return the normalized contact_id of every handle ROWID."""
+        return {
+            handle_id: contact_id
+            for contact_id, handle_ids in self._handles.items()
+            for handle_id in handle_ids
+        }
+
+    def __len__(self) -> int:
+        return len(self._handles)
@@ -1,47 +1,295 @@
 import os
 import shutil
 import sqlite3
-import re
-from typing import Dict, List, Optional, Tuple
+import tempfile
+import threading
 from collections import Counter
-from sqlalchemy import create_engine
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+from sqlalchemy import create_engine, func, select
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.sql import text
-from pathlib import Path
+from sqlalchemy.pool import QueuePool
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+
+from app.core.metrics import run_profiled, span, timed_iter
+from app.core.settings import settings
+from app.db.activity import bin_activity
+from app.db.attributed_body import DecodedTextCache, message_text
+from app.db.contact_rollup import (
+    CONTACT_MESSAGES_SQL,
+    LEADERBOARD_SORTS,
+    ContactRollup,
+    rank_contacts,
+    summarize_messages,
+)
+from app.db.dates import NANOSECOND_THRESHOLD, apple_to_datetime, datetime_to_apple
+from app.db.errors import InvalidArgument
+from app.db.executor import BoundedExecutor, get_process_pool, shutdown_process_pool
+from app.db.pagination import decode_cursor, decode_rank_cursor, encode_cursor, encode_rank_cursor
+from app.db.raw import fetch_all, fetch_batches, fetch_one, placeholders, raw_connection
+from app.db.replies import HANDLE_DATES_SQL, contacts_response_times, response_times
+from app.db.search_index import SearchIndex, SearchUnavailable, match_query
+from app.db.sidecar import SidecarBusy, SidecarDB, sidecar_path_for
+from app.db.handles import HandleMap
+from app.db.snapshot import SnapshotManager, signature_version, source_signature
+from app.db.word_sketch import SpaceSaving, WordSketchIndex, sketch_words_in_range
+from app.db.word_index import (
+    WordIndex,
+    count_words,
+    count_words_in_range,
+    rowid_partitions,
+    tokenize,
+    top_n,
+)
+from app.models.imessage import Base, Message
+
+# Global top words kept per database version, so any limit up to this is
+# answered without recounting
+GLOBAL_TOP_WORDS = 1000
+
+# Message columns that can be requested from the message listing, by name
+MESSAGE_FIELDS = {
+    "id": Message.id,
+    "guid": Message.guid,
+    "text": Message.text,
+    "handle_id": Message.handle_id,
+    "date": Message.date,
+    "date_read": Message.date_read,
+    "date_delivered": Message.date_delivered,
+    "is_from_me": Message.is_from_me,
+    "is_read": Message.is_read,
+    "is_delivered": Message.is_delivered,
+}
+DEFAULT_MESSAGE_FIELDS = ("id", "date", "is_from_me", "text")
+_DATE_FIELDS = {"date", "date_read", "date_delivered"}
+
+# Analytics queries, run on the raw sqlite3 connection (see app.db.raw).
+# Those with "{}" are formatted with one placeholder per handle.
+_HAS_TEXT = "(m.text IS NOT NULL OR m.attributedBody IS NOT NULL)"
+_COUNTS_BY_HANDLE_SQL = (
+    "SELECT handle_id, SUM(is_from_me = 1), SUM(is_from_me = 0) FROM message "
+    "WHERE handle_id IN ({}) GROUP BY handle_id"
+)
+_HANDLE_TEXTS_SQL = (
+    "SELECT m.ROWID, m.text, m.attributedBody FROM message m "
+    f"WHERE m.handle_id IN ({{}}) AND {_HAS_TEXT}"
+)
+_HANDLE_DATES_UNORDERED_SQL = (
+    "SELECT date, COALESCE(is_from_me, 0) FROM message "
+    "WHERE handle_id IN ({}) AND date IS NOT NULL"
+)
+_CHAT_MESSAGES = "FROM chat_message_join j JOIN message m ON m.ROWID = j.message_id WHERE j.chat_id = ?"
+_CHAT_COUNTS_SQL = f"SELECT SUM(m.is_from_me = 1), SUM(m.is_from_me = 0) {_CHAT_MESSAGES}"
+_CHAT_TEXTS_SQL = f"SELECT m.ROWID, m.text, m.attributedBody {_CHAT_MESSAGES} AND {_HAS_TEXT}"
+_CHAT_SENDERS_SQL = (
+    f"SELECT m.handle_id, COUNT(*) {_CHAT_MESSAGES} "
+    "AND m.is_from_me = 0 AND m.handle_id != 0 GROUP BY m.handle_id"
+)
+_CHAT_MEMBERS_SQL = "SELECT handle_id FROM chat_handle_join WHERE chat_id = ?"
+_HANDLES_SQL = "SELECT ROWID, id, service FROM handle WHERE ROWID IN ({})"
 
-from app.models.imessage import Base, Message, Handle, Chat
 
 class IMessageDB:
-    def __init__(self, db_path: Optional[str] = None):
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        mode: str = "copy",
+        immutable: bool = False,
+        pool_size: int = 5,
+        snapshot_dir: Optional[str] = None,
+        sidecar_dir: Optional[str] = None,
+        batch_size: int = 5000,
+    ):
         """Initialize iMessage database connection.
         
         Args:
             db_path: Path to iMessage database. If None, uses default location.
+            mode: How the source database is accessed:
+                "copy" - take a private copy on connect and delete it on close
+                "readonly" - open the source in place through SQLite's
+                read-only URI mode and share a connection pool
+                "snapshot" - serve from reference-counted snapshots that are
+                only re-copied when the source changes
+            immutable: In readonly mode, also pass immutable=1 so SQLite skips
+                locking entirely. Only safe if nothing writes to the source.
+            pool_size: Number of pooled connections kept open in readonly mode.
+            snapshot_dir: Directory for snapshot files in snapshot mode.
+            sidecar_dir: Directory for the persistent sidecar database holding
+                precomputed indexes. If None, no indexes are kept and every
+                query scans the message table.
+            batch_size: Rows fetched per round trip when streaming messages.
         """
-        self.original_db_path = db_path or os.path.expanduser("~/Library/Messages/chat.db")
-        self.temp_db_path = "/tmp/chat_temp.db"
+        if mode not in ("copy", "readonly", "snapshot"):
+            raise ValueError(f"Unknown iMessage access mode: {mode}")
+        self.original_db_path = db_path or settings.IMESSAGE_DB_PATH
+        self.mode = mode
+        self.immutable = immutable
+        self.pool_size = pool_size
+        self.snapshot_dir = snapshot_dir
+        self.sidecar_dir = sidecar_dir
+        self.batch_size = batch_size
+        self.sidecar: Optional[SidecarDB] = None
+        self.decoded_text: Optional[DecodedTextCache] = None
+        self.word_index: Optional[WordIndex] = None
+        self.word_sketch: Optional[WordSketchIndex] = None
+        self.search_index: Optional[SearchIndex] = None
+        self.contact_rollup: Optional[ContactRollup] = None
+        self.temp_db_path = None
+        self.copy_version: Optional[str] = None
+        self.snapshots: Optional[SnapshotManager] = None
+        self._handle_map: Optional[HandleMap] = None
+        self._handle_lock = threading.Lock()
+        # (version, number of words kept, top words) of the last global count
+        self._global_words: Optional[Tuple[str, int, List[Tuple[str, int]]]] = None
+        self._global_words_lock = threading.Lock()
         self.engine = None
         self.SessionLocal = None
 
     def connect(self) -> None:
-        """Create a safe copy of the database and establish connection."""
+        """Establish the connection.
+
+        In copy mode a safe copy of the database is made first; readonly mode
+        opens the source in place; snapshot mode takes the first snapshot.
+        """
         if not os.path.exists(self.original_db_path):
             raise FileNotFoundError(f"iMessage database not found at {self.original_db_path}")
         
-        # Create a copy of the database to avoid locking the original
-        shutil.copy2(self.original_db_path, self.temp_db_path)
+        if self.sidecar_dir:
+            self.sidecar = SidecarDB(sidecar_path_for(self.original_db_path, self.sidecar_dir))
+            self.decoded_text = DecodedTextCache(self.sidecar, self.batch_size)
+            self.word_index = WordIndex(self.sidecar, decoded=self.decoded_text)
+            self.word_sketch = WordSketchIndex(
+                self.sidecar, settings.WORD_SKETCH_CAPACITY, self.batch_size, self.decoded_text
+            )
+            self.search_index = SearchIndex(self.sidecar, self.batch_size, self.decoded_text)
+            self.contact_rollup = ContactRollup(self.sidecar, self.batch_size, self.decoded_text)
+
+        if self.mode == "snapshot":
+            self.snapshots = SnapshotManager(
+                self.original_db_path,
+                self.snapshot_dir,
+                pages_per_step=settings.IMESSAGE_BACKUP_PAGES_PER_STEP,
+                prepare=settings.IMESSAGE_PREPARE_SNAPSHOTS,
+                pragmas={
+                    "mmap_size": settings.IMESSAGE_MMAP_SIZE,
+                    # Negative cache_size is in KiB rather than pages
+                    "cache_size": -settings.IMESSAGE_CACHE_SIZE_KB,
+                },
+            )
+            # Take the first snapshot eagerly so startup fails fast
+            with self.snapshots.lease():
+                pass
+            return
+
+        if self.mode == "readonly":
+            self.engine = self._create_read_only_engine()
+        else:
+            # Create a uniquely named copy of the database to avoid locking
+            # the original or clobbering another request's copy
+            fd, self.temp_db_path = tempfile.mkstemp(prefix="chat_temp_", suffix=".db")
+            os.close(fd)
+            self.copy_version = signature_version(source_signature(self.original_db_path))
+            with span("snapshot_copy") as copy:
+                shutil.copy2(self.original_db_path, self.temp_db_path)
+                copy.bytes = os.path.getsize(self.temp_db_path)
+            self.engine = create_engine(f"sqlite:///{self.temp_db_path}")
         
-        # Create SQLAlchemy engine and session
-        self.engine = create_engine(f"sqlite:///{self.temp_db_path}")
         self.SessionLocal = sessionmaker(bind=self.engine)
 
+    def _create_read_only_engine(self):
+        """Create a pooled engine over the source opened with mode=ro."""
+        uri = f"file:{quote(os.path.abspath(self.original_db_path))}?mode=ro"
+        if self.immutable:
+            uri += "&immutable=1"
+
+        def creator():
+            return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+        return create_engine(
+            "sqlite://",
+            creator=creator,
+            poolclass=QueuePool,
+            pool_size=self.pool_size,
+            max_overflow=0,
+        )
+
     def close(self) -> None:
         """Close connection and clean up temporary database."""
+        if self.snapshots:
+            self.snapshots.close()
+            self.snapshots = None
         if self.engine:
             self.engine.dispose()
-        if os.path.exists(self.temp_db_path):
+            self.engine = None
+        if self.temp_db_path and os.path.exists(self.temp_db_path):
             os.remove(self.temp_db_path)
 
+    @contextmanager
+    def session(self) -> Iterator[Session]:
+        """Open an ORM session for one unit of work.
+
+        In snapshot mode the current snapshot is held for the lifetime of the
+        session so a concurrent refresh cannot delete it mid-query. The
+        version of the data the session reads is stored in
+        session.info["version"] and the file it reads from in
+        session.info["path"].
+        """
+        if self.snapshots is not None:
+            with self.snapshots.lease() as snapshot:
+                with snapshot.SessionLocal() as session:
+                    session.info["version"] = snapshot.version
+                    session.info["path"] = snapshot.path
+                    yield session
+        else:
+            with self.SessionLocal() as session:
+                session.info["version"] = self._unleased_version()
+                session.info["path"] = self.temp_db_path or self.original_db_path
+                yield session
+
+    def _unleased_version(self) -> str:
+        if self.mode == "copy":
+            return self.copy_version
+        return signature_version(source_signature(self.original_db_path))
+
+    def get_version(self) -> str:
+        """Return the version of the data currently being served.
+
+        Changes whenever chat.db (or its -wal file) changes, so it can be
+        used to key caches of anything derived from the database.
+        """
+        if self.snapshots is not None:
+            with self.snapshots.lease() as snapshot:
+                return snapshot.version
+        return self._unleased_version()
+
+    def _resolve_handles(self, session: Session, contact_id: str) -> List[int]:
+        """Return every handle ROWID belonging to a contact.
+
+        Uses a HandleMap built once per database version, so it is
+        rebuilt automatically when the snapshot refreshes.
+        """
+        with span("handle_lookup"):
+            return self._get_handle_map(session).resolve(contact_id)
+
+    def _get_handle_map(self, session: Session) -> HandleMap:
+        version = session.info["version"]
+        handle_map = self._handle_map
+        if handle_map is None or handle_map.version != version:
+            with self._handle_lock:
+                handle_map = self._handle_map
+                if handle_map is None or handle_map.version != version:
+                    handle_map = HandleMap.load(
+                        session, version, settings.DEFAULT_COUNTRY_CODE
+                    )
+                    self._handle_map = handle_map
+        return handle_map
+
     def get_message_count_by_contact(self, contact_id: str) -> Dict[str, int]:
         """Get total messages sent and received for a specific contact.
         
@@ -51,22 +299,43 @@ class IMessageDB:
         Returns:
             Dict containing sent and received message counts
         """
-        with self.SessionLocal() as session:
-            handle = session.query(Handle).filter(Handle.contact_id == contact_id).first()
-            if not handle:
-                return {"sent": 0, "received": 0}
-            
-            sent = session.query(Message).filter(
-                Message.handle_id == handle.id,
-                Message.is_from_me == 1
-            ).count()
-            
-            received = session.query(Message).filter(
-                Message.handle_id == handle.id,
-                Message.is_from_me == 0
-            ).count()
+        return self.get_message_counts_by_contacts([contact_id])[contact_id]
+
+    def get_message_counts_by_contacts(self, contact_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        """Get sent and received message counts for many contacts at once.
+        
+        Each contact is resolved to all of its handles (e.g. both its
+        iMessage and SMS handle) and the counts come from a single aggregate
+        query grouped by handle rather than one lookup and two COUNTs per
+        contact.
+        
+        Args:
+            contact_ids: Phone numbers or emails of the contacts
             
-            return {"sent": sent, "received": received}
+        Returns:
+            Dict mapping each contact_id to its sent and received counts.
+            Unknown contacts map to zero counts.
+        """
+        counts = {contact_id: {"sent": 0, "received": 0} for contact_id in contact_ids}
+        with self.session() as session:
+            owners: Dict[int, List[str]] = {}
+            for contact_id in counts:
+                for handle_id in self._resolve_handles(session, contact_id):
+                    owners.setdefault(handle_id, []).append(contact_id)
+
+            handle_ids = list(owners)
+            conn = raw_connection(session)
+            with span("query") as query:
+                # Stay well below SQLite's bound parameter limit
+                for start in range(0, len(handle_ids), 500):
+                    chunk = handle_ids[start:start + 500]
+                    rows = fetch_all(conn, _COUNTS_BY_HANDLE_SQL.format(placeholders(chunk)), chunk)
+                    for handle_id, sent, received in rows:
+                        query.rows += (sent or 0) + (received or 0)
+                        for contact_id in owners[handle_id]:
+                            counts[contact_id]["sent"] += sent or 0
+                            counts[contact_id]["received"] += received or 0
+        return counts
 
     def _tokenize_text(self, text: str) -> List[str]:
         """Convert text into a list of cleaned words.
@@ -77,44 +346,612 @@ class IMessageDB:
         Returns:
             List of cleaned words
         """
-        # Convert to lowercase and split on whitespace
-        text = text.lower()
-        
-        # Remove punctuation and split into words
-        words = re.findall(r'\b\w+\b', text)
-        
-        return words
+        return tokenize(text)
+
+    def refresh_indexes(self) -> int:
+        """Bring the sidecar indexes up to date with the database.
+
+        Returns:
+            Number of new messages indexed
+        """
+        if self.word_index is None:
+            return 0
+        with self.session() as session:
+            indexed = self.word_index.update(session)
+            self.word_sketch.update(session)
+            self.search_index.update(session)
+            self.contact_rollup.update(session, self._get_handle_map(session))
+            return indexed
+
+    def _try_update(self, index: Any, session: Session, *args: Any) -> bool:
+        """Bring a sidecar index up to date unless another update holds it.
+
+        Requests never wait for an update running elsewhere, e.g. the index
+        build at startup; they fall back to scanning chat.db instead.
+
+        Returns:
+            Whether the index exists and is up to date
+        """
+        if index is None:
+            return False
+        with span("index_update"):
+            try:
+                index.update(session, *args, blocking=False)
+            except SidecarBusy:
+                return False
+        return True
 
-    def get_word_frequency(self, contact_id: str, limit: int = 10) -> List[Tuple[str, int]]:
+    def get_word_frequency(
+        self,
+        contact_id: str,
+        limit: int = 10,
+        approximate: bool = False,
+    ) -> List[Tuple[str, int]]:
         """Get most common words used in conversations with a contact.
         
         Args:
             contact_id: Phone number or email of the contact
             limit: Number of top words to return
+            approximate: Estimate counts from a Space-Saving summary of
+                WORD_SKETCH_CAPACITY words; each count may be overestimated
+                by at most total words / capacity
             
         Returns:
             List of (word, frequency) tuples
         """
-        with self.SessionLocal() as session:
-            handle = session.query(Handle).filter(Handle.contact_id == contact_id).first()
-            if not handle:
+        with self.session() as session:
+            handle_ids = self._resolve_handles(session, contact_id)
+            if not handle_ids:
                 return []
             
-            # Get all messages for this contact
-            messages = session.query(Message.text).filter(
-                Message.handle_id == handle.id,
-                Message.text.isnot(None)  # Exclude null messages
-            ).all()
+            if approximate:
+                if self._try_update(self.word_sketch, session):
+                    with span("query"):
+                        return self.word_sketch.sketch(handle_ids).top(limit)
+                sketch = SpaceSaving(settings.WORD_SKETCH_CAPACITY)
+                texts = self._iter_texts(
+                    session, _HANDLE_TEXTS_SQL.format(placeholders(handle_ids)), handle_ids
+                )
+                with span("tokenize"):
+                    for batch in texts:
+                        sketch.update(word for text in batch for word in tokenize(text))
+                return sketch.top(limit)
             
-            # Combine all messages and count words
-            words = []
-            for msg in messages:
-                if msg.text:  # Additional null check
-                    words.extend(self._tokenize_text(msg.text))
+            if self._try_update(self.word_index, session):
+                with span("query"):
+                    return self.word_index.top_words(handle_ids, limit)
             
-            # Count frequencies and return top N
-            word_counts = Counter(words)
-            return word_counts.most_common(limit)
+            texts = self._iter_texts(
+                session, _HANDLE_TEXTS_SQL.format(placeholders(handle_ids)), handle_ids
+            )
+            with span("tokenize"):
+                return top_n(count_words(texts), limit)
+
+    def _iter_texts(self, session: Session, sql: str, params: Sequence[Any]) -> Iterator[List[str]]:
+        """Stream batches of message texts.
+
+        Texts are read batch_size rows at a time instead of materializing
+        every row. Messages stored only as an attributedBody take their text
+        from the sidecar's decoded text cache; those it does not hold yet
+        (no sidecar, or its update is running elsewhere) are decoded as they
+        are read.
+
+        Args:
+            session: Session to read from
+            sql: Query selecting (ROWID, text, attributedBody)
+            params: Its parameters
+        """
+        self._try_update(self.decoded_text, session)
+        batches = fetch_batches(raw_connection(session), sql, params, self.batch_size)
+        for rows in timed_iter(batches, "query"):
+            decoded = {}
+            if self.decoded_text is not None:
+                decoded = self.decoded_text.lookup(rowid for rowid, text, _ in rows if text is None)
+            texts = [
+                text if text is not None else decoded.get(rowid) or message_text(None, body)
+                for rowid, text, body in rows
+            ]
+            yield [text for text in texts if text is not None]
+
+    def get_chat_stats(self, chat_id: int) -> Dict[str, int]:
+        """Get message and participant counts for a chat.
+
+        Unlike the per-contact statistics, every message in the thread is
+        counted, including group chat messages whose handle_id is the sender.
+
+        Args:
+            chat_id: ROWID of the chat
+
+        Returns:
+            Dict with sent and received message counts and the number of
+            participants (other than you). Unknown chats have zero counts.
+        """
+        with self.session() as session, span("query"):
+            conn = raw_connection(session)
+            sent, received = fetch_one(conn, _CHAT_COUNTS_SQL, (chat_id,))
+            participants = len(fetch_all(conn, _CHAT_MEMBERS_SQL, (chat_id,)))
+        return {"sent": sent or 0, "received": received or 0, "participants": participants}
+
+    def get_chat_word_frequency(self, chat_id: int, limit: int = 10) -> List[Tuple[str, int]]:
+        """Get the most common words in a chat, from every participant.
+
+        Args:
+            chat_id: ROWID of the chat
+            limit: Number of top words to return
+
+        Returns:
+            List of (word, frequency) tuples
+        """
+        with self.session() as session:
+            texts = self._iter_texts(session, _CHAT_TEXTS_SQL, (chat_id,))
+            with span("tokenize"):
+                return top_n(count_words(texts), limit)
+
+    def get_chat_participants(self, chat_id: int) -> List[Dict[str, Any]]:
+        """List the members of a chat and how many messages each sent to it.
+
+        Args:
+            chat_id: ROWID of the chat
+
+        Returns:
+            One dict per handle with its handle_id, contact_id (as stored in
+            handle.id), service and message count, most active first. Handles
+            that left the chat but sent messages to it are included.
+        """
+        with self.session() as session, span("query"):
+            conn = raw_connection(session)
+            counts = dict(fetch_all(conn, _CHAT_SENDERS_SQL, (chat_id,)))
+            members = {handle_id for (handle_id,) in fetch_all(conn, _CHAT_MEMBERS_SQL, (chat_id,))}
+            handle_ids = sorted(members | counts.keys())
+            if not handle_ids:
+                return []
+            rows = fetch_all(conn, _HANDLES_SQL.format(placeholders(handle_ids)), handle_ids)
+        participants = [
+            {
+                "handle_id": handle_id,
+                "contact_id": contact_id,
+                "service": service,
+                "messages": counts.get(handle_id, 0),
+            }
+            for handle_id, contact_id, service in rows
+        ]
+        participants.sort(key=lambda participant: (-participant["messages"], participant["handle_id"]))
+        return participants
+
+    def get_global_word_frequency(
+        self,
+        limit: int = 10,
+        pool: Optional[Executor] = None,
+        partitions: Optional[int] = None,
+        approximate: bool = False,
+    ) -> List[Tuple[str, int]]:
+        """Get the most common words across every conversation.
+
+        The message table is split into ROWID ranges that are tokenized in
+        parallel by worker processes (map), and their Counters are summed
+        (reduce). The top GLOBAL_TOP_WORDS words are kept per database
+        version, so repeated calls are free until chat.db changes.
+
+        With approximate=True the all-conversations Space-Saving summary in
+        the sidecar is brought up to date and read instead; without a
+        sidecar, each range produces a summary and the summaries are merged.
+
+        Args:
+            limit: Number of top words to return
+            pool: Executor to map over (default: the shared process pool)
+            partitions: Number of ROWID ranges (default: 4 per CPU)
+            approximate: Estimate counts, as in get_word_frequency()
+
+        Returns:
+            List of (word, frequency) tuples, most frequent first
+        """
+        if approximate:
+            with self.session() as session:
+                if self._try_update(self.word_sketch, session):
+                    with span("query"):
+                        return self.word_sketch.sketch().top(limit)
+                sketch = SpaceSaving(settings.WORD_SKETCH_CAPACITY)
+                with span("tokenize"):
+                    for partial in self._map_rowid_ranges(
+                        session, sketch_words_in_range, pool, partitions,
+                        settings.WORD_SKETCH_CAPACITY, self.batch_size
+                    ):
+                        sketch.merge(partial)
+                return sketch.top(limit)
+
+        with self._global_words_lock, self.session() as session:
+            version = session.info["version"]
+            cached = self._global_words
+            if cached is not None and cached[0] == version and cached[1] >= limit:
+                return cached[2][:limit]
+
+            counts: Counter = Counter()
+            with span("tokenize"):
+                for partial in self._map_rowid_ranges(
+                    session, count_words_in_range, pool, partitions, self.batch_size
+                ):
+                    counts.update(partial)
+
+            keep = max(limit, GLOBAL_TOP_WORDS)
+            top = top_n(counts, keep)
+            self._global_words = (version, keep, top)
+            return top[:limit]
+
+    def _map_rowid_ranges(
+        self,
+        session: Session,
+        func_: Any,
+        pool: Optional[Executor],
+        partitions: Optional[int],
+        *args: Any,
+    ) -> Iterator[Any]:
+        """Run func_(path, low, high, *args) over ROWID ranges of the message table.
+
+        Results are yielded in ROWID order, so merging them gives the same
+        ties as a single pass.
+        """
+        low, high = session.query(func.min(Message.id), func.max(Message.id)).one()
+        ranges = rowid_partitions((low or 1) - 1, high or 0, partitions or 4 * (os.cpu_count() or 1))
+        pool = pool or get_process_pool(settings.IMESSAGE_PROCESS_WORKERS)
+        futures = [
+            pool.submit(func_, session.info["path"], start, end, *args)
+            for start, end in ranges
+        ]
+        for future in futures:
+            yield future.result()
+
+    def _uses_nanoseconds(self, session: Session) -> bool:
+        """Return True if message.date is stored in nanoseconds."""
+        latest = session.query(Message.date).order_by(Message.id.desc()).limit(1).scalar()
+        return latest is None or latest > NANOSECOND_THRESHOLD
+
+    def _iter_message_rows(
+        self,
+        contact_id: str,
+        fields: Sequence[str],
+        since: Optional[datetime],
+        until: Optional[datetime],
+        after: Optional[Tuple[int, int]],
+        limit: Optional[int],
+    ) -> Iterator[List[Any]]:
+        """Yield partitions of raw message rows in (date, ROWID) order.
+
+        Each row starts with the keyset columns (date, ROWID), followed by
+        the requested fields, and ends with attributedBody if text was
+        requested.
+        """
+        unknown = set(fields) - MESSAGE_FIELDS.keys()
+        if unknown:
+            raise InvalidArgument(f"Unknown message fields: {', '.join(sorted(unknown))}")
+
+        with self.session() as session:
+            handle_ids = self._resolve_handles(session, contact_id)
+            if not handle_ids:
+                return
+            nanoseconds = self._uses_nanoseconds(session)
+
+            columns = ["date", "ROWID"] + [MESSAGE_FIELDS[field].expression.name for field in fields]
+            if "text" in fields:
+                # Decoded in _message_record when text is NULL
+                columns.append("attributedBody")
+            conditions = [f"handle_id IN ({placeholders(handle_ids)})"]
+            params: List[Any] = list(handle_ids)
+            if since is not None:
+                conditions.append("date >= ?")
+                params.append(datetime_to_apple(since, nanoseconds))
+            if until is not None:
+                conditions.append("date < ?")
+                params.append(datetime_to_apple(until, nanoseconds))
+            if after is not None:
+                conditions.append("(date > ? OR (date = ? AND ROWID > ?))")
+                params.extend([after[0], after[0], after[1]])
+            sql = (
+                f"SELECT {', '.join(columns)} FROM message "
+                f"WHERE {' AND '.join(conditions)} ORDER BY date, ROWID"
+            )
+            if limit is not None:
+                sql += " LIMIT ?"
+                params.append(limit)
+
+            batches = fetch_batches(raw_connection(session), sql, params, self.batch_size)
+            yield from timed_iter(batches, "query")
+
+    def _message_record(self, row: Any, fields: Sequence[str]) -> Dict[str, Any]:
+        record = {}
+        for field, value in zip(fields, row[2:]):
+            if field in _DATE_FIELDS and value:
+                value = apple_to_datetime(value).isoformat()
+            elif field == "text":
+                value = message_text(value, row[-1])
+            record[field] = value
+        return record
+
+    def iter_message_batches(
+        self,
+        contact_id: str,
+        fields: Sequence[str] = DEFAULT_MESSAGE_FIELDS,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Stream a contact's messages in batches, oldest first.
+
+        Rows are read from a server-side cursor batch_size at a time, so the
+        whole conversation is never held in memory. The snapshot stays
+        leased until the generator is exhausted or closed.
+
+        Args:
+            contact_id: Phone number or email of the contact
+            fields: Message columns to include (see MESSAGE_FIELDS)
+            since: Only messages sent at or after this time
+            until: Only messages sent before this time
+
+        Returns:
+            Iterator over lists of message dicts. Dates are ISO 8601 UTC.
+
+        Raises:
+            InvalidArgument: If an unknown field is requested
+        """
+        for rows in self._iter_message_rows(contact_id, fields, since, until, None, None):
+            yield [self._message_record(row, fields) for row in rows]
+
+    def get_messages_page(
+        self,
+        contact_id: str,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        fields: Sequence[str] = DEFAULT_MESSAGE_FIELDS,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Dict[str, Any]:
+        """Get one page of a contact's messages, oldest first.
+
+        Pagination is keyset-based on (date, ROWID), so every page costs the
+        same regardless of how deep into the conversation it is.
+
+        Args:
+            contact_id: Phone number or email of the contact
+            limit: Maximum number of messages to return
+            cursor: next_cursor from the previous page, if any
+            fields: Message columns to include (see MESSAGE_FIELDS)
+            since: Only messages sent at or after this time
+            until: Only messages sent before this time
+
+        Returns:
+            Dict with "messages" and "next_cursor" (None on the last page)
+
+        Raises:
+            InvalidArgument: If the cursor is malformed or a field is unknown
+        """
+        after = decode_cursor(cursor) if cursor else None
+        partitions = self._iter_message_rows(contact_id, fields, since, until, after, limit + 1)
+        rows = list(islice((row for rows in partitions for row in rows), limit + 1))
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][0], rows[-1][1])
+        return {
+            "messages": [self._message_record(row, fields) for row in rows],
+            "next_cursor": next_cursor,
+        }
+
+    def get_activity(self, contact_id: str, bucket: str = "day", tz: str = "UTC") -> Dict[str, Any]:
+        """Get a histogram of messages exchanged with a contact over time.
+
+        Only the date and is_from_me columns are read, straight into NumPy
+        arrays, and binned with bincount.
+
+        Args:
+            contact_id: Phone number or email of the contact
+            bucket: "hour", "day" or "week"
+            tz: IANA time zone name bucket boundaries are aligned to
+
+        Returns:
+            Dict with bucket "starts" and aligned "sent"/"received" counts,
+            covering the first to the last message
+
+        Raises:
+            InvalidArgument: If the bucket or time zone is unknown
+        """
+        try:
+            zone = ZoneInfo(tz)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise InvalidArgument(f"Unknown time zone: {tz}")
+
+        with self.session() as session:
+            handle_ids = self._resolve_handles(session, contact_id)
+            chunks = []
+            if handle_ids:
+                batches = fetch_batches(
+                    raw_connection(session),
+                    _HANDLE_DATES_UNORDERED_SQL.format(placeholders(handle_ids)),
+                    handle_ids,
+                    self.batch_size
+                )
+                chunks = [np.array(rows, dtype=np.int64) for rows in timed_iter(batches, "query")]
+        columns = np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.int64)
+        with span("compute"):
+            return bin_activity(columns[:, 0], columns[:, 1], bucket, zone)
+
+    def get_response_times(self, contact_id: str) -> Dict[str, Dict[str, Optional[float]]]:
+        """Get how quickly each side of a conversation replies.
+
+        Args:
+            contact_id: Phone number or email of the contact
+
+        Returns:
+            Dict with "me" and "them", each holding the number of replies
+            and the p50/p90/p99 reply latency in seconds
+        """
+        with self.session() as session:
+            handle_ids = self._resolve_handles(session, contact_id)
+            chunks = []
+            if handle_ids:
+                batches = fetch_batches(
+                    raw_connection(session),
+                    HANDLE_DATES_SQL.format(placeholders(handle_ids)),
+                    handle_ids,
+                    self.batch_size
+                )
+                chunks = [np.array(rows, dtype=np.int64) for rows in timed_iter(batches, "query")]
+        columns = np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.int64)
+        with span("compute"):
+            return response_times(columns[:, 0], columns[:, 1])
+
+    def get_all_response_times(self, chunk_size: int = 64) -> Dict[str, Dict[str, Dict[str, Optional[float]]]]:
+        """Get reply latency for every contact, fanned out over worker processes.
+
+        Contacts are split into chunks of chunk_size and each chunk is read
+        and summarized by a process pool worker against the same snapshot,
+        which stays leased until every chunk is done.
+
+        Args:
+            chunk_size: Contacts per worker task
+
+        Returns:
+            Dict mapping each normalized contact_id to get_response_times()
+        """
+        with self.session() as session:
+            contacts = self._get_handle_map(session).items()
+            pool = get_process_pool(settings.IMESSAGE_PROCESS_WORKERS)
+            futures = [
+                pool.submit(contacts_response_times, session.info["path"], contacts[start:start + chunk_size])
+                for start in range(0, len(contacts), chunk_size)
+            ]
+            results = {}
+            for future in futures:
+                results.update(future.result())
+        return results
+
+    def get_contact_leaderboard(self, sort: str = "messages", limit: int = 50) -> List[Dict[str, Any]]:
+        """Rank every contact by a per-contact total.
+
+        With a sidecar this reads the contact rollup, brought up to date
+        first; without one, every message is scanned and summarized.
+
+        Args:
+            sort: One of LEADERBOARD_SORTS: "messages", "sent", "received",
+                "first_message", "last_message", "messages_per_day" or
+                "average_length"
+            limit: Number of contacts to return
+
+        Returns:
+            List of dicts with contact_id, messages, sent, received,
+            first_message, last_message, messages_per_day and
+            average_length, highest first
+
+        Raises:
+            InvalidArgument: If the sort key is unknown
+        """
+        if sort not in LEADERBOARD_SORTS:
+            raise InvalidArgument(f"Unknown sort key: {sort}")
+        with self.session() as session:
+            handle_map = self._get_handle_map(session)
+            if self._try_update(self.contact_rollup, session, handle_map):
+                with span("query"):
+                    return self.contact_rollup.top(sort, limit)
+
+            contacts = handle_map.contacts_by_handle()
+            totals: Dict[str, List[int]] = {}
+            batches = fetch_batches(raw_connection(session), CONTACT_MESSAGES_SQL, (), self.batch_size)
+            for rows in timed_iter(batches, "query"):
+                with span("compute"):
+                    summarize_messages(
+                        (
+                            (message_text(text, body), handle_id, date, is_from_me)
+                            for text, body, handle_id, date, is_from_me in rows
+                        ),
+                        contacts,
+                        totals
+                    )
+        with span("compute"):
+            return rank_contacts(totals, sort, limit)
+
+    def search_messages(
+        self,
+        query: str,
+        contact_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Full-text search over message text, best matches first.
+
+        Served from the sidecar FTS5 index. It is first brought up to date
+        with any new messages, but only for the first page: bm25 ranks
+        depend on the whole index, so adding messages would shift the ranks
+        the cursor points between. Later pages can still skip or repeat
+        results if the index is updated meanwhile, e.g. by another search.
+
+        Args:
+            query: Words that must all appear in a message
+            contact_id: Only messages exchanged with this contact
+            since: Only messages sent at or after this time
+            limit: Maximum number of results
+            cursor: next_cursor from the previous page, if any
+
+        Returns:
+            Dict with "results" (id, handle_id, date, is_from_me, snippet,
+            rank) and "next_cursor" (None on the last page)
+
+        Raises:
+            InvalidArgument: If the query has no words or the cursor is malformed
+            SearchUnavailable: If the accessor has no sidecar database
+        """
+        if self.search_index is None:
+            raise SearchUnavailable("Full-text search requires a sidecar database")
+        match = match_query(query)
+        if match is None:
+            raise InvalidArgument("Search query must contain at least one word")
+        after = decode_rank_cursor(cursor) if cursor else None
+
+        with self.session() as session:
+            if after is None:
+                # While another update holds the index, search what it has so far
+                self._try_update(self.search_index, session)
+            handle_ids = None
+            if contact_id is not None:
+                handle_ids = self._resolve_handles(session, contact_id)
+                if not handle_ids:
+                    return {"results": [], "next_cursor": None}
+            since_value = None
+            if since is not None:
+                since_value = datetime_to_apple(since, self._uses_nanoseconds(session))
+
+        with span("query") as search:
+            results = self.search_index.search(match, handle_ids, since_value, after, limit + 1)
+            search.rows = len(results)
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            next_cursor = encode_rank_cursor(results[-1]["rank"], results[-1]["id"])
+        for result in results:
+            date = apple_to_datetime(result["date"])
+            result["date"] = date.isoformat() if date else None
+        return {"results": results, "next_cursor": next_cursor}
+
+    def iter_table_rows(self, table_name: str, batch_size: Optional[int] = None) -> Iterator[List[Any]]:
+        """Stream every row of a chat.db table in batches.
+
+        Args:
+            table_name: One of the tables mapped in app/models/imessage.py
+            batch_size: Rows per batch (default: the accessor's batch_size)
+
+        Returns:
+            Iterator over lists of row tuples, in table column order
+
+        Raises:
+            InvalidArgument: If the table is not mapped
+        """
+        table = Base.metadata.tables.get(table_name)
+        if table is None:
+            raise InvalidArgument(f"Unknown table: {table_name}")
+
+        with self.session() as session:
+            result = session.execute(
+                select(table).execution_options(yield_per=batch_size or self.batch_size)
+            )
+            yield from result.partitions()
 
     def __enter__(self):
         """Context manager entry."""
@@ -123,4 +960,108 @@ class IMessageDB:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Context manager exit."""
-        self.close()
\ No newline at end of file
+        self.close()
+
+
+class AsyncIMessageDB:
+    """Awaitable facade over an IMessageDB.
+
+    Every public IMessageDB method is exposed as a coroutine that runs the
+    blocking call on a BoundedExecutor, so file copies and queries never
+    stall the event loop:
+
+        stats = await AsyncIMessageDB(db, pool).get_message_count_by_contact(contact_id)
+    """
+
+    def __init__(self, db: IMessageDB, pool: BoundedExecutor):
+        """Wrap an accessor.
+
+        Args:
+            db: Connected IMessageDB to delegate to
+            pool: Worker pool the blocking calls run on
+        """
+        self.db = db
+        self.pool = pool
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.db, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await self.pool.run(run_profiled, attr, *args, **kwargs)
+
+        return call
+
+
+# Process-wide accessor shared by every request. It is opened by the app
+# lifespan (or lazily on first use) and closed at shutdown.
+_shared_db: Optional[IMessageDB] = None
+_worker_pool: Optional[BoundedExecutor] = None
+_shared_lock = threading.Lock()
+
+
+def open_shared_db() -> IMessageDB:
+    """Open the process-wide IMessageDB if it is not open yet.
+
+    Returns:
+        The shared IMessageDB instance
+
+    Raises:
+        FileNotFoundError: If the iMessage database does not exist
+    """
+    global _shared_db
+    with _shared_lock:
+        if _shared_db is None:
+            db = IMessageDB(
+                mode=settings.IMESSAGE_ACCESS_MODE,
+                immutable=settings.IMESSAGE_IMMUTABLE,
+                pool_size=settings.IMESSAGE_POOL_SIZE,
+                snapshot_dir=settings.IMESSAGE_SNAPSHOT_DIR,
+                sidecar_dir=settings.IMESSAGE_SIDECAR_DIR,
+            )
+            db.connect()
+            _shared_db = db
+        return _shared_db
+
+
+def get_shared_db() -> IMessageDB:
+    """Return the shared IMessageDB, opening it on first use."""
+    if _shared_db is not None:
+        return _shared_db
+    return open_shared_db()
+
+
+def get_worker_pool() -> BoundedExecutor:
+    """Return the process-wide pool that blocking iMessage calls run on."""
+    global _worker_pool
+    with _shared_lock:
+        if _worker_pool is None:
+            _worker_pool = BoundedExecutor(
+                max_workers=settings.IMESSAGE_MAX_WORKERS,
+                max_pending=settings.IMESSAGE_MAX_PENDING,
+            )
+        return _worker_pool
+
+
+async def get_shared_async_db() -> AsyncIMessageDB:
+    """Return the shared IMessageDB wrapped for use from async code.
+
+    The first open, which may take a snapshot, also runs on the worker pool.
+    """
+    pool = get_worker_pool()
+    db = _shared_db if _shared_db is not None else await pool.run(open_shared_db)
+    return AsyncIMessageDB(db, pool)
+
+
+def close_shared_db() -> None:
+    """Dispose of the shared IMessageDB's connections, snapshots and workers."""
+    global _shared_db, _worker_pool
+    with _shared_lock:
+        if _shared_db is not None:
+            _shared_db.close()
+            _shared_db = None
+        if _worker_pool is not None:
+            _worker_pool.shutdown()
+            _worker_pool = None
+    shutdown_process_pool()
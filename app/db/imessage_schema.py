@@ -1,5 +1,7 @@
 import sqlite3
 import os
+import shutil
+import tempfile
 from pathlib import Path
 
 def get_imessage_schema():
@@ -9,12 +11,14 @@ def get_imessage_schema():
     if not os.path.exists(db_path):
         raise FileNotFoundError(f"iMessage database not found at {db_path}")
     
-    # Create a copy of the database to avoid locking the original
-    temp_db = "/tmp/chat_temp.db"
-    os.system(f"cp '{db_path}' '{temp_db}'")
+    # Create a uniquely named copy of the database to avoid locking the
+    # original or colliding with the API's own snapshots
+    fd, temp_db = tempfile.mkstemp(prefix="chat_schema_", suffix=".db")
+    os.close(fd)
+    shutil.copy2(db_path, temp_db)
     
+    conn = sqlite3.connect(temp_db)
     try:
-        conn = sqlite3.connect(temp_db)
         cursor = conn.cursor()
         
         # Get all table names
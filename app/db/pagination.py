@@ -0,0 +1,42 @@
+import base64
+from typing import Tuple
+
+from app.db.errors import InvalidArgument
+
+
+def encode_cursor(date: int, rowid: int) -> str:
+    """Encode a (message.date, ROWID) keyset position as an opaque cursor."""
+    return base64.urlsafe_b64encode(f"{date}:{rowid}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Decode a cursor produced by encode_cursor().
+
+    Raises:
+        InvalidArgument: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date, rowid = base64.urlsafe_b64decode(padded.encode()).decode().split(":")
+        return int(date), int(rowid)
+    except Exception:
+        raise InvalidArgument(f"Invalid cursor: {cursor}")
+
+
+def encode_rank_cursor(rank: float, rowid: int) -> str:
+    """Encode a (relevance rank, ROWID) keyset position as an opaque cursor."""
+    return base64.urlsafe_b64encode(f"{rank!r}:{rowid}".encode()).decode().rstrip("=")
+
+
+def decode_rank_cursor(cursor: str) -> Tuple[float, int]:
+    """Decode a cursor produced by encode_rank_cursor().
+
+    Raises:
+        InvalidArgument: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, rowid = base64.urlsafe_b64decode(padded.encode()).decode().split(":")
+        return float(rank), int(rowid)
+    except Exception:
+        raise InvalidArgument(f"Invalid cursor: {cursor}")
@@ -0,0 +1,71 @@
+"""
+Thin read-only query layer on the sqlite3 connection underneath a Session.
+
+Analytics scans read millions of rows but only need plain tuples. Going
+through the ORM, or even Core result objects, costs a Row per row plus
+compilation and result processing; these helpers run constant SQL strings
+directly on the DBAPI connection instead:
+
+- rows are the tuples sqlite3 returns, with no wrapping
+- sqlite3 caches prepared statements per connection by SQL text, so the
+  module-level SQL constants are compiled once per pooled connection
+- rows are fetched arraysize at a time with fetchmany()
+
+The ORM models and IMessageDB.session() remain available for ad-hoc queries.
+"""
+
+import sqlite3
+from typing import Any, Iterator, List, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+
+def raw_connection(session: Session) -> sqlite3.Connection:
+    """Return the sqlite3 connection a session reads from.
+
+    It belongs to the session's pooled connection, so queries on it see the
+    same file (in snapshot mode, the same leased snapshot) as the session.
+    """
+    return session.connection().connection.driver_connection
+
+
+def placeholders(values: Sequence[Any]) -> str:
+    """Return "?, ?, ..." with one parameter marker per value."""
+    return ", ".join("?" * len(values))
+
+
+def fetch_batches(
+    conn: sqlite3.Connection,
+    sql: str,
+    params: Sequence[Any] = (),
+    batch_size: int = 5000,
+) -> Iterator[List[tuple]]:
+    """Run a query and yield its rows as lists of tuples, batch_size at a time.
+
+    Args:
+        conn: Connection to run the query on
+        sql: Query text; reuse the same string to hit the statement cache
+        params: Positional parameters
+        batch_size: Rows per fetchmany() round trip (cursor.arraysize)
+    """
+    cursor = conn.cursor()
+    cursor.arraysize = batch_size
+    try:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+
+def fetch_all(conn: sqlite3.Connection, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+    """Run a query and return every row as a tuple."""
+    return conn.execute(sql, params).fetchall()
+
+
+def fetch_one(conn: sqlite3.Connection, sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+    """Run a query and return its first row, or None."""
+    return conn.execute(sql, params).fetchone()
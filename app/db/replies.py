@@ -0,0 +1,95 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.db.dates import NANOSECOND_THRESHOLD
+from app.db.raw import fetch_all, placeholders
+from app.db.snapshot import connect_read_only
+
+PERCENTILES = (50, 90, 99)
+
+# (date, is_from_me) of the messages of some handles, oldest first; format
+# with one placeholder per handle
+HANDLE_DATES_SQL = (
+    "SELECT date, COALESCE(is_from_me, 0) FROM message "
+    "WHERE handle_id IN ({}) AND date IS NOT NULL "
+    "ORDER BY date, ROWID"
+)
+
+
+def reply_gaps(dates: np.ndarray, from_me: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Find how long each side took to reply, in seconds.
+
+    A reply is a message whose sender differs from the previous message's;
+    its latency is the time since that previous message. Consecutive
+    messages from the same side are part of one turn and are skipped.
+
+    Args:
+        dates: message.date values, sorted ascending
+        from_me: is_from_me flags, aligned with dates
+
+    Returns:
+        (my reply gaps, their reply gaps) as float arrays of seconds
+    """
+    if len(dates) < 2:
+        empty = np.empty(0, dtype=np.float64)
+        return empty, empty
+    dates = dates.astype(np.int64, copy=False)
+    nanoseconds = np.where(dates > NANOSECOND_THRESHOLD, dates, dates * 10 ** 9)
+    gaps = np.diff(nanoseconds) / 1e9
+    sender = from_me.astype(bool)
+    turns = sender[1:] != sender[:-1]
+    mine = turns & sender[1:]
+    theirs = turns & ~sender[1:]
+    return gaps[mine], gaps[theirs]
+
+
+def summarize_gaps(gaps: np.ndarray) -> Dict[str, Optional[float]]:
+    """Return the count and p50/p90/p99 of reply gaps (None when empty)."""
+    summary: Dict[str, Any] = {"count": int(len(gaps))}
+    values = np.percentile(gaps, PERCENTILES) if len(gaps) else [None] * len(PERCENTILES)
+    for percentile, value in zip(PERCENTILES, values):
+        summary[f"p{percentile}"] = None if value is None else float(value)
+    return summary
+
+
+def response_times(dates: np.ndarray, from_me: np.ndarray) -> Dict[str, Dict[str, Optional[float]]]:
+    """Summarize reply latency for both sides of a conversation.
+
+    Args:
+        dates: message.date values, sorted ascending
+        from_me: is_from_me flags, aligned with dates
+
+    Returns:
+        Dict with "me" and "them" summaries from summarize_gaps()
+    """
+    mine, theirs = reply_gaps(dates, from_me)
+    return {"me": summarize_gaps(mine), "them": summarize_gaps(theirs)}
+
+
+def contacts_response_times(
+    db_path: str,
+    contacts: List[Tuple[str, List[int]]],
+) -> Dict[str, Dict[str, Dict[str, Optional[float]]]]:
+    """Compute response_times() for several contacts straight from a chat.db file.
+
+    Runs in process pool workers, so it opens its own read-only connection
+    rather than sharing the caller's engine.
+
+    Args:
+        db_path: SQLite file to read (a snapshot, or chat.db itself)
+        contacts: (contact_id, handle ROWIDs) pairs
+
+    Returns:
+        Dict mapping each contact_id to its response_times()
+    """
+    conn = connect_read_only(db_path)
+    try:
+        results = {}
+        for contact_id, handle_ids in contacts:
+            rows = fetch_all(conn, HANDLE_DATES_SQL.format(placeholders(handle_ids)), handle_ids)
+            columns = np.array(rows, dtype=np.int64).reshape(-1, 2)
+            results[contact_id] = response_times(columns[:, 0], columns[:, 1])
+        return results
+    finally:
+        conn.close()
@@ -0,0 +1,196 @@
+import html
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db.attributed_body import HAS_TEXT, DecodedTextCache
+from app.db.raw import fetch_batches, raw_connection
+from app.db.sidecar import SidecarDB
+from app.db.word_index import WORD_PATTERN
+from app.models.imessage import Message
+
+
+# Private-use characters snippet() marks matches with before the text is
+# HTML-escaped; they are then replaced by the <b> tags
+_MATCH_START = "\ue000"
+_MATCH_END = "\ue001"
+
+_SEARCH_SCAN_SQL = (
+    "SELECT ROWID, text, handle_id, date, is_from_me FROM message "
+    f"WHERE ROWID > ? AND ROWID <= ? AND {HAS_TEXT} ORDER BY ROWID"
+)
+
+
+def highlight(snippet: str) -> str:
+    """HTML-escape an FTS5 snippet and turn its match markers into <b> tags."""
+    return (
+        html.escape(snippet, quote=False)
+        .replace(_MATCH_START, "<b>")
+        .replace(_MATCH_END, "</b>")
+    )
+
+
+class SearchUnavailable(Exception):
+    """Raised when full-text search is requested without a sidecar database."""
+
+
+def match_query(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 query matching messages with every word.
+
+    Each word is quoted, so punctuation and FTS5 operators typed by a user
+    can never produce a syntax error.
+
+    Returns:
+        The MATCH expression, or None if the query contains no words
+    """
+    words = WORD_PATTERN.findall(query)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words)
+
+
+class SearchIndex:
+    """FTS5 full-text index over message text, stored in the sidecar.
+
+    Texts are indexed under their message ROWID, next to a small table of
+    (handle_id, date, is_from_me) used to filter matches by contact and
+    time. Like WordIndex, it is updated by indexing only messages above
+    the last ROWID indexed.
+    """
+
+    NAME = "message_fts"
+
+    def __init__(
+        self,
+        sidecar: SidecarDB,
+        batch_size: int = 5000,
+        decoded: Optional[DecodedTextCache] = None,
+    ):
+        """Initialize the index, creating its tables if needed.
+
+        Args:
+            sidecar: Sidecar database the index is stored in
+            batch_size: Messages inserted per executemany
+            decoded: Cache of attributedBody texts (default: one in the sidecar)
+        """
+        self.sidecar = sidecar
+        self.batch_size = batch_size
+        self.decoded = decoded or DecodedTextCache(sidecar, batch_size)
+        self._lock = threading.Lock()
+        with sidecar.connect() as conn:
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5("
+                "text, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS message_fts_meta ("
+                "rowid INTEGER PRIMARY KEY, "
+                "handle_id INTEGER, "
+                "date INTEGER, "
+                "is_from_me INTEGER)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_message_fts_meta_handle_date "
+                "ON message_fts_meta (handle_id, date)"
+            )
+
+    def update(self, session: Session, blocking: bool = True) -> int:
+        """Index every message added since the last update.
+
+        Args:
+            session: Session on the iMessage database to read new messages from
+            blocking: Wait for an update running elsewhere; if False, raise
+                SidecarBusy instead
+
+        Returns:
+            Number of messages indexed
+        """
+        self.decoded.update(session, blocking)
+        with self.sidecar.write(self._lock, blocking) as conn:
+            last_rowid = self.sidecar.get_high_water(conn, self.NAME)
+            max_rowid = session.query(func.max(Message.id)).scalar() or 0
+            if max_rowid < last_rowid:
+                # The source database was replaced; start over
+                conn.execute("DELETE FROM message_fts")
+                conn.execute("DELETE FROM message_fts_meta")
+                last_rowid = 0
+            if max_rowid == last_rowid:
+                return 0
+
+            batches = fetch_batches(
+                raw_connection(session), _SEARCH_SCAN_SQL, (last_rowid, max_rowid), self.batch_size
+            )
+            indexed = 0
+            for rows in batches:
+                rows = self.decoded.fill(rows)
+                conn.executemany(
+                    "INSERT INTO message_fts (rowid, text) VALUES (?, ?)",
+                    ((rowid, text) for rowid, text, _, _, _ in rows)
+                )
+                conn.executemany(
+                    "INSERT INTO message_fts_meta (rowid, handle_id, date, is_from_me) "
+                    "VALUES (?, ?, ?, ?)",
+                    ((rowid, handle_id, date, is_from_me) for rowid, _, handle_id, date, is_from_me in rows)
+                )
+                indexed += len(rows)
+
+            self.sidecar.set_high_water(conn, self.NAME, max_rowid)
+            return indexed
+
+    def search(
+        self,
+        match: str,
+        handle_ids: Optional[Sequence[int]] = None,
+        since: Optional[int] = None,
+        after: Optional[Tuple[float, int]] = None,
+        limit: int = 20,
+    ) -> List[Dict[str, Any]]:
+        """Return matches ordered by relevance, best first.
+
+        Args:
+            match: FTS5 MATCH expression, e.g. from match_query()
+            handle_ids: Only messages from these handles
+            since: Only messages with message.date at or after this value
+            after: (rank, ROWID) of the last result of the previous page
+            limit: Maximum number of results
+
+        Returns:
+            Dicts with the message ROWID, handle_id, raw date, is_from_me,
+            an HTML-escaped snippet with matches in <b> tags, and its bm25
+            rank (lower is better)
+        """
+        conditions = ["message_fts MATCH ?"]
+        params: List[Any] = [match]
+        if handle_ids is not None:
+            conditions.append(f"m.handle_id IN ({', '.join('?' * len(handle_ids))})")
+            params.extend(handle_ids)
+        if since is not None:
+            conditions.append("m.date >= ?")
+            params.append(since)
+        if after is not None:
+            conditions.append("(bm25(message_fts) > ? OR (bm25(message_fts) = ? AND message_fts.rowid > ?))")
+            params.extend([after[0], after[0], after[1]])
+        params.append(limit)
+
+        with self.sidecar.connect() as conn:
+            rows = conn.execute(
+                "SELECT message_fts.rowid, m.handle_id, m.date, m.is_from_me, "
+                "snippet(message_fts, 0, ?, ?, '…', 12), bm25(message_fts) AS score "
+                "FROM message_fts JOIN message_fts_meta m ON m.rowid = message_fts.rowid "
+                f"WHERE {' AND '.join(conditions)} "
+                "ORDER BY score, message_fts.rowid LIMIT ?",
+                [_MATCH_START, _MATCH_END, *params]
+            ).fetchall()
+        return [
+            {
+                "id": rowid,
+                "handle_id": handle_id,
+                "date": date,
+                "is_from_me": is_from_me,
+                "snippet": highlight(snippet),
+                "rank": score,
+            }
+            for rowid, handle_id, date, is_from_me, snippet, score in rows
+        ]
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class SidecarBusy(Exception):
+    """Raised when an index is being updated elsewhere and the caller will not wait."""
+
+
+def sidecar_path_for(source_path: str, sidecar_dir: str) -> str:
+    """Return the sidecar database path for a given chat.db.
+
+    Each source database gets its own sidecar so indexes built from one
+    chat.db are never served for another.
+    """
+    digest = hashlib.sha1(os.path.abspath(source_path).encode()).hexdigest()[:12]
+    return os.path.join(sidecar_dir, f"sidecar_{digest}.db")
+
+
+class SidecarDB:
+    """Persistent SQLite database for indexes derived from chat.db.
+
+    The iMessage database itself is never written to. Anything we precompute
+    from it lives here instead, together with the message ROWID high-water
+    mark each index has been brought up to, so indexes can be updated
+    incrementally as new messages arrive.
+    """
+
+    def __init__(self, path: str):
+        """Open (and create if needed) the sidecar database.
+
+        Args:
+            path: Location of the sidecar database file
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS index_state ("
+                "name TEXT PRIMARY KEY, "
+                "last_rowid INTEGER NOT NULL)"
+            )
+
+    @contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        """Yield a connection, committing on success and rolling back on error."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @contextmanager
+    def write(self, lock: threading.Lock, blocking: bool = True) -> Iterator[sqlite3.Connection]:
+        """Yield a connection inside a write transaction, for updating an index.
+
+        The transaction is started with BEGIN IMMEDIATE, before the index's
+        high-water mark is read. Another thread or process therefore cannot
+        read the same mark and process the same ROWIDs until the new mark is
+        committed together with the rows it covers.
+
+        Args:
+            lock: The index's in-process lock, taken first so threads queue
+                on it rather than on SQLite's busy timeout
+            blocking: Wait for other writers; if False, raise SidecarBusy
+
+        Raises:
+            SidecarBusy: If blocking is False and another writer is active
+        """
+        if not lock.acquire(blocking=blocking):
+            raise SidecarBusy(self.path)
+        try:
+            with self.connect() as conn:
+                if not blocking:
+                    conn.execute("PRAGMA busy_timeout = 0")
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                except sqlite3.OperationalError as e:
+                    if blocking:
+                        raise
+                    raise SidecarBusy(self.path) from e
+                yield conn
+        finally:
+            lock.release()
+
+    def get_high_water(self, conn: sqlite3.Connection, name: str) -> int:
+        """Return the last message ROWID the named index has processed."""
+        row = conn.execute(
+            "SELECT last_rowid FROM index_state WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def set_high_water(self, conn: sqlite3.Connection, name: str, rowid: int) -> None:
+        """Record the last message ROWID the named index has processed."""
+        conn.execute(
+            "INSERT INTO index_state (name, last_rowid) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET last_rowid = excluded.last_rowid",
+            (name, rowid)
+        )
@@ -0,0 +1,310 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.core.metrics import span
+
+# (mtime_ns, size) of chat.db followed by that of its -wal file, if any
+SourceSignature = Tuple[Optional[Tuple[int, int]], ...]
+
+# Indexes added to private snapshots so per-handle and per-chat queries are
+# answered from the index alone instead of scanning the message table
+SNAPSHOT_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS msgapi_message_handle_from_me "
+    "ON message (handle_id, is_from_me)",
+    "CREATE INDEX IF NOT EXISTS msgapi_message_handle_date "
+    "ON message (handle_id, date)",
+    "CREATE INDEX IF NOT EXISTS msgapi_chat_message_join_chat_date "
+    "ON chat_message_join (chat_id, message_date)",
+]
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def source_signature(path: str) -> SourceSignature:
+    """Return the (mtime, size) of a database and its -wal file.
+
+    Raises:
+        FileNotFoundError: If the database does not exist
+    """
+    db_signature = _file_signature(path)
+    if db_signature is None:
+        raise FileNotFoundError(f"iMessage database not found at {path}")
+    return (db_signature, _file_signature(path + "-wal"))
+
+
+def signature_version(signature: SourceSignature) -> str:
+    """Return a short, stable version string for a source signature."""
+    return hashlib.sha1(repr(signature).encode()).hexdigest()[:12]
+
+
+def connect_read_only(path: str) -> sqlite3.Connection:
+    """Open a SQLite file with mode=ro, e.g. a snapshot from a worker process."""
+    return sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True)
+
+
+def prepare_snapshot(path: str) -> float:
+    """Add covering indexes to a private snapshot and refresh its statistics.
+
+    Only ever run this on a copy; the user's chat.db must not be modified.
+
+    Returns:
+        Seconds spent preparing the snapshot
+    """
+    started = time.perf_counter()
+    conn = sqlite3.connect(path)
+    try:
+        for statement in SNAPSHOT_INDEXES:
+            try:
+                conn.execute(statement)
+            except sqlite3.OperationalError:
+                # Table missing from this chat.db version
+                continue
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    return time.perf_counter() - started
+
+
+class Snapshot:
+    """A private, uniquely named copy of chat.db shared by in-flight requests."""
+
+    def __init__(
+        self,
+        path: str,
+        signature: SourceSignature,
+        pragmas: Optional[Dict[str, int]] = None,
+    ):
+        """Open an engine over an already written snapshot file.
+
+        Args:
+            path: Location of the snapshot database
+            signature: Source signature the snapshot was taken from
+            pragmas: PRAGMA name to value, applied to every new connection
+        """
+        self.path = path
+        self.signature = signature
+        self.version = signature_version(signature)
+        self.refcount = 0
+        self.retired = False
+        self.engine = create_engine(
+            f"sqlite:///{path}",
+            connect_args={"check_same_thread": False}
+        )
+        if pragmas:
+            @event.listens_for(self.engine, "connect")
+            def apply_pragmas(dbapi_connection, connection_record):
+                for name, value in pragmas.items():
+                    dbapi_connection.execute(f"PRAGMA {name}={int(value)}")
+        self.SessionLocal = sessionmaker(bind=self.engine)
+
+    def dispose(self) -> None:
+        """Close the engine and delete the snapshot and its sidecar files."""
+        self.engine.dispose()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+
+class SnapshotManager:
+    """Maintains reference-counted snapshots of a live chat.db.
+
+    A new snapshot is only taken when the mtime or size of the source
+    database or its -wal file changes, so concurrent requests share one copy
+    per change. Superseded snapshots are deleted once the last request
+    holding them releases them.
+
+    Snapshots are written with SQLite's online backup API, which reads the
+    source through its -wal file and so always produces a consistent image.
+    The copy proceeds a few pages at a time and releases the GIL between
+    steps; requests that arrive during a refresh keep using the previous
+    snapshot instead of waiting for it.
+    """
+
+    def __init__(
+        self,
+        source_path: str,
+        snapshot_dir: Optional[str] = None,
+        pages_per_step: int = 1024,
+        prepare: bool = False,
+        pragmas: Optional[Dict[str, int]] = None,
+    ):
+        """Initialize the manager.
+
+        Args:
+            source_path: Path to the live iMessage database
+            snapshot_dir: Directory for snapshot files. If None, uses the
+                system temporary directory.
+            pages_per_step: Pages copied per backup step during a refresh
+            prepare: Add covering indexes and run ANALYZE on each snapshot
+            pragmas: PRAGMA name to value (e.g. mmap_size, cache_size)
+                applied to every connection on a snapshot
+        """
+        self.source_path = source_path
+        self.snapshot_dir = snapshot_dir or tempfile.gettempdir()
+        self.pages_per_step = pages_per_step
+        self.prepare = prepare
+        self.pragmas = pragmas
+        self._current: Optional[Snapshot] = None
+        self._retired: List[Snapshot] = []
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._metrics: Dict[str, Any] = {
+            "refresh_count": 0,
+            "last_refresh_seconds": None,
+            "last_refresh_pages": None,
+            "total_refresh_seconds": 0.0,
+            "total_pages_copied": 0,
+            "last_prepare_seconds": None,
+        }
+
+    def source_signature(self) -> SourceSignature:
+        """Return the (mtime, size) of the source database and its -wal file."""
+        return source_signature(self.source_path)
+
+    @property
+    def current(self) -> Optional[Snapshot]:
+        """The most recent snapshot, if one has been taken."""
+        return self._current
+
+    def acquire(self) -> Snapshot:
+        """Return an up-to-date snapshot with its reference count incremented.
+
+        Every call must be paired with release().
+        """
+        signature = self.source_signature()
+        if self._current is None or self._current.signature != signature:
+            # Only block if there is no snapshot to serve in the meantime
+            if self._refresh_lock.acquire(blocking=self._current is None):
+                try:
+                    # Another request may have refreshed while we were waiting
+                    if self._current is None or self._current.signature != signature:
+                        self._refresh(signature)
+                finally:
+                    self._refresh_lock.release()
+
+        with self._lock:
+            snapshot = self._current
+            snapshot.refcount += 1
+            return snapshot
+
+    def release(self, snapshot: Snapshot) -> None:
+        """Drop a reference taken by acquire(), deleting retired snapshots."""
+        with self._lock:
+            snapshot.refcount -= 1
+            if snapshot.retired and snapshot.refcount == 0:
+                self._retired.remove(snapshot)
+                snapshot.dispose()
+
+    @contextmanager
+    def lease(self) -> Iterator[Snapshot]:
+        """Context manager around acquire()/release()."""
+        snapshot = self.acquire()
+        try:
+            yield snapshot
+        finally:
+            self.release(snapshot)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return refresh and preparation timings, page counts and the version.
+
+        last_refresh_seconds includes the time spent preparing the snapshot.
+        """
+        metrics = dict(self._metrics)
+        metrics["version"] = self._current.version if self._current else None
+        metrics["retired_snapshots"] = len(self._retired)
+        return metrics
+
+    def _refresh(self, signature: SourceSignature) -> None:
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="chat_snapshot_", suffix=".db", dir=self.snapshot_dir)
+        os.close(fd)
+        started = time.perf_counter()
+        prepare_seconds = None
+        try:
+            with span("snapshot_copy") as copy:
+                pages = self._copy_source(path)
+                copy.bytes = os.path.getsize(path)
+            if self.prepare:
+                with span("snapshot_prepare"):
+                    prepare_seconds = prepare_snapshot(path)
+            snapshot = Snapshot(path, signature, self.pragmas)
+        except Exception:
+            for suffix in ("", "-journal"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            raise
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self._metrics["refresh_count"] += 1
+            self._metrics["last_refresh_seconds"] = elapsed
+            self._metrics["last_refresh_pages"] = pages
+            self._metrics["total_refresh_seconds"] += elapsed
+            self._metrics["total_pages_copied"] += pages
+            self._metrics["last_prepare_seconds"] = prepare_seconds
+            previous = self._current
+            self._current = snapshot
+            if previous is not None:
+                self._retire(previous)
+
+    def _copy_source(self, path: str) -> int:
+        """Back up the source into path a step at a time.
+
+        Returns:
+            Number of pages copied
+        """
+        uri = f"file:{quote(os.path.abspath(self.source_path))}?mode=ro"
+        copied = 0
+
+        def progress(status: int, remaining: int, total: int) -> None:
+            nonlocal copied
+            copied = total - remaining
+            # Give request threads a chance to run between steps
+            time.sleep(0)
+
+        source = sqlite3.connect(uri, uri=True)
+        target = sqlite3.connect(path)
+        try:
+            source.backup(target, pages=self.pages_per_step, progress=progress)
+            # The source is normally in WAL mode; keep the snapshot a single
+            # self-contained file instead
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+            source.close()
+        return copied
+
+    def _retire(self, snapshot: Snapshot) -> None:
+        # Caller holds self._lock
+        snapshot.retired = True
+        if snapshot.refcount == 0:
+            snapshot.dispose()
+        else:
+            self._retired.append(snapshot)
+
+    def close(self) -> None:
+        """Delete every snapshot, including ones still referenced."""
+        with self._lock:
+            for snapshot in self._retired:
+                snapshot.dispose()
+            self._retired = []
+            if self._current is not None:
+                self._current.dispose()
+                self._current = None
@@ -0,0 +1,201 @@
+import heapq
+import re
+import threading
+from collections import Counter
+from itertools import chain
+from typing import Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db.attributed_body import HAS_TEXT, DecodedTextCache, message_text
+from app.db.raw import fetch_batches, raw_connection
+from app.db.sidecar import SidecarDB
+from app.db.snapshot import connect_read_only
+from app.models.imessage import Message
+
+WORD_PATTERN = re.compile(r'\b\w+\b')
+
+_RANGE_TEXTS_SQL = (
+    f"SELECT text, attributedBody FROM message WHERE ROWID > ? AND ROWID <= ? AND {HAS_TEXT}"
+)
+_INDEX_SCAN_SQL = (
+    f"SELECT ROWID, text, handle_id FROM message WHERE ROWID > ? AND ROWID <= ? AND {HAS_TEXT} "
+    "ORDER BY ROWID"
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase text and split it into words, dropping punctuation."""
+    return WORD_PATTERN.findall(text.lower())
+
+
+def count_words(batches: Iterable[Sequence[str]]) -> Counter:
+    """Count words across batches of message texts.
+
+    Each batch is tokenized lazily and folded into the running Counter before
+    the next one is read, so memory is bounded by the vocabulary and one
+    batch rather than by the size of the conversation.
+    """
+    counts: Counter = Counter()
+    for batch in batches:
+        counts.update(chain.from_iterable(tokenize(text) for text in batch))
+    return counts
+
+
+def top_n(counts: Mapping[str, int], limit: int) -> List[Tuple[str, int]]:
+    """Return the limit most common (word, count) pairs using a bounded heap.
+
+    Ties are broken by word, as in WordIndex.top_words(), so every path
+    answering a word-frequency request returns the same order.
+    """
+    return heapq.nsmallest(limit, counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+def rowid_partitions(low: int, high: int, parts: int) -> List[Tuple[int, int]]:
+    """Split the ROWID range (low, high] into up to `parts` contiguous ranges."""
+    if high <= low:
+        return []
+    step = max(1, -(-(high - low) // parts))
+    return [(start, min(start + step, high)) for start in range(low, high, step)]
+
+
+def iter_texts_in_range(conn, low: int, high: int, batch_size: int = 5000) -> Iterator[List[str]]:
+    """Yield batches of message texts with low < ROWID <= high.
+
+    Messages stored only as an attributedBody are decoded on the fly.
+    """
+    for rows in fetch_batches(conn, _RANGE_TEXTS_SQL, (low, high), batch_size):
+        texts = [message_text(text, body) for text, body in rows]
+        yield [text for text in texts if text is not None]
+
+
+def count_words_in_range(db_path: str, low: int, high: int, batch_size: int = 5000) -> Counter:
+    """Count words in messages with low < ROWID <= high.
+
+    The map step of the global word count; runs in process pool workers,
+    so it opens its own read-only connection to the file.
+    """
+    conn = connect_read_only(db_path)
+    try:
+        return count_words(iter_texts_in_range(conn, low, high, batch_size))
+    finally:
+        conn.close()
+
+
+class WordIndex:
+    """Per-handle word counts stored in the sidecar database.
+
+    The index is built once and then brought up to date by reading only the
+    messages whose ROWID is above the last one indexed, so a top-N query is
+    a single indexed ORDER BY count DESC LIMIT n.
+    """
+
+    NAME = "word_counts"
+
+    def __init__(
+        self,
+        sidecar: SidecarDB,
+        batch_size: int = 5000,
+        decoded: Optional[DecodedTextCache] = None,
+    ):
+        """Initialize the index, creating its table if needed.
+
+        Args:
+            sidecar: Sidecar database the counts are stored in
+            batch_size: Messages tokenized between writes to the sidecar
+            decoded: Cache of attributedBody texts (default: one in the sidecar)
+        """
+        self.sidecar = sidecar
+        self.batch_size = batch_size
+        self.decoded = decoded or DecodedTextCache(sidecar, batch_size)
+        self._lock = threading.Lock()
+        with sidecar.connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS word_counts ("
+                "handle_id INTEGER NOT NULL, "
+                "word TEXT NOT NULL, "
+                "count INTEGER NOT NULL, "
+                "PRIMARY KEY (handle_id, word)) WITHOUT ROWID"
+            )
+            # Superseded by the index below, which also covers the tiebreak
+            conn.execute("DROP INDEX IF EXISTS idx_word_counts_handle_count")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_word_counts_handle_count_word "
+                "ON word_counts (handle_id, count DESC, word)"
+            )
+
+    def update(self, session: Session, blocking: bool = True) -> int:
+        """Index every message added since the last update.
+
+        Args:
+            session: Session on the iMessage database to read new messages from
+            blocking: Wait for an update running elsewhere; if False, raise
+                SidecarBusy instead
+
+        Returns:
+            Number of messages indexed
+        """
+        # Brought up to date first: it takes the sidecar's write lock too
+        self.decoded.update(session, blocking)
+        with self.sidecar.write(self._lock, blocking) as conn:
+            last_rowid = self.sidecar.get_high_water(conn, self.NAME)
+            max_rowid = session.query(func.max(Message.id)).scalar() or 0
+            if max_rowid < last_rowid:
+                # The source database was replaced; start over
+                conn.execute("DELETE FROM word_counts")
+                last_rowid = 0
+            if max_rowid == last_rowid:
+                return 0
+
+            batches = fetch_batches(
+                raw_connection(session), _INDEX_SCAN_SQL, (last_rowid, max_rowid), self.batch_size
+            )
+
+            indexed = 0
+            for rows in batches:
+                counts: Counter = Counter()
+                for _, text, handle_id in self.decoded.fill(rows):
+                    handle_id = handle_id or 0
+                    counts.update((handle_id, word) for word in tokenize(text))
+                    indexed += 1
+                self._flush(conn, counts)
+
+            self.sidecar.set_high_water(conn, self.NAME, max_rowid)
+            return indexed
+
+    def _flush(self, conn, counts: Counter) -> None:
+        conn.executemany(
+            "INSERT INTO word_counts (handle_id, word, count) VALUES (?, ?, ?) "
+            "ON CONFLICT(handle_id, word) DO UPDATE SET count = count + excluded.count",
+            ((handle_id, word, count) for (handle_id, word), count in counts.items())
+        )
+
+    def top_words(self, handle_ids: Sequence[int], limit: int = 10) -> List[Tuple[str, int]]:
+        """Return the most common words across the given handles.
+
+        Args:
+            handle_ids: Handle ROWIDs to aggregate
+            limit: Number of top words to return
+
+        Returns:
+            List of (word, frequency) tuples, most frequent first
+        """
+        if not handle_ids:
+            return []
+        with self.sidecar.connect() as conn:
+            if len(handle_ids) == 1:
+                rows = conn.execute(
+                    "SELECT word, count FROM word_counts WHERE handle_id = ? "
+                    "ORDER BY count DESC, word LIMIT ?",
+                    (handle_ids[0], limit)
+                )
+            else:
+                placeholders = ", ".join("?" * len(handle_ids))
+                rows = conn.execute(
+                    f"SELECT word, SUM(count) AS total FROM word_counts "
+                    f"WHERE handle_id IN ({placeholders}) "
+                    f"GROUP BY word ORDER BY total DESC, word LIMIT ?",
+                    (*handle_ids, limit)
+                )
+            return [(word, count) for word, count in rows]
@@ -0,0 +1,253 @@
+import heapq
+import threading
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db.attributed_body import HAS_TEXT, DecodedTextCache
+from app.db.raw import fetch_batches, raw_connection
+from app.db.sidecar import SidecarDB
+from app.db.snapshot import connect_read_only
+from app.db.word_index import iter_texts_in_range, tokenize, top_n
+from app.models.imessage import Message
+
+# handle_id the all-conversations sketch is stored under
+GLOBAL_HANDLE = -1
+
+# New messages grouped by handle, so each handle's summary is loaded and
+# stored once per update however many handles there are
+_SKETCH_SCAN_SQL = (
+    "SELECT ROWID, text, COALESCE(handle_id, 0) AS handle FROM message "
+    f"WHERE ROWID > ? AND ROWID <= ? AND {HAS_TEXT} ORDER BY handle, ROWID"
+)
+
+
+class SpaceSaving:
+    """Space-Saving summary of the most frequent words in fixed memory.
+
+    At most `capacity` words are tracked. Each tracked count overestimates
+    the true count by at most its recorded error, and every error is at
+    most total / capacity, so any word occurring more often than that is
+    guaranteed to be tracked. Summaries built over different messages can
+    be merged into a summary with the same guarantees over all of them.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        """Create an empty summary.
+
+        Args:
+            capacity: Words tracked; the error bound is total / capacity
+        """
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.total = 0
+
+    @property
+    def max_error(self) -> int:
+        """Upper bound on how much any reported count is overestimated."""
+        return max(self.errors.values(), default=0)
+
+    def _floor(self) -> int:
+        # Count any untracked word could have, given that it was evicted
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def merge(self, other: "SpaceSaving") -> None:
+        """Fold another summary into this one."""
+        floor, other_floor = self._floor(), other._floor()
+        counts = {}
+        errors = {}
+        for word in self.counts.keys() | other.counts.keys():
+            counts[word] = self.counts.get(word, floor) + other.counts.get(word, other_floor)
+            errors[word] = self.errors.get(word, floor) + other.errors.get(word, other_floor)
+        if len(counts) > self.capacity:
+            counts = dict(heapq.nlargest(self.capacity, counts.items(), key=itemgetter(1)))
+        self.counts = counts
+        self.errors = {word: errors[word] for word in counts}
+        self.total += other.total
+
+    def update(self, words: Iterable[str]) -> None:
+        """Add words, e.g. the tokens of a batch of messages.
+
+        The batch is counted exactly and then merged, so memory is bounded
+        by the capacity plus the vocabulary of one batch.
+        """
+        batch = Counter(words)
+        # Never full, so words missing from the batch count as zero there
+        exact = SpaceSaving(capacity=len(batch) + 1)
+        exact.counts = dict(batch)
+        exact.errors = dict.fromkeys(batch, 0)
+        exact.total = sum(batch.values())
+        self.merge(exact)
+
+    def top(self, limit: int) -> List[Tuple[str, int]]:
+        """Return the limit words with the highest estimated counts."""
+        return top_n(self.counts, limit)
+
+
+def sketch_words_in_range(
+    db_path: str,
+    low: int,
+    high: int,
+    capacity: int = 1000,
+    batch_size: int = 5000,
+) -> SpaceSaving:
+    """Summarize words in messages with low < ROWID <= high.
+
+    The approximate counterpart of word_index.count_words_in_range(): the
+    result stays capacity-sized however large the range is, so it is also
+    cheap to send back from a worker process.
+    """
+    conn = connect_read_only(db_path)
+    try:
+        sketch = SpaceSaving(capacity)
+        for texts in iter_texts_in_range(conn, low, high, batch_size):
+            sketch.update(word for text in texts for word in tokenize(text))
+        return sketch
+    finally:
+        conn.close()
+
+
+class WordSketchIndex:
+    """Space-Saving summaries per handle and overall, stored in the sidecar.
+
+    Like WordIndex, the summaries are brought up to date by merging in only
+    the messages above the last ROWID summarized, but each one is bounded
+    to `capacity` words however long the history grows. New messages are
+    read one handle at a time, so an update holds just two summaries in
+    memory: the current handle's and the all-conversations one.
+    """
+
+    NAME = "word_sketch"
+
+    def __init__(
+        self,
+        sidecar: SidecarDB,
+        capacity: int = 1000,
+        batch_size: int = 5000,
+        decoded: Optional[DecodedTextCache] = None,
+    ):
+        """Initialize the index, creating its tables if needed.
+
+        Args:
+            sidecar: Sidecar database the summaries are stored in
+            capacity: Words tracked per summary
+            batch_size: Messages tokenized between writes to the sidecar
+            decoded: Cache of attributedBody texts (default: one in the sidecar)
+        """
+        self.sidecar = sidecar
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.decoded = decoded or DecodedTextCache(sidecar, batch_size)
+        self._lock = threading.Lock()
+        with sidecar.connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS word_sketch ("
+                "handle_id INTEGER NOT NULL, "
+                "word TEXT NOT NULL, "
+                "count INTEGER NOT NULL, "
+                "error INTEGER NOT NULL, "
+                "PRIMARY KEY (handle_id, word)) WITHOUT ROWID"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS word_sketch_totals ("
+                "handle_id INTEGER PRIMARY KEY, "
+                "capacity INTEGER NOT NULL, "
+                "total INTEGER NOT NULL)"
+            )
+
+    def update(self, session: Session, blocking: bool = True) -> int:
+        """Merge every message added since the last update into the summaries.
+
+        Args:
+            session: Session on the iMessage database to read new messages from
+            blocking: Wait for an update running elsewhere; if False, raise
+                SidecarBusy instead
+
+        Returns:
+            Number of messages summarized
+        """
+        self.decoded.update(session, blocking)
+        with self.sidecar.write(self._lock, blocking) as conn:
+            last_rowid = self.sidecar.get_high_water(conn, self.NAME)
+            max_rowid = session.query(func.max(Message.id)).scalar() or 0
+            stored_capacity = conn.execute(
+                "SELECT MIN(capacity) FROM word_sketch_totals"
+            ).fetchone()[0]
+            if max_rowid < last_rowid or stored_capacity not in (None, self.capacity):
+                # The source database was replaced or the error bound changed
+                conn.execute("DELETE FROM word_sketch")
+                conn.execute("DELETE FROM word_sketch_totals")
+                last_rowid = 0
+            if max_rowid == last_rowid:
+                return 0
+
+            batches = fetch_batches(
+                raw_connection(session), _SKETCH_SCAN_SQL, (last_rowid, max_rowid), self.batch_size
+            )
+
+            overall = self._load(conn, GLOBAL_HANDLE)
+            current: Optional[Tuple[int, SpaceSaving]] = None
+            summarized = 0
+            for rows in batches:
+                rows = self.decoded.fill(rows)
+                summarized += len(rows)
+                batch_words: List[str] = []
+                for handle_id, group in groupby(rows, key=itemgetter(2)):
+                    words = [word for _, text, _ in group for word in tokenize(text)]
+                    if current is None or current[0] != handle_id:
+                        if current is not None:
+                            self._store(conn, *current)
+                        current = (handle_id, self._load(conn, handle_id))
+                    current[1].update(words)
+                    batch_words.extend(words)
+                overall.update(batch_words)
+
+            if current is not None:
+                self._store(conn, *current)
+            self._store(conn, GLOBAL_HANDLE, overall)
+            self.sidecar.set_high_water(conn, self.NAME, max_rowid)
+            return summarized
+
+    def _load(self, conn, handle_id: int) -> SpaceSaving:
+        sketch = SpaceSaving(self.capacity)
+        for word, count, error in conn.execute(
+            "SELECT word, count, error FROM word_sketch WHERE handle_id = ?", (handle_id,)
+        ):
+            sketch.counts[word] = count
+            sketch.errors[word] = error
+        row = conn.execute(
+            "SELECT total FROM word_sketch_totals WHERE handle_id = ?", (handle_id,)
+        ).fetchone()
+        sketch.total = row[0] if row else 0
+        return sketch
+
+    def _store(self, conn, handle_id: int, sketch: SpaceSaving) -> None:
+        conn.execute("DELETE FROM word_sketch WHERE handle_id = ?", (handle_id,))
+        conn.executemany(
+            "INSERT INTO word_sketch (handle_id, word, count, error) VALUES (?, ?, ?, ?)",
+            ((handle_id, word, count, sketch.errors[word]) for word, count in sketch.counts.items())
+        )
+        conn.execute(
+            "INSERT INTO word_sketch_totals (handle_id, capacity, total) VALUES (?, ?, ?) "
+            "ON CONFLICT(handle_id) DO UPDATE SET capacity = excluded.capacity, total = excluded.total",
+            (handle_id, self.capacity, sketch.total)
+        )
+
+    def sketch(self, handle_ids: Optional[Sequence[int]] = None) -> SpaceSaving:
+        """Return the merged summary of some handles, or of every message.
+
+        Args:
+            handle_ids: Handle ROWIDs to combine (None for all conversations)
+        """
+        with self.sidecar.connect() as conn:
+            if handle_ids is None:
+                return self._load(conn, GLOBAL_HANDLE)
+            merged = SpaceSaving(self.capacity)
+            for handle_id in handle_ids:
+                merged.merge(self._load(conn, handle_id))
+            return merged
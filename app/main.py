@@ -1,15 +1,85 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
+from app.core.auth_cache import revoked_tokens
+from app.core.metrics import MetricsMiddleware, metrics_endpoint
 from app.core.settings import settings
 from app.api.v1 import api_router
+from app.db.imessage import IMessageDB, open_shared_db, close_shared_db
+import asyncio
+import logging
+import threading
 import uvicorn
 import secrets
 
+logger = logging.getLogger(__name__)
+
+
+def _refresh_indexes(db: IMessageDB) -> None:
+    """Build or catch up the sidecar indexes, logging rather than raising."""
+    try:
+        db.refresh_indexes()
+    except Exception as e:
+        logger.warning("Sidecar index refresh failed: %s", e)
+
+
+async def _cancel(task: asyncio.Future) -> None:
+    """Cancel a background task and wait until it has stopped."""
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the shared iMessage connection pool for the app's lifetime."""
+    indexing = None
+    syncing = None
+    # Revocations made by other API processes, applied as they are published
+    revocations = asyncio.ensure_future(revoked_tokens.listen())
+    if settings.IMESSAGE_ACCESS_MODE != "copy":
+        try:
+            db = open_shared_db()
+            # Built on a thread of its own, so it never occupies a request
+            # worker; requests scan chat.db until each index is ready
+            indexing = threading.Thread(
+                target=_refresh_indexes, args=(db,), name="sidecar-index", daemon=True
+            )
+            indexing.start()
+        except FileNotFoundError as e:
+            # Requests will retry the open and answer 503 until it exists
+            logger.warning("iMessage database unavailable at startup: %s", e)
+    if settings.SYNC_ENABLED:
+        from app.services.sync import create_sync_service
+        try:
+            # Creates the mirror tables, so it is kept off the event loop
+            service = await asyncio.to_thread(create_sync_service)
+        except FileNotFoundError as e:
+            logger.warning("Message sync disabled, iMessage database unavailable: %s", e)
+        else:
+            syncing = asyncio.ensure_future(
+                service.run_forever(settings.SYNC_INTERVAL_MINUTES * 60)
+            )
+    yield
+    await _cancel(revocations)
+    if syncing is not None:
+        # Returns once a pass in progress has stopped reading the shared accessor
+        await _cancel(syncing)
+    if indexing is not None and indexing.is_alive():
+        # Not waited for: each index commits in a single transaction, so an
+        # interrupted build leaves its index at the last committed mark
+        logger.info("Shutting down before the sidecar index build finished")
+    close_shared_db()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # Set up Session middleware (needed for OAuth)
@@ -28,8 +98,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Time every request and collect its per-phase spans
+app.add_middleware(MetricsMiddleware)
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+# Prometheus scrape endpoint
+app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
+
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=9000, reload=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, LargeBinary, Table
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -38,6 +38,7 @@ class Message(Base):
     id = Column('ROWID', Integer, primary_key=True)
     guid = Column(Text, nullable=False)
     text = Column(Text)
+    attributed_body = Column('attributedBody', LargeBinary)  # typedstream; text is often NULL
     handle_id = Column(Integer, ForeignKey('handle.ROWID'))
     date = Column(Integer)  # Unix timestamp
     date_read = Column(Integer)
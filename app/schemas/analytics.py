@@ -1,5 +1,9 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Upper bound on contacts per batch stats request
+MAX_BATCH_CONTACTS = 1000
 
 class MessageStats(BaseModel):
     sent: int
@@ -10,4 +14,73 @@ class WordFrequency(BaseModel):
     count: int
 
 class WordFrequencyList(BaseModel):
-    frequencies: List[WordFrequency]
\ No newline at end of file
+    frequencies: List[WordFrequency]
+
+class ChatStats(BaseModel):
+    sent: int
+    received: int
+    participants: int
+
+class ChatParticipant(BaseModel):
+    handle_id: int
+    contact_id: str
+    service: Optional[str] = None
+    messages: int
+
+class ChatParticipants(BaseModel):
+    participants: List[ChatParticipant]
+
+class ContactLeaderboardEntry(BaseModel):
+    contact_id: str
+    messages: int
+    sent: int
+    received: int
+    first_message: Optional[datetime] = None
+    last_message: Optional[datetime] = None
+    messages_per_day: float
+    average_length: Optional[float] = None
+
+class ContactLeaderboard(BaseModel):
+    contacts: List[ContactLeaderboardEntry]
+
+class ContactStatsBatchRequest(BaseModel):
+    contact_ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_CONTACTS)
+
+class ContactStatsBatch(BaseModel):
+    stats: Dict[str, MessageStats]
+
+class MessagePage(BaseModel):
+    messages: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+class ActivityHistogram(BaseModel):
+    bucket: str
+    timezone: str
+    starts: List[datetime]
+    sent: List[int]
+    received: List[int]
+
+class ReplyLatency(BaseModel):
+    count: int
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p99: Optional[float] = None
+
+class ResponseTimes(BaseModel):
+    me: ReplyLatency
+    them: ReplyLatency
+
+class ResponseTimesByContact(BaseModel):
+    contacts: Dict[str, ResponseTimes]
+
+class SearchResult(BaseModel):
+    id: int
+    handle_id: Optional[int] = None
+    date: Optional[datetime] = None
+    is_from_me: Optional[int] = None
+    snippet: str
+    rank: float
+
+class SearchResults(BaseModel):
+    results: List[SearchResult]
+    next_cursor: Optional[str] = None
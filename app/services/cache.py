@@ -0,0 +1,182 @@
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.core.cache import LRUCache
+from app.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - redis is in requirements.txt
+    aioredis = None
+
+_MISSING = object()
+
+
+class ResponseCache:
+    """Cache for analytics results keyed by database version.
+
+    Every key embeds the version of chat.db the result was computed from, so
+    a snapshot refresh can never serve stale results. Entries for older
+    versions are never read again and simply expire after the TTL; only the
+    in-process LRU is pruned when a new version is seen, since other
+    processes sharing Redis may still be serving the previous one. Results
+    are stored in Redis when REDIS_URL is reachable and in an in-process LRU
+    otherwise (or if Redis fails later on).
+    """
+
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        ttl: int = 300,
+        max_entries: int = 1024,
+        prefix: str = "msg-api:analytics:",
+        enabled: bool = True,
+    ):
+        """Initialize the cache.
+
+        Args:
+            redis_url: Redis connection URL. If empty, only the LRU is used.
+            ttl: Lifetime of cached results in seconds
+            max_entries: Size of the in-process LRU fallback
+            prefix: Namespace for Redis keys
+            enabled: If False, every lookup is a miss and nothing is stored
+        """
+        self.redis_url = redis_url
+        self.ttl = ttl
+        self.prefix = prefix
+        self.enabled = enabled
+        self.local = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+        self._redis = None
+        self._redis_checked = not (redis_url and aioredis is not None)
+        self._version: Optional[str] = None
+
+    @property
+    def backend(self) -> str:
+        """Name of the backend currently in use."""
+        return "redis" if self._redis is not None else "memory"
+
+    def make_key(self, namespace: str, version: str, params: Dict[str, Any]) -> str:
+        """Build a cache key from an endpoint namespace, version and parameters."""
+        encoded = json.dumps(params, sort_keys=True, default=str)
+        digest = hashlib.sha1(encoded.encode()).hexdigest()
+        return f"{self.prefix}{version}:{namespace}:{digest}"
+
+    async def get_or_compute(
+        self,
+        namespace: str,
+        get_version: Callable[[], Awaitable[str]],
+        params: Dict[str, Any],
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Return a cached result or compute, store and return it.
+
+        The version is read again once the result is computed, and the
+        result is only stored if it has not changed in between: otherwise it
+        may have been computed from the newer data.
+
+        Args:
+            namespace: Name of the cached operation, e.g. "word-frequency"
+            get_version: Coroutine factory returning the current database version
+            params: Parameters that distinguish results of the operation
+            compute: Coroutine factory producing the JSON-serializable result
+        """
+        if not self.enabled:
+            return await compute()
+
+        version = await get_version()
+        if version != self._version:
+            self.invalidate(keep_version=version)
+
+        key = self.make_key(namespace, version, params)
+        value = await self._get(key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = await compute()
+        if await get_version() == version:
+            await self._set(key, value)
+        return value
+
+    def invalidate(self, keep_version: Optional[str] = None) -> None:
+        """Delete results held in memory, keeping only those for keep_version.
+
+        Redis entries are left to expire: other processes may still be
+        serving an older version and would keep deleting each other's results.
+        """
+        self._version = keep_version
+        keep = f"{self.prefix}{keep_version}:" if keep_version else None
+        self.local.delete_where(lambda key: keep is None or not key.startswith(keep))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the active backend."""
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "local_entries": len(self.local),
+            "version": self._version,
+        }
+
+    async def _client(self):
+        if not self._redis_checked:
+            self._redis_checked = True
+            try:
+                client = aioredis.from_url(self.redis_url)
+                await client.ping()
+                self._redis = client
+            except Exception as e:
+                logger.info("Redis unavailable, caching in memory: %s", e)
+        return self._redis
+
+    def _redis_failed(self, error: Exception) -> None:
+        logger.warning("Redis cache error, falling back to memory: %s", error)
+        self._redis = None
+
+    async def _get(self, key: str) -> Any:
+        client = await self._client()
+        if client is None:
+            return self.local.get(key, _MISSING)
+        try:
+            raw = await client.get(key)
+        except Exception as e:
+            self._redis_failed(e)
+            return self.local.get(key, _MISSING)
+        return _MISSING if raw is None else json.loads(raw)
+
+    async def _set(self, key: str, value: Any) -> None:
+        client = await self._client()
+        if client is None:
+            self.local.set(key, value)
+            return
+        try:
+            await client.set(key, json.dumps(value), ex=self.ttl)
+        except Exception as e:
+            self._redis_failed(e)
+            self.local.set(key, value)
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """Return the process-wide analytics response cache."""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache(
+            redis_url=settings.REDIS_URL,
+            ttl=settings.CACHE_TTL_SECONDS,
+            max_entries=settings.CACHE_MAX_ENTRIES,
+            enabled=settings.CACHE_ENABLED,
+        )
+    return _response_cache
@@ -0,0 +1,243 @@
+"""
+Columnar export of chat.db tables to Arrow IPC streams or Parquet files.
+
+Rows are read from the current snapshot batch_size at a time and converted
+to Arrow record batches (one Parquet row group each), so whole-database
+dumps run in bounded memory. Apple-epoch dates become UTC timestamps and
+low-cardinality columns (handle_id, service) are dictionary-encoded.
+
+Run as a command to dump every table into a directory:
+
+    python -m app.services.export ./export --format parquet
+    python -m app.services.export ./export --table message --batch-size 100000
+"""
+
+import argparse
+import io
+import logging
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from app.core.settings import settings
+from app.db.dates import apple_to_unix_micros
+from app.db.errors import InvalidArgument
+from app.db.imessage import IMessageDB
+from app.models.imessage import Base
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow is in requirements.txt
+    pa = None
+    pq = None
+
+EXPORT_TABLES = ("message", "handle", "chat", "chat_message_join", "chat_handle_join")
+EXPORT_FORMATS = {
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# Apple-epoch integer columns exported as timestamp[us, UTC]
+TIMESTAMP_COLUMNS = {
+    "message": {"date", "date_read", "date_delivered"},
+    "chat_message_join": {"message_date"},
+}
+
+# Columns with few distinct values, exported dictionary-encoded
+DICTIONARY_COLUMNS = {
+    "message": {"handle_id"},
+    "handle": {"service"},
+    "chat": {"service_name"},
+}
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise RuntimeError("Exporting requires pyarrow (pip install pyarrow)")
+
+
+def _column_type(table_name: str, column) -> "pa.DataType":
+    if column.name in TIMESTAMP_COLUMNS.get(table_name, ()):
+        value_type = pa.timestamp("us", tz="UTC")
+    elif column.type.python_type is int:
+        value_type = pa.int64()
+    elif column.type.python_type is bytes:
+        value_type = pa.binary()
+    else:
+        value_type = pa.string()
+    if column.name in DICTIONARY_COLUMNS.get(table_name, ()):
+        return pa.dictionary(pa.int32(), value_type)
+    return value_type
+
+
+def table_schema(table_name: str) -> "pa.Schema":
+    """Return the Arrow schema a table is exported with.
+
+    Column names match chat.db, not the ORM attribute names.
+    """
+    _require_pyarrow()
+    table = Base.metadata.tables[table_name]
+    return pa.schema([
+        pa.field(column.name, _column_type(table_name, column))
+        for column in table.columns
+    ])
+
+
+def to_record_batch(table_name: str, schema: "pa.Schema", rows: Sequence[Sequence]) -> "pa.RecordBatch":
+    """Convert row tuples from IMessageDB.iter_table_rows() to a record batch."""
+    timestamps = TIMESTAMP_COLUMNS.get(table_name, ())
+    arrays = []
+    for index, field in enumerate(schema):
+        values: List = [row[index] for row in rows]
+        if field.name in timestamps:
+            values = [apple_to_unix_micros(value) for value in values]
+        if pa.types.is_dictionary(field.type):
+            array = pa.array(values, type=field.type.value_type).dictionary_encode()
+        else:
+            array = pa.array(values, type=field.type)
+        arrays.append(array)
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last drain.
+
+    tell() keeps counting across drains, which the Parquet writer relies on
+    to record row group offsets.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _open_writer(sink, schema: "pa.Schema", format: str):
+    if format == "arrow":
+        return pa.ipc.new_stream(sink, schema)
+    return pq.ParquetWriter(sink, schema)
+
+
+def iter_export_chunks(
+    table_name: str,
+    batches: Iterable[Sequence[Sequence]],
+    format: str = "parquet",
+) -> Iterator[bytes]:
+    """Encode batches of rows as a stream of Arrow IPC or Parquet bytes.
+
+    Each batch is written as one record batch (or row group) and the bytes
+    produced so far are yielded before the next batch is read, so the
+    output can be sent over HTTP while the export is still running.
+
+    Args:
+        table_name: Table the rows come from
+        batches: Row batches, e.g. from IMessageDB.iter_table_rows()
+        format: "arrow" (IPC stream) or "parquet"
+
+    Raises:
+        InvalidArgument: If the table or format is unknown
+        RuntimeError: If pyarrow is not installed
+    """
+    _require_pyarrow()
+    if table_name not in EXPORT_TABLES:
+        raise InvalidArgument(f"Unknown table: {table_name}")
+    if format not in EXPORT_FORMATS:
+        raise InvalidArgument(f"Unknown export format: {format}")
+    # Validated before the first chunk is requested, so callers can still
+    # turn errors into a proper response
+    return _encode_chunks(table_name, batches, format)
+
+
+def _encode_chunks(table_name: str, batches: Iterable[Sequence[Sequence]], format: str) -> Iterator[bytes]:
+    schema = table_schema(table_name)
+    sink = _ChunkSink()
+    writer = _open_writer(pa.PythonFile(sink, mode="w"), schema, format)
+    try:
+        for rows in batches:
+            if rows:
+                writer.write_batch(to_record_batch(table_name, schema, rows))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+        # Release the snapshot lease promptly if the export is abandoned
+        close = getattr(batches, "close", None)
+        if close is not None:
+            close()
+    yield sink.drain()
+
+
+def export_tables(
+    imessage: IMessageDB,
+    output_dir: str,
+    tables: Sequence[str] = EXPORT_TABLES,
+    format: str = "parquet",
+    batch_size: Optional[int] = None,
+) -> Dict[str, str]:
+    """Export tables from a connected IMessageDB into files in output_dir.
+
+    Args:
+        imessage: Connected IMessageDB to read from
+        output_dir: Directory the files are written to (created if needed)
+        tables: Tables to export
+        format: "arrow" or "parquet"
+        batch_size: Rows per record batch / row group
+
+    Returns:
+        Dict mapping each table name to the file it was written to
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    extension = EXPORT_FORMATS[format][1]
+    paths = {}
+    for table_name in tables:
+        path = os.path.join(output_dir, f"{table_name}.{extension}")
+        with open(path, "wb") as f:
+            rows = imessage.iter_table_rows(table_name, batch_size)
+            for chunk in iter_export_chunks(table_name, rows, format):
+                f.write(chunk)
+        paths[table_name] = path
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export chat.db tables to Arrow/Parquet")
+    parser.add_argument("output_dir", help="directory to write one file per table to")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="parquet")
+    parser.add_argument("--table", action="append", choices=EXPORT_TABLES,
+                        help="table to export (repeatable; default: all)")
+    parser.add_argument("--batch-size", type=int, default=settings.EXPORT_BATCH_SIZE,
+                        help="rows per record batch / row group")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    started = time.perf_counter()
+    with IMessageDB(mode=settings.IMESSAGE_ACCESS_MODE, snapshot_dir=settings.IMESSAGE_SNAPSHOT_DIR) as db:
+        paths = export_tables(db, args.output_dir, args.table or EXPORT_TABLES, args.format, args.batch_size)
+    for table_name, path in paths.items():
+        logger.info("Exported %s to %s (%d bytes)", table_name, path, os.path.getsize(path))
+    logger.info("Export finished in %.1fs", time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Incremental sync of chat.db into the server database mirror models.
+
+New iMessage rows are found by ROWID above the highest messages.imessage_id
+already mirrored, copied over in batches, and folded into the per-contact
+totals and word counts. Each batch commits on its own, so an interrupted
+sync resumes where it stopped.
+
+Run inside the API (SYNC_ENABLED=true) or as a standalone worker:
+
+    python -m app.services.sync          # sync every SYNC_INTERVAL_MINUTES
+    python -m app.services.sync --once   # sync once and exit
+"""
+
+import argparse
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.core.settings import settings
+from app.db.attributed_body import message_text
+from app.db.dates import APPLE_EPOCH, apple_to_datetime
+from app.db.handles import normalize_contact_id
+from app.db.imessage import IMessageDB
+from app.db.word_index import tokenize
+from app.models.imessage import Handle, Message
+from app.models.message import Contact, Message as MirroredMessage, MessageAnalytics
+
+logger = logging.getLogger(__name__)
+
+# (ROWID, handle.id, text, attributedBody, date, is_from_me) as read from chat.db
+SourceRow = Tuple[int, Optional[str], Optional[str], Optional[bytes], Optional[int], Optional[int]]
+
+
+class MessageSyncService:
+    """Copies new chat.db messages into the Contact/Message/MessageAnalytics tables."""
+
+    def __init__(
+        self,
+        imessage: IMessageDB,
+        session_factory: Callable[[], Session],
+        batch_size: int = 5000,
+    ):
+        """Initialize the service.
+
+        Args:
+            imessage: Connected accessor to read chat.db from
+            session_factory: Creates sessions on the server database
+            batch_size: Messages copied and committed per batch
+        """
+        self.imessage = imessage
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        # Set when run_forever() is cancelled; a pass stops after its batch
+        self._stopping = threading.Event()
+
+    def sync_once(self) -> int:
+        """Mirror every message added since the last sync.
+
+        Messages without a handle (e.g. ones you sent to a group chat) have
+        no Contact to belong to and are not mirrored.
+
+        Returns:
+            Number of messages inserted
+        """
+        with self.session_factory() as target:
+            high_water = target.query(func.max(MirroredMessage.imessage_id)).scalar() or 0
+
+            inserted = 0
+            with self.imessage.session() as source:
+                rows = source.execute(
+                    select(
+                        Message.id,
+                        Handle.contact_id,
+                        Message.text,
+                        Message.attributed_body,
+                        Message.date,
+                        Message.is_from_me
+                    )
+                    .join(Handle, Message.handle_id == Handle.id)
+                    .where(Message.id > high_water)
+                    .order_by(Message.id)
+                    .execution_options(yield_per=self.batch_size)
+                )
+                for batch in rows.partitions():
+                    if self._stopping.is_set():
+                        break
+                    inserted += self._sync_batch(target, batch)
+                    target.commit()
+            return inserted
+
+    def _sync_batch(self, target: Session, batch: List[SourceRow]) -> int:
+        contact_ids = self._get_or_create_contacts(
+            target, {normalize_contact_id(row[1], settings.DEFAULT_COUNTRY_CODE) for row in batch}
+        )
+
+        messages = []
+        totals: Counter = Counter()
+        last_dates: Dict[int, datetime] = {}
+        words: Dict[int, Counter] = {}
+        for rowid, handle, text, attributed_body, date, is_from_me in batch:
+            text = message_text(text, attributed_body)
+            contact_id = contact_ids[normalize_contact_id(handle, settings.DEFAULT_COUNTRY_CODE)]
+            sent_at = (apple_to_datetime(date) or APPLE_EPOCH).replace(tzinfo=None)
+            messages.append({
+                "imessage_id": rowid,
+                "contact_id": contact_id,
+                "text": text,
+                "date": sent_at,
+                "is_from_me": is_from_me or 0,
+            })
+            totals[contact_id] += 1
+            if contact_id not in last_dates or sent_at > last_dates[contact_id]:
+                last_dates[contact_id] = sent_at
+            if text:
+                words.setdefault(contact_id, Counter()).update(tokenize(text))
+
+        # One executemany for the whole batch
+        target.execute(insert(MirroredMessage), messages)
+        self._update_contacts(target, totals, last_dates)
+        self._update_word_counts(target, words)
+        return len(messages)
+
+    def _get_or_create_contacts(self, target: Session, handles: set) -> Dict[str, int]:
+        existing = dict(
+            target.query(Contact.handle_id, Contact.id).filter(Contact.handle_id.in_(handles))
+        )
+        missing = handles - existing.keys()
+        if missing:
+            target.execute(insert(Contact), [
+                {
+                    "handle_id": handle,
+                    "email": handle if "@" in handle else None,
+                    "phone_number": None if "@" in handle else handle,
+                    "total_messages": 0,
+                }
+                for handle in missing
+            ])
+            existing.update(
+                target.query(Contact.handle_id, Contact.id).filter(Contact.handle_id.in_(missing))
+            )
+        return existing
+
+    def _update_contacts(self, target: Session, totals: Counter, last_dates: Dict[int, datetime]) -> None:
+        current = {
+            contact_id: (total or 0, last_date)
+            for contact_id, total, last_date in target.query(
+                Contact.id, Contact.total_messages, Contact.last_message_date
+            ).filter(Contact.id.in_(totals))
+        }
+        target.execute(update(Contact), [
+            {
+                "id": contact_id,
+                "total_messages": current[contact_id][0] + count,
+                "last_message_date": max(
+                    filter(None, [current[contact_id][1], last_dates[contact_id]])
+                ),
+            }
+            for contact_id, count in totals.items()
+        ])
+
+    def _update_word_counts(self, target: Session, words: Dict[int, Counter]) -> None:
+        updates = []
+        inserts = []
+        for contact_id, counts in words.items():
+            vocabulary = list(counts)
+            # Only look up the words seen in this batch, in chunks that stay
+            # below bound-parameter limits
+            for start in range(0, len(vocabulary), 500):
+                chunk = vocabulary[start:start + 500]
+                existing = {
+                    word: (row_id, frequency)
+                    for row_id, word, frequency in target.query(
+                        MessageAnalytics.id, MessageAnalytics.word, MessageAnalytics.frequency
+                    ).filter(
+                        MessageAnalytics.contact_id == contact_id,
+                        MessageAnalytics.word.in_(chunk)
+                    )
+                }
+                for word in chunk:
+                    if word in existing:
+                        row_id, frequency = existing[word]
+                        updates.append({"id": row_id, "frequency": (frequency or 0) + counts[word]})
+                    else:
+                        inserts.append({"contact_id": contact_id, "word": word, "frequency": counts[word]})
+
+        if updates:
+            target.execute(update(MessageAnalytics), updates)
+        if inserts:
+            target.execute(insert(MessageAnalytics), inserts)
+
+    async def run_forever(self, interval_seconds: float) -> None:
+        """Sync every interval_seconds until cancelled.
+
+        The sync itself runs in a separate thread so it never blocks the
+        event loop or occupies the request worker pool. When cancelled
+        mid-pass, the pass stops after the batch it is on, and the
+        cancellation only propagates once it has, so the caller can then
+        close the iMessage accessor safely.
+        """
+        self._stopping.clear()
+        while True:
+            running = asyncio.ensure_future(asyncio.to_thread(self.sync_once))
+            try:
+                inserted = await asyncio.shield(running)
+                if inserted:
+                    logger.info("Synced %d new messages", inserted)
+            except asyncio.CancelledError:
+                self._stopping.set()
+                await asyncio.wait([running])
+                raise
+            except Exception as e:
+                logger.warning("Message sync failed: %s", e)
+            await asyncio.sleep(interval_seconds)
+
+
+def create_sync_service() -> MessageSyncService:
+    """Build a sync service over the shared iMessage accessor and DATABASE_URL.
+
+    Creates the mirror tables if they do not exist yet.
+    """
+    # Imported here so the API does not need a server database driver
+    # unless syncing is enabled
+    from app.db.imessage import get_shared_db
+    from app.db.session import SessionLocal, engine
+    from app.models.base import Base
+
+    Base.metadata.create_all(engine)
+    return MessageSyncService(get_shared_db(), SessionLocal, batch_size=settings.SYNC_BATCH_SIZE)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sync chat.db into the server database")
+    parser.add_argument("--once", action="store_true", help="sync once and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    service = create_sync_service()
+    while True:
+        started = time.perf_counter()
+        inserted = service.sync_once()
+        logger.info("Synced %d messages in %.1fs", inserted, time.perf_counter() - started)
+        if args.once:
+            break
+        time.sleep(settings.SYNC_INTERVAL_MINUTES * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Most common words across every conversation in chat.db.
+
+Tokenizes the message table in parallel over ROWID ranges and merges the
+partial counts (see IMessageDB.get_global_word_frequency):
+
+    python -m app.services.word_frequency --limit 25
+    python -m app.services.word_frequency --workers 8 --partitions 64
+"""
+
+import argparse
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.core.settings import settings
+from app.db.imessage import IMessageDB
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Most common words across all conversations")
+    parser.add_argument("--limit", type=int, default=20, help="number of words to print")
+    parser.add_argument("--workers", type=int, default=settings.IMESSAGE_PROCESS_WORKERS,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--partitions", type=int, default=None,
+                        help="ROWID ranges to split the message table into (default: 4 per CPU)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=args.workers or None,
+        mp_context=multiprocessing.get_context("spawn")
+    ) as pool, IMessageDB(mode=settings.IMESSAGE_ACCESS_MODE, snapshot_dir=settings.IMESSAGE_SNAPSHOT_DIR) as db:
+        frequencies = db.get_global_word_frequency(args.limit, pool=pool, partitions=args.partitions)
+    logger.info("Counted words in %.1fs", time.perf_counter() - started)
+
+    for word, count in frequencies:
+        print(f"{count:>10}  {word}")
+
+
+if __name__ == "__main__":
+    main()
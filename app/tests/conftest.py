@@ -0,0 +1,22 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine
+
+from app.models.imessage import Base
+
+# 2024-01-01 00:00:00 UTC in Apple-epoch nanoseconds
+JAN_1_2024 = 725760000 * 10 ** 9
+
+
+@pytest.fixture
+def empty_chat_db():
+    """Create a chat.db file with the iMessage schema and no rows."""
+    db_fd, db_path = tempfile.mkstemp()
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    yield db_path
+    os.close(db_fd)
+    os.unlink(db_path)
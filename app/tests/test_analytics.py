@@ -1,33 +1,41 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import AsyncMock
 from app.main import app
-from app.schemas.analytics import MessageStats, WordFrequency, WordFrequencyList
+from app.api.v1.endpoints.analytics import get_imessage
+from app.db.executor import IMessageDBBusy
+from app.db.errors import InvalidArgument
+from app.db.search_index import SearchUnavailable
+from app.services.cache import ResponseCache, get_response_cache
 from app.tests.utils import mock_auth_dependencies
 
 client = TestClient(app)
 
 @pytest.fixture
 def mock_imessage_db():
-    """Mock the IMessageDB class."""
-    with patch('app.api.v1.endpoints.analytics.IMessageDB') as mock:
-        # Configure the mock
-        instance = mock.return_value.__enter__.return_value
-        
-        # Mock message count method
-        instance.get_message_count_by_contact.return_value = {
-            "sent": 42,
-            "received": 24
-        }
-        
-        # Mock word frequency method
-        instance.get_word_frequency.return_value = [
-            ("hello", 10),
-            ("world", 8),
-            ("test", 5)
-        ]
-        
-        yield mock
+    """Mock the iMessage accessor dependency."""
+    instance = AsyncMock()
+    
+    # Mock message count method
+    instance.get_message_count_by_contact.return_value = {
+        "sent": 42,
+        "received": 24
+    }
+    
+    # Mock word frequency method
+    instance.get_word_frequency.return_value = [
+        ("hello", 10),
+        ("world", 8),
+        ("test", 5)
+    ]
+    
+    instance.get_version.return_value = "v1"
+    
+    app.dependency_overrides[get_imessage] = lambda: instance
+    app.dependency_overrides[get_response_cache] = lambda: ResponseCache(enabled=False)
+    yield instance
+    app.dependency_overrides.pop(get_imessage, None)
+    app.dependency_overrides.pop(get_response_cache, None)
 
 
 
@@ -55,7 +63,7 @@ def test_get_word_frequency(mock_imessage_db, mock_auth_dependencies):
 def test_get_word_frequency_with_limit(mock_imessage_db, mock_auth_dependencies):
     """Test getting word frequency with custom limit."""
     # Configure mock to return only 2 items
-    mock_instance = mock_imessage_db.return_value.__enter__.return_value
+    mock_instance = mock_imessage_db
     mock_instance.get_word_frequency.return_value = [
         ("hello", 10),
         ("world", 8)
@@ -71,9 +79,14 @@ def test_get_word_frequency_with_limit(mock_imessage_db, mock_auth_dependencies)
     assert frequencies[0] == {"word": "hello", "count": 10}
     assert frequencies[1] == {"word": "world", "count": 8}
 
+    # A negative LIMIT would return the whole vocabulary from the index
+    for limit in (-1, 0, 1001):
+        response = client.get(f"/api/v1/analytics/contacts/+1234567890/word-frequency?limit={limit}")
+        assert response.status_code == 422
+
 def test_contact_not_found(mock_imessage_db, mock_auth_dependencies):
     """Test behavior when contact is not found."""
-    mock_db_instance = mock_imessage_db.return_value.__enter__.return_value
+    mock_db_instance = mock_imessage_db
     mock_db_instance.get_message_count_by_contact.return_value = {"sent": 0, "received": 0}
     mock_db_instance.get_word_frequency.return_value = []
     
@@ -87,13 +100,35 @@ def test_contact_not_found(mock_imessage_db, mock_auth_dependencies):
 
 def test_database_error(mock_imessage_db, mock_auth_dependencies):
     """Test handling of database errors."""
-    mock_db_instance = mock_imessage_db.return_value.__enter__.return_value
+    mock_db_instance = mock_imessage_db
     mock_db_instance.get_message_count_by_contact.side_effect = FileNotFoundError("DB not found")
     
     response = client.get("/api/v1/analytics/contacts/+1234567890/stats")
     assert response.status_code == 503
     assert "iMessage database not accessible" in response.json()["detail"]
 
+def test_database_busy(mock_imessage_db, mock_auth_dependencies):
+    """Test that a saturated worker pool answers 503 with Retry-After."""
+    mock_imessage_db.get_word_frequency.side_effect = IMessageDBBusy("saturated")
+    
+    response = client.get("/api/v1/analytics/contacts/+1234567890/word-frequency")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+def test_errors_map_to_status_codes(mock_imessage_db, mock_auth_dependencies):
+    """Test that every endpoint maps data errors the same way."""
+    url = "/api/v1/analytics/chats/1/stats"
+    for error, status in [
+        (InvalidArgument("bad chat"), 400),
+        (ValueError("internal"), 500),
+        (SearchUnavailable(), 503),
+        (FileNotFoundError(), 503),
+        (RuntimeError("boom"), 500),
+    ]:
+        mock_imessage_db.get_chat_stats.side_effect = error
+        assert client.get(url).status_code == status
+    assert client.get(url).json()["detail"] == "Error accessing message data: boom"
+
 def test_unauthorized_access(mock_imessage_db):
     """Test that endpoints require authentication."""
     # Test without auth dependencies mocked
@@ -101,4 +136,303 @@ def test_unauthorized_access(mock_imessage_db):
     assert response.status_code == 401
     
     response = client.get("/api/v1/analytics/contacts/+1234567890/word-frequency")
-    assert response.status_code == 401
\ No newline at end of file
+    assert response.status_code == 401
+
+
+def test_get_contact_stats_batch(mock_imessage_db, mock_auth_dependencies):
+    """Test getting message statistics for several contacts at once."""
+    mock_imessage_db.get_message_counts_by_contacts.return_value = {
+        "+1234567890": {"sent": 42, "received": 24},
+        "nonexistent": {"sent": 0, "received": 0}
+    }
+    
+    response = client.post(
+        "/api/v1/analytics/contacts/stats:batch",
+        json={"contact_ids": ["+1234567890", "nonexistent"]}
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "stats": {
+            "+1234567890": {"sent": 42, "received": 24},
+            "nonexistent": {"sent": 0, "received": 0}
+        }
+    }
+    mock_imessage_db.get_message_counts_by_contacts.assert_awaited_once_with(
+        ["+1234567890", "nonexistent"]
+    )
+
+def test_get_contact_stats_batch_validation(mock_imessage_db, mock_auth_dependencies):
+    """Test that empty batches are rejected."""
+    response = client.post("/api/v1/analytics/contacts/stats:batch", json={"contact_ids": []})
+    assert response.status_code == 422
+
+def test_responses_are_cached_per_version(mock_imessage_db, mock_auth_dependencies):
+    """Test that repeated requests are served from cache until the version changes."""
+    cache = ResponseCache(redis_url=None)
+    app.dependency_overrides[get_response_cache] = lambda: cache
+    url = "/api/v1/analytics/contacts/+1234567890/stats"
+    
+    assert client.get(url).json() == {"sent": 42, "received": 24}
+    mock_imessage_db.get_message_count_by_contact.return_value = {"sent": 1, "received": 1}
+    assert client.get(url).json() == {"sent": 42, "received": 24}
+    assert mock_imessage_db.get_message_count_by_contact.await_count == 1
+    assert cache.stats()["hits"] == 1
+    
+    # A new database version invalidates the cached result
+    mock_imessage_db.get_version.return_value = "v2"
+    assert client.get(url).json() == {"sent": 1, "received": 1}
+    assert cache.stats()["misses"] == 2
+
+@pytest.fixture
+def real_imessage_db(tmp_path):
+    """Serve a small chat.db through the real accessor."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.db.executor import BoundedExecutor
+    from app.db.imessage import AsyncIMessageDB, IMessageDB
+    from app.models.imessage import Base, Handle, Message
+
+    db_path = str(tmp_path / "chat.db")
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as session:
+        handle = Handle(contact_id="+15551234567", service="iMessage")
+        session.add(handle)
+        session.flush()
+        session.add_all([
+            Message(guid=f"m{i}", text=f"message {i}", handle_id=handle.id,
+                    is_from_me=i % 2, date=1000 + i)
+            for i in range(5)
+        ])
+        session.commit()
+    engine.dispose()
+
+    pool = BoundedExecutor(max_workers=2, max_pending=8)
+    db = IMessageDB(db_path, batch_size=2)
+    db.connect()
+    app.dependency_overrides[get_imessage] = lambda: AsyncIMessageDB(db, pool)
+    yield db
+    app.dependency_overrides.pop(get_imessage, None)
+    db.close()
+    pool.shutdown()
+
+
+def test_get_contact_messages_pages(real_imessage_db, mock_auth_dependencies):
+    """Test following next_cursor through every page."""
+    url = "/api/v1/analytics/contacts/+15551234567/messages"
+    texts = []
+    params = {"limit": 2, "fields": "text"}
+    while True:
+        response = client.get(url, params=params)
+        assert response.status_code == 200
+        data = response.json()
+        texts.extend(m["text"] for m in data["messages"])
+        if not data["next_cursor"]:
+            break
+        params["cursor"] = data["next_cursor"]
+    assert texts == [f"message {i}" for i in range(5)]
+
+
+def test_get_contact_messages_ndjson(real_imessage_db, mock_auth_dependencies):
+    """Test streaming every message as NDJSON."""
+    import json
+
+    response = client.get(
+        "/api/v1/analytics/contacts/+15551234567/messages",
+        params={"fields": "id,is_from_me"},
+        headers={"Accept": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows == [{"id": i + 1, "is_from_me": i % 2} for i in range(5)]
+
+
+def test_streams_reserve_a_worker_before_responding(real_imessage_db, mock_auth_dependencies, monkeypatch):
+    """Test that a saturated pool is a 503, not a stream cut short."""
+    from app.db.executor import BoundedExecutor
+
+    def saturated(self):
+        raise IMessageDBBusy("saturated")
+
+    monkeypatch.setattr(BoundedExecutor, "reserve", saturated)
+    response = client.get(
+        "/api/v1/analytics/contacts/+15551234567/messages",
+        headers={"Accept": "application/x-ndjson"}
+    )
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_get_contact_messages_rejects_bad_input(real_imessage_db, mock_auth_dependencies):
+    """Test that unknown fields and malformed cursors are 400s."""
+    url = "/api/v1/analytics/contacts/+15551234567/messages"
+    assert client.get(url, params={"fields": "nope"}).status_code == 400
+    assert client.get(url, params={"cursor": "???"}).status_code == 400
+
+
+def test_export_table_streams_parquet(real_imessage_db, mock_auth_dependencies):
+    """Test downloading a table as Parquet."""
+    import io
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    response = client.get("/api/v1/analytics/export/message", params={"batch_size": 2})
+    assert response.status_code == 200
+    assert 'filename="message.parquet"' in response.headers["content-disposition"]
+    parquet = pq.ParquetFile(io.BytesIO(response.content))
+    assert parquet.metadata.num_rows == 5
+    assert parquet.metadata.num_row_groups == 3
+
+    assert client.get("/api/v1/analytics/export/users").status_code == 404
+
+
+def test_get_contact_activity(mock_imessage_db, mock_auth_dependencies):
+    """Test getting a contact's activity histogram."""
+    mock_imessage_db.get_activity.return_value = {
+        "starts": ["2024-01-01T00:00:00+00:00", "2024-01-02T00:00:00+00:00"],
+        "sent": [3, 0],
+        "received": [1, 2],
+    }
+    response = client.get("/api/v1/analytics/contacts/+1234567890/activity?bucket=day&tz=UTC")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["bucket"] == "day"
+    assert data["sent"] == [3, 0]
+    assert data["received"] == [1, 2]
+    mock_imessage_db.get_activity.assert_called_once_with("+1234567890", "day", "UTC")
+
+    response = client.get("/api/v1/analytics/contacts/+1234567890/activity?bucket=month")
+    assert response.status_code == 422
+
+
+def test_get_response_times(mock_imessage_db, mock_auth_dependencies):
+    """Test getting reply latency for one contact and for everyone."""
+    times = {
+        "me": {"count": 4, "p50": 30.0, "p90": 120.0, "p99": 600.0},
+        "them": {"count": 0, "p50": None, "p90": None, "p99": None},
+    }
+    mock_imessage_db.get_response_times.return_value = times
+    mock_imessage_db.get_all_response_times.return_value = {"+1234567890": times}
+
+    response = client.get("/api/v1/analytics/contacts/+1234567890/response-times")
+    assert response.status_code == 200
+    assert response.json() == times
+
+    response = client.get("/api/v1/analytics/response-times")
+    assert response.status_code == 200
+    assert response.json() == {"contacts": {"+1234567890": times}}
+
+
+def test_get_global_word_frequency(mock_imessage_db, mock_auth_dependencies):
+    """Test getting the most common words across all conversations."""
+    mock_imessage_db.get_global_word_frequency.return_value = [("hello", 40), ("world", 12)]
+    response = client.get("/api/v1/analytics/word-frequency?limit=2")
+    assert response.status_code == 200
+    assert response.json() == {"frequencies": [
+        {"word": "hello", "count": 40},
+        {"word": "world", "count": 12},
+    ]}
+    mock_imessage_db.get_global_word_frequency.assert_called_once_with(2, approximate=False)
+
+
+def test_get_word_frequency_approximate(mock_imessage_db, mock_auth_dependencies):
+    """Test that approximate=true is passed through to the accessor."""
+    response = client.get("/api/v1/analytics/contacts/+1234567890/word-frequency?approximate=true")
+    assert response.status_code == 200
+    mock_imessage_db.get_word_frequency.assert_called_once_with("+1234567890", 10, True)
+
+
+def test_search_messages(mock_imessage_db, mock_auth_dependencies):
+    """Test searching message text."""
+    from app.db.search_index import SearchUnavailable
+
+    mock_imessage_db.search_messages.return_value = {
+        "results": [{
+            "id": 7,
+            "handle_id": 1,
+            "date": "2024-01-01T12:00:00+00:00",
+            "is_from_me": 0,
+            "snippet": "see you at <b>lunch</b>",
+            "rank": -1.5,
+        }],
+        "next_cursor": None,
+    }
+    response = client.get("/api/v1/analytics/search?q=lunch&contact_id=%2B1234567890")
+    assert response.status_code == 200
+    assert response.json()["results"][0]["snippet"] == "see you at <b>lunch</b>"
+    mock_imessage_db.search_messages.assert_called_once_with("lunch", "+1234567890", None, 20, None)
+
+    mock_imessage_db.search_messages.side_effect = SearchUnavailable()
+    assert client.get("/api/v1/analytics/search?q=lunch").status_code == 503
+
+def test_chat_endpoints(mock_imessage_db, mock_auth_dependencies):
+    """Test the per-chat stats, word frequency and participants endpoints."""
+    mock_imessage_db.get_chat_stats.return_value = {"sent": 3, "received": 5, "participants": 2}
+    mock_imessage_db.get_chat_word_frequency.return_value = [("hello", 4)]
+    mock_imessage_db.get_chat_participants.return_value = [
+        {"handle_id": 1, "contact_id": "+15551234567", "service": "iMessage", "messages": 5}
+    ]
+
+    response = client.get("/api/v1/analytics/chats/7/stats")
+    assert response.status_code == 200
+    assert response.json() == {"sent": 3, "received": 5, "participants": 2}
+    mock_imessage_db.get_chat_stats.assert_called_once_with(7)
+
+    response = client.get("/api/v1/analytics/chats/7/word-frequency?limit=1")
+    assert response.json() == {"frequencies": [{"word": "hello", "count": 4}]}
+    mock_imessage_db.get_chat_word_frequency.assert_called_once_with(7, 1)
+
+    response = client.get("/api/v1/analytics/chats/7/participants")
+    assert response.json()["participants"][0]["contact_id"] == "+15551234567"
+
+    assert client.get("/api/v1/analytics/chats/not-a-number/stats").status_code == 422
+
+def test_contact_leaderboard_endpoint(mock_imessage_db, mock_auth_dependencies):
+    """Test the contacts leaderboard endpoint and its sort validation."""
+    mock_imessage_db.get_contact_leaderboard.return_value = [{
+        "contact_id": "+15551234567",
+        "messages": 8,
+        "sent": 3,
+        "received": 5,
+        "first_message": "2024-01-01T00:00:00+00:00",
+        "last_message": "2024-01-03T00:00:00+00:00",
+        "messages_per_day": 4.0,
+        "average_length": None,
+    }]
+
+    response = client.get("/api/v1/analytics/contacts?sort=messages_per_day&limit=5")
+    assert response.status_code == 200
+    entry = response.json()["contacts"][0]
+    assert entry["contact_id"] == "+15551234567"
+    assert entry["messages_per_day"] == 4.0
+    mock_imessage_db.get_contact_leaderboard.assert_called_once_with("messages_per_day", 5)
+
+    assert client.get("/api/v1/analytics/contacts?sort=unknown").status_code == 422
+    assert client.get("/api/v1/analytics/contacts?limit=0").status_code == 422
+
+def test_request_metrics_and_profiling(real_imessage_db, mock_auth_dependencies, monkeypatch):
+    """Test Server-Timing phases, the /metrics endpoint and admin-only profiles."""
+    from app.core.settings import settings
+
+    app.dependency_overrides[get_response_cache] = lambda: ResponseCache(enabled=False)
+    url = "/api/v1/analytics/contacts/+15551234567/stats"
+    try:
+        response = client.get(url)
+        assert response.status_code == 200
+        timing = response.headers["server-timing"]
+        assert "handle_lookup;dur=" in timing
+        assert "query;dur=" in timing
+
+        metrics = client.get("/metrics").text
+        assert 'imessage_phase_duration_seconds_count{phase="query"}' in metrics
+        assert 'route="/api/v1/analytics/contacts/{contact_id}/stats"' in metrics
+        assert 'phase="serialize"' in metrics
+
+        assert client.get(url, params={"profile": 1}).status_code == 403
+        monkeypatch.setattr(settings, "ADMIN_EMAILS", ["test@example.com"])
+        data = client.get(url, params={"profile": 1}).json()
+        assert data["sent"] == 2
+        assert data["profile"]["calls"]
+        assert "query" in data["profile"]["phases"]
+    finally:
+        app.dependency_overrides.pop(get_response_cache, None)
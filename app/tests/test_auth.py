@@ -1,6 +1,13 @@
+import asyncio
+import time
+import pytest
+from datetime import timedelta
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 from app.main import app
+from app.core import auth, auth_cache
 from app.core.auth import oauth
+from app.core.auth_cache import RevocationList, api_key_cache, revoke_api_key, revoke_token, token_cache
 
 client = TestClient(app)
 
@@ -44,3 +51,87 @@ def test_auth_callback_endpoints_exist():
     """Test that our callback endpoints are properly configured"""
     response = client.get("/api/v1/auth/github/callback")
     assert response.status_code in [400, 401]  # Should fail without proper OAuth state
+
+
+def test_token_validation_is_cached(monkeypatch):
+    """Test that a valid token is only decoded once until it is revoked."""
+    token = auth.create_access_token({"sub": "cached@example.com"})
+    decode_calls = []
+    real_decode = auth.jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        decode_calls.append(1)
+        return real_decode(*args, **kwargs)
+
+    monkeypatch.setattr(auth.jwt, "decode", counting_decode)
+    token_cache.clear()
+
+    for _ in range(3):
+        user = asyncio.run(auth.get_current_user(token))
+        assert user == {"email": "cached@example.com"}
+    assert len(decode_calls) == 1
+    assert token_cache.stats()["hits"] >= 2
+
+    asyncio.run(revoke_token(token))
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(auth.get_current_user(token))
+    assert exc_info.value.status_code == 401
+
+
+def test_revocations_are_never_evicted():
+    """Test that revocations outlast cache eviction and only end at exp."""
+    revocations = RevocationList()
+    tokens = [f"token-{i}" for i in range(auth_cache.settings.AUTH_CACHE_MAX_ENTRIES + 10)]
+
+    async def revoke_all():
+        for token in tokens:
+            await revocations.add(token, time.time() + 60)
+
+    asyncio.run(revoke_all())
+    assert revocations.contains(tokens[0])
+    assert len(revocations) == len(tokens)
+
+    asyncio.run(revocations.add("expired", time.time() - 1))
+    assert not revocations.contains("expired")
+
+
+def test_revocations_published_by_other_processes_apply():
+    """Test that published token and API key revocations take effect locally."""
+    api_keys = auth_cache.LRUCache()
+    api_keys.set("key-1", "user")
+    revocations = RevocationList(api_keys=api_keys)
+
+    revocations._apply({"token": auth_cache._digest("token-1"), "exp": time.time() + 60})
+    revocations._apply({"api_key": auth_cache._digest("key-1")})
+    assert revocations.contains("token-1")
+    assert api_keys.get("key-1") is None
+
+
+def test_logout_revokes_the_token():
+    """Test that a token used to log out is rejected afterwards."""
+    token = auth.create_access_token({"sub": "leaving@example.com"})
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.post("/api/v1/auth/logout", headers=headers).status_code == 204
+    assert client.post("/api/v1/auth/logout", headers=headers).status_code == 401
+
+
+def test_revoked_api_keys_leave_the_cache():
+    """Test that revoking an API key drops its cached user."""
+    api_key_cache.set("key-2", "user")
+    asyncio.run(revoke_api_key("key-2"))
+    assert api_key_cache.get("key-2") is None
+
+
+def test_tokens_without_exp_are_rejected():
+    """Test that a token whose revocation could not expire is never accepted."""
+    token = auth.jwt.encode({"sub": "forever@example.com"}, auth.settings.SECRET_KEY, algorithm=auth.settings.ALGORITHM)
+    with pytest.raises(HTTPException):
+        asyncio.run(auth.get_current_user(token))
+
+
+def test_expired_tokens_are_not_cached():
+    """Test that a token past its exp is rejected and never cached."""
+    token = auth.create_access_token({"sub": "old@example.com"}, expires_delta=timedelta(seconds=-1))
+    with pytest.raises(HTTPException):
+        asyncio.run(auth.get_current_user(token))
+    assert token_cache.get(token) is None
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+from app.core.cache import LRUCache
+from app.services.cache import ResponseCache
+
+
+def test_lru_evicts_least_recently_used():
+    """Test that the LRU keeps only the most recently used entries."""
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["hits"] == 3
+    assert cache.stats()["misses"] == 1
+
+
+def test_lru_expires_entries():
+    """Test that entries past their TTL are treated as misses."""
+    cache = LRUCache(ttl=0.01)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=60)
+    time.sleep(0.02)
+    
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+
+
+async def version_v1():
+    return "v1"
+
+
+async def version_v2():
+    return "v2"
+
+
+def test_response_cache_falls_back_to_memory():
+    """Test that an unreachable Redis falls back to the in-process LRU."""
+    cache = ResponseCache(redis_url="redis://127.0.0.1:1/0")
+    calls = []
+    
+    async def compute():
+        calls.append(1)
+        return {"sent": 1, "received": 2}
+    
+    async def scenario():
+        first = await cache.get_or_compute("stats", version_v1, {"contact_id": "x"}, compute)
+        second = await cache.get_or_compute("stats", version_v1, {"contact_id": "x"}, compute)
+        return first, second
+    
+    first, second = asyncio.run(scenario())
+    assert first == second == {"sent": 1, "received": 2}
+    assert len(calls) == 1
+    assert cache.backend == "memory"
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+def test_response_cache_drops_old_versions():
+    """Test that seeing a new version drops older entries from memory."""
+    cache = ResponseCache(redis_url=None)
+    
+    async def compute():
+        return [["hello", 1]]
+    
+    async def scenario():
+        await cache.get_or_compute("word-frequency", version_v1, {"limit": 1}, compute)
+        await cache.get_or_compute("word-frequency", version_v1, {"limit": 2}, compute)
+        assert len(cache.local) == 2
+        await cache.get_or_compute("word-frequency", version_v2, {"limit": 1}, compute)
+    
+    asyncio.run(scenario())
+    assert len(cache.local) == 1
+
+
+def test_response_cache_skips_results_racing_a_new_version():
+    """Test that a result is not stored if the version changed while computing."""
+    cache = ResponseCache(redis_url=None)
+    versions = iter(["v1", "v2", "v2", "v2"])
+
+    async def get_version():
+        return next(versions)
+
+    async def compute():
+        return {"sent": 1, "received": 0}
+
+    async def scenario():
+        await cache.get_or_compute("stats", get_version, {}, compute)
+        assert len(cache.local) == 0
+        await cache.get_or_compute("stats", get_version, {}, compute)
+
+    asyncio.run(scenario())
+    assert len(cache.local) == 1
+    assert cache.stats()["version"] == "v2"
@@ -0,0 +1,85 @@
+import io
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.db.imessage import IMessageDB
+from app.models.imessage import Chat, Handle, Message, chat_handle_assoc, chat_message_assoc
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+from app.services.export import EXPORT_TABLES, export_tables, iter_export_chunks  # noqa: E402
+from app.tests.conftest import JAN_1_2024  # noqa: E402
+
+
+@pytest.fixture
+def source_db(empty_chat_db):
+    """Create a chat.db with messages in every exported table."""
+    engine = create_engine(f"sqlite:///{empty_chat_db}")
+    with sessionmaker(bind=engine)() as session:
+        imessage = Handle(contact_id="+15551234567", service="iMessage")
+        sms = Handle(contact_id="+15557654321", service="SMS")
+        chat = Chat(guid="chat1", chat_identifier="+15551234567", service_name="iMessage")
+        session.add_all([imessage, sms, chat])
+        session.flush()
+        session.add_all([
+            Message(guid=str(i), text=f"message {i}", handle_id=(imessage, sms)[i % 2].id,
+                    is_from_me=i % 2, date=JAN_1_2024 + i * 10 ** 9)
+            for i in range(7)
+        ])
+        session.flush()
+        session.execute(insert(chat_handle_assoc), [{"chat_id": chat.id, "handle_id": imessage.id}])
+        session.execute(insert(chat_message_assoc), [
+            {"chat_id": chat.id, "message_id": i + 1, "message_date": JAN_1_2024} for i in range(7)
+        ])
+        session.commit()
+    engine.dispose()
+    return empty_chat_db
+
+
+def test_parquet_export_row_groups_and_types(source_db):
+    """Test that each batch becomes a row group with converted columns."""
+    with IMessageDB(source_db) as db:
+        data = b"".join(iter_export_chunks("message", db.iter_table_rows("message", 3), "parquet"))
+
+    parquet = pq.ParquetFile(io.BytesIO(data))
+    assert parquet.metadata.num_row_groups == 3
+    handle_column = parquet.schema_arrow.get_field_index("handle_id")
+    assert "RLE_DICTIONARY" in parquet.metadata.row_group(0).column(handle_column).encodings
+    table = parquet.read()
+    assert table.num_rows == 7
+    assert table.column("date")[1].as_py() == datetime(2024, 1, 1, 0, 0, 1, tzinfo=timezone.utc)
+    assert table.column("text").to_pylist() == [f"message {i}" for i in range(7)]
+
+
+def test_arrow_stream_export(source_db):
+    """Test that the Arrow IPC stream round-trips with dictionary columns."""
+    with IMessageDB(source_db) as db:
+        data = b"".join(iter_export_chunks("handle", db.iter_table_rows("handle"), "arrow"))
+
+    table = pa.ipc.open_stream(data).read_all()
+    assert table.column("id").to_pylist() == ["+15551234567", "+15557654321"]
+    assert pa.types.is_dictionary(table.schema.field("service").type)
+    assert table.column("service").to_pylist() == ["iMessage", "SMS"]
+
+
+def test_export_tables_writes_every_table(source_db, tmp_path):
+    """Test the export command's file-per-table output."""
+    with IMessageDB(source_db) as db:
+        paths = export_tables(db, str(tmp_path), format="parquet", batch_size=2)
+
+    assert set(paths) == set(EXPORT_TABLES)
+    assert pq.read_table(paths["chat_message_join"]).num_rows == 7
+    assert pq.read_table(paths["chat_handle_join"]).num_rows == 1
+
+
+def test_export_rejects_unknown_table(source_db):
+    """Test that tables outside the iMessage models cannot be exported."""
+    with pytest.raises(ValueError):
+        iter_export_chunks("users", [], "parquet")
+    with IMessageDB(source_db) as db:
+        with pytest.raises(ValueError):
+            list(db.iter_table_rows("users"))
@@ -1,11 +1,15 @@
 import os
 import pytest
 import tempfile
+import threading
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.models.imessage import Base, Message, Handle, Chat
 from app.db.imessage import IMessageDB
+from app.db.raw import fetch_batches, raw_connection
+from app.db.sidecar import SidecarBusy, SidecarDB
+from app.db.snapshot import SnapshotManager
 
 @pytest.fixture
 def test_db():
@@ -119,4 +123,780 @@ def test_database_context_manager(test_db):
         assert db.SessionLocal is not None
         
     # After context manager exits
-    assert not os.path.exists(db.temp_db_path)
\ No newline at end of file
+    assert not os.path.exists(db.temp_db_path)
+
+def test_read_only_mode(test_db):
+    """Test that read-only mode queries the source in place without a copy."""
+    with IMessageDB(test_db, mode="readonly") as db:
+        assert db.temp_db_path is None
+        counts = db.get_message_count_by_contact("+1234567890")
+        assert counts == {"sent": 2, "received": 1}
+
+    # The source database must be left untouched
+    assert os.path.exists(test_db)
+
+
+def test_shared_db_is_reused(test_db, monkeypatch, tmp_path):
+    """Test that the shared accessor is opened once and reused."""
+    from app.db import imessage
+
+    monkeypatch.setattr(imessage.settings, "IMESSAGE_DB_PATH", test_db)
+    monkeypatch.setattr(imessage.settings, "IMESSAGE_SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(imessage.settings, "IMESSAGE_SIDECAR_DIR", str(tmp_path))
+    imessage.close_shared_db()
+    try:
+        first = imessage.get_shared_db()
+        second = imessage.get_shared_db()
+        assert first is second
+        assert first.mode == "snapshot"
+        assert first.get_message_count_by_contact("test@example.com") == {"sent": 0, "received": 1}
+    finally:
+        imessage.close_shared_db()
+    assert imessage._shared_db is None
+
+
+def _touch_source(db_path):
+    """Append a message so the source signature changes."""
+    engine = create_engine(f"sqlite:///{db_path}")
+    with sessionmaker(bind=engine)() as session:
+        session.add(Message(guid="new", text="fresh words", handle_id=1, is_from_me=0, date=5000))
+        session.commit()
+    engine.dispose()
+
+
+def test_snapshot_reused_until_source_changes(test_db, tmp_path):
+    """Test that snapshots are only re-copied when chat.db changes."""
+    manager = SnapshotManager(test_db, str(tmp_path))
+    try:
+        with manager.lease() as first:
+            pass
+        with manager.lease() as second:
+            assert second is first
+
+        _touch_source(test_db)
+        with manager.lease() as third:
+            assert third is not first
+            assert third.path != first.path
+            assert third.version != first.version
+        # The superseded snapshot was unreferenced, so it is deleted
+        assert not os.path.exists(first.path)
+    finally:
+        manager.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_snapshot_kept_while_in_use(test_db, tmp_path):
+    """Test that a refresh never deletes a snapshot a request still holds."""
+    manager = SnapshotManager(test_db, str(tmp_path))
+    try:
+        held = manager.acquire()
+        _touch_source(test_db)
+        with manager.lease() as fresh:
+            assert fresh is not held
+        assert os.path.exists(held.path)
+        with held.SessionLocal() as session:
+            assert session.query(Message).count() == 4
+
+        manager.release(held)
+        assert not os.path.exists(held.path)
+    finally:
+        manager.close()
+
+
+def test_snapshot_mode_counts(test_db, tmp_path):
+    """Test that snapshot mode serves queries and picks up new messages."""
+    with IMessageDB(test_db, mode="snapshot", snapshot_dir=str(tmp_path)) as db:
+        assert db.get_message_count_by_contact("+1234567890") == {"sent": 2, "received": 1}
+        _touch_source(test_db)
+        assert db.get_message_count_by_contact("+1234567890") == {"sent": 2, "received": 2}
+
+
+def test_snapshot_backup_metrics(test_db, tmp_path):
+    """Test that refreshes use stepped backups and record their metrics."""
+    manager = SnapshotManager(test_db, str(tmp_path), pages_per_step=1)
+    try:
+        with manager.lease() as snapshot:
+            with snapshot.SessionLocal() as session:
+                assert session.query(Message).count() == 4
+
+        metrics = manager.metrics()
+        assert metrics["refresh_count"] == 1
+        assert metrics["last_refresh_pages"] > 1
+        assert metrics["total_pages_copied"] == metrics["last_refresh_pages"]
+        assert metrics["last_refresh_seconds"] >= 0
+        assert metrics["version"] == snapshot.version
+    finally:
+        manager.close()
+
+
+def test_snapshot_includes_wal_content(test_db, tmp_path):
+    """Test that writes still sitting in the source's -wal file are captured."""
+    import sqlite3
+
+    writer = sqlite3.connect(test_db)
+    writer.execute("PRAGMA journal_mode=WAL")
+    writer.execute("PRAGMA wal_autocheckpoint=0")
+    writer.execute(
+        "INSERT INTO message (guid, text, handle_id, is_from_me, date) "
+        "VALUES ('wal', 'only in wal', 1, 1, 6000)"
+    )
+    writer.commit()
+    try:
+        assert os.path.getsize(test_db + "-wal") > 0
+        manager = SnapshotManager(test_db, str(tmp_path))
+        try:
+            with manager.lease() as snapshot:
+                with snapshot.SessionLocal() as session:
+                    assert session.query(Message).filter(Message.guid == "wal").count() == 1
+        finally:
+            manager.close()
+    finally:
+        writer.close()
+
+
+def test_async_facade_runs_on_pool(test_db):
+    """Test that AsyncIMessageDB awaits IMessageDB calls on the worker pool."""
+    import asyncio
+    import threading
+    from app.db.executor import BoundedExecutor
+    from app.db.imessage import AsyncIMessageDB
+
+    pool = BoundedExecutor(max_workers=2, max_pending=0)
+    try:
+        with IMessageDB(test_db) as db:
+            adb = AsyncIMessageDB(db, pool)
+            counts = asyncio.run(adb.get_message_count_by_contact("+1234567890"))
+            assert counts == {"sent": 2, "received": 1}
+            assert asyncio.run(pool.run(lambda: threading.current_thread().name)).startswith("imessage")
+    finally:
+        pool.shutdown()
+
+
+def test_bounded_executor_rejects_when_full():
+    """Test that calls beyond workers + pending fail fast."""
+    import asyncio
+    import threading
+    from app.db.executor import BoundedExecutor, IMessageDBBusy
+
+    pool = BoundedExecutor(max_workers=1, max_pending=1)
+    gate = threading.Event()
+
+    async def scenario():
+        blocked = [asyncio.ensure_future(pool.run(gate.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(IMessageDBBusy):
+            await pool.run(lambda: None)
+        gate.set()
+        await asyncio.gather(*blocked)
+        # Slots are released once calls complete
+        assert await pool.run(lambda: 42) == 42
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        gate.set()
+        pool.shutdown()
+
+
+def test_tied_word_counts_have_one_order(test_db, tmp_path):
+    """Test that every word-frequency path breaks ties by word."""
+    engine = create_engine(f"sqlite:///{test_db}")
+    with sessionmaker(bind=engine)() as session:
+        session.add(Message(guid="tie", text="zeta beta alpha", handle_id=1, is_from_me=0, date=5000))
+        session.commit()
+    engine.dispose()
+
+    with IMessageDB(test_db) as db:
+        scanned = db.get_word_frequency("+1234567890", limit=100)
+    with IMessageDB(test_db, sidecar_dir=str(tmp_path)) as db:
+        db.refresh_indexes()
+        assert db.get_word_frequency("+1234567890", limit=100) == scanned
+        assert db.word_index.top_words([1, 99], 100) == scanned
+    tied = [word for word, count in scanned if count == 1]
+    assert "alpha" in tied and tied == sorted(tied)
+
+
+def test_bounded_executor_reservation_holds_one_slot():
+    """Test that a reservation keeps its slot across calls until released."""
+    import asyncio
+    from app.db.executor import BoundedExecutor, IMessageDBBusy
+
+    pool = BoundedExecutor(max_workers=1, max_pending=0)
+
+    async def scenario():
+        slot = pool.reserve()
+        with pytest.raises(IMessageDBBusy):
+            pool.reserve()
+        # Calls made through the reservation never compete for a slot
+        assert [await slot.run(lambda i=i: i) for i in range(3)] == [0, 1, 2]
+        slot.release()
+        slot.release()
+        assert await pool.run(lambda: 42) == 42
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+
+def test_word_index_matches_scan(test_db, tmp_path):
+    """Test that indexed word frequency matches the full-scan result."""
+    with IMessageDB(test_db) as scan_db:
+        expected = dict(scan_db.get_word_frequency("+1234567890", limit=100))
+
+    with IMessageDB(test_db, sidecar_dir=str(tmp_path)) as db:
+        assert db.refresh_indexes() == 4
+        indexed = db.get_word_frequency("+1234567890", limit=100)
+        assert dict(indexed) == expected
+        assert indexed[0][1] == 2
+        assert db.get_word_frequency("+1234567890", limit=1) == [indexed[0]]
+        assert db.get_word_frequency("nonexistent") == []
+
+
+def test_word_index_updates_incrementally(test_db, tmp_path):
+    """Test that only messages above the ROWID high-water mark are indexed."""
+    with IMessageDB(test_db, mode="snapshot", snapshot_dir=str(tmp_path / "snapshots"),
+                    sidecar_dir=str(tmp_path)) as db:
+        assert db.refresh_indexes() == 4
+        assert db.refresh_indexes() == 0
+
+        _touch_source(test_db)
+        assert db.refresh_indexes() == 1
+        freq_dict = dict(db.get_word_frequency("+1234567890", limit=100))
+        assert freq_dict["fresh"] == 1
+        assert freq_dict["hello"] == 2
+
+    # The index persists across accessors
+    with IMessageDB(test_db, sidecar_dir=str(tmp_path)) as db:
+        assert db.refresh_indexes() == 0
+        assert dict(db.get_word_frequency("+1234567890", limit=100))["fresh"] == 1
+
+
+def test_requests_scan_while_index_is_updating(test_db, tmp_path):
+    """Test that requests fall back to scanning instead of waiting for an update."""
+    with IMessageDB(test_db, sidecar_dir=str(tmp_path)) as db:
+        with db.word_index._lock:
+            assert dict(db.get_word_frequency("+1234567890", limit=100))["hello"] == 2
+        assert db.word_index.top_words([1], 1) == []
+
+        assert dict(db.get_word_frequency("+1234567890", limit=100))["hello"] == 2
+        assert dict(db.word_index.top_words([1], 100))["hello"] == 2
+
+
+def test_word_frequency_streams_in_batches(test_db):
+    """Test that the streaming fallback gives the same counts across batch sizes."""
+    with IMessageDB(test_db, batch_size=1) as db:
+        frequencies = db.get_word_frequency("+1234567890", limit=2)
+        assert frequencies == [("hello", 2), ("world", 2)]
+
+
+def test_raw_reads_match_orm(test_db):
+    """Test that raw sqlite3 batches return the same rows as the ORM."""
+    with IMessageDB(test_db) as db, db.session() as session:
+        expected = [
+            tuple(row) for row in session.query(Message.id, Message.text).order_by(Message.id)
+        ]
+        batches = list(fetch_batches(
+            raw_connection(session), "SELECT ROWID, text FROM message ORDER BY ROWID", batch_size=2
+        ))
+        assert len(batches) == (len(expected) + 1) // 2
+        assert [row for rows in batches for row in rows] == expected
+
+
+def test_message_counts_by_contacts(test_db):
+    """Test batch message counts in a single grouped query."""
+    with IMessageDB(test_db) as db:
+        counts = db.get_message_counts_by_contacts(
+            ["+1234567890", "test@example.com", "nonexistent"]
+        )
+        assert counts == {
+            "+1234567890": {"sent": 2, "received": 1},
+            "test@example.com": {"sent": 0, "received": 1},
+            "nonexistent": {"sent": 0, "received": 0},
+        }
+
+
+def test_normalize_contact_id():
+    """Test that equivalent phone numbers and emails normalize identically."""
+    from app.db.handles import normalize_contact_id
+
+    for raw in ["+1 (555) 123-4567", "555-123-4567", "15551234567", "+15551234567"]:
+        assert normalize_contact_id(raw) == "+15551234567"
+    assert normalize_contact_id("0044 20 7946 0000") == "+442079460000"
+    assert normalize_contact_id("Friend@Example.COM") == "friend@example.com"
+    assert normalize_contact_id("12345") == "12345"
+
+
+def test_contact_spans_multiple_handles(test_db):
+    """Test that every handle of a contact is counted, whatever its format."""
+    engine = create_engine(f"sqlite:///{test_db}")
+    with sessionmaker(bind=engine)() as session:
+        imessage = Handle(contact_id="+15551234567", service="iMessage", country="US")
+        sms = Handle(contact_id="(555) 123-4567", service="SMS", country="US")
+        session.add_all([imessage, sms])
+        session.flush()
+        session.add_all([
+            Message(guid="im1", text="hello there", handle_id=imessage.id, is_from_me=1, date=7000),
+            Message(guid="sms1", text="hello via sms", handle_id=sms.id, is_from_me=0, date=7001),
+        ])
+        session.commit()
+    engine.dispose()
+
+    with IMessageDB(test_db) as db:
+        assert db.get_message_count_by_contact("+15551234567") == {"sent": 1, "received": 1}
+        assert db.get_message_count_by_contact("555.123.4567") == {"sent": 1, "received": 1}
+        assert dict(db.get_word_frequency("5551234567"))["hello"] == 2
+
+
+def test_handle_map_rebuilt_on_new_version(test_db, tmp_path):
+    """Test that the handle cache is invalidated when the snapshot refreshes."""
+    with IMessageDB(test_db, mode="snapshot", snapshot_dir=str(tmp_path)) as db:
+        assert db.get_message_count_by_contact("new@example.com") == {"sent": 0, "received": 0}
+        first_version = db.get_version()
+
+        engine = create_engine(f"sqlite:///{test_db}")
+        with sessionmaker(bind=engine)() as session:
+            handle = Handle(contact_id="new@example.com", service="iMessage")
+            session.add(handle)
+            session.flush()
+            session.add(Message(guid="n1", text="hi", handle_id=handle.id, is_from_me=1, date=8000))
+            session.commit()
+        engine.dispose()
+
+        assert db.get_message_count_by_contact("New@Example.com") == {"sent": 1, "received": 0}
+        assert db.get_version() != first_version
+
+
+def test_prepared_snapshot_uses_covering_index(test_db, tmp_path):
+    """Test that prepared snapshots answer per-handle counts from an index."""
+    import sqlite3
+
+    manager = SnapshotManager(
+        test_db, str(tmp_path), prepare=True, pragmas={"cache_size": -1024}
+    )
+    try:
+        with manager.lease() as snapshot:
+            conn = sqlite3.connect(snapshot.path)
+            plan = " ".join(row[-1] for row in conn.execute(
+                "EXPLAIN QUERY PLAN "
+                "SELECT handle_id, SUM(is_from_me = 1), SUM(is_from_me = 0) "
+                "FROM message WHERE handle_id IN (1, 2) GROUP BY handle_id"
+            ))
+            conn.close()
+            assert "COVERING INDEX msgapi_message_handle_from_me" in plan
+
+            with snapshot.engine.connect() as connection:
+                assert connection.exec_driver_sql("PRAGMA cache_size").scalar() == -1024
+        assert manager.metrics()["last_prepare_seconds"] >= 0
+    finally:
+        manager.close()
+
+    # The source database is never modified
+    conn = sqlite3.connect(test_db)
+    names = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+    conn.close()
+    assert not any(name.startswith("msgapi_") for name in names)
+
+
+def test_messages_page_keyset_pagination(test_db):
+    """Test that pages follow (date, ROWID) order and end with no cursor."""
+    with IMessageDB(test_db) as db:
+        first = db.get_messages_page("+1234567890", limit=2)
+        assert [m["text"] for m in first["messages"]] == ["Hello world", "How are you?"]
+        assert first["next_cursor"]
+
+        second = db.get_messages_page("+1234567890", limit=2, cursor=first["next_cursor"])
+        assert [m["text"] for m in second["messages"]] == ["Hello world again"]
+        assert second["next_cursor"] is None
+
+
+def test_messages_page_filters_and_projection(test_db):
+    """Test since/until bounds and column projection."""
+    from datetime import datetime, timezone
+
+    with IMessageDB(test_db) as db:
+        page = db.get_messages_page(
+            "+1234567890",
+            fields=["guid", "date"],
+            since=datetime(2001, 1, 1, 0, 30, tzinfo=timezone.utc),
+            until=datetime(2001, 1, 1, 0, 50, tzinfo=timezone.utc),
+        )
+        assert page["messages"] == [
+            {"guid": "msg2", "date": "2001-01-01T00:33:20+00:00"}
+        ]
+
+        with pytest.raises(ValueError):
+            db.get_messages_page("+1234567890", fields=["attributedBody"])
+        with pytest.raises(ValueError):
+            db.get_messages_page("+1234567890", cursor="not-a-cursor")
+
+
+def test_iter_message_batches_streams_all(test_db):
+    """Test that streaming yields every message in bounded batches."""
+    with IMessageDB(test_db, batch_size=2) as db:
+        batches = list(db.iter_message_batches("+1234567890", fields=["id"]))
+        assert [len(batch) for batch in batches] == [2, 1]
+        assert [m["id"] for batch in batches for m in batch] == [1, 2, 3]
+        assert list(db.iter_message_batches("unknown@example.com")) == []
+
+
+def test_activity_histogram(test_db):
+    """Test binning a contact's messages by hour in a given time zone."""
+    with IMessageDB(test_db) as db:
+        activity = db.get_activity("+1234567890", bucket="hour", tz="America/New_York")
+        # Seconds-encoded dates 1000, 2000 and 3000 after 2001-01-01 00:00 UTC
+        assert activity == {
+            "starts": ["2000-12-31T19:00:00-05:00"],
+            "sent": [2],
+            "received": [1],
+        }
+        assert db.get_activity("unknown@example.com") == {"starts": [], "sent": [], "received": []}
+        with pytest.raises(ValueError):
+            db.get_activity("+1234567890", tz="Mars/Olympus_Mons")
+
+
+def test_activity_bins_follow_dst():
+    """Test that local buckets stay aligned across a DST change."""
+    import numpy as np
+    from zoneinfo import ZoneInfo
+    from app.db.activity import bin_activity
+
+    # 2024-03-09 12:00 and 2024-03-10 12:00 America/New_York, in Apple-epoch
+    # nanoseconds; clocks moved forward in between
+    before = (1710003600 - 978307200) * 10 ** 9
+    after = (1710086400 - 978307200) * 10 ** 9
+    activity = bin_activity(
+        np.array([before, after, after]), np.array([1, 0, 1]), "day", ZoneInfo("America/New_York")
+    )
+    assert activity["starts"] == ["2024-03-09T00:00:00-05:00", "2024-03-10T00:00:00-05:00"]
+    assert activity["sent"] == [1, 1]
+    assert activity["received"] == [0, 1]
+
+    hourly = bin_activity(np.array([before, after]), np.array([0, 0]), "hour", ZoneInfo("America/New_York"))
+    # 23 wall-clock hours apart, but noon on both days
+    assert len(hourly["starts"]) == 25
+    assert hourly["starts"][-1] == "2024-03-10T12:00:00-04:00"
+
+    weekly = bin_activity(np.array([before, after]), np.array([0, 0]), "week")
+    assert weekly["starts"] == ["2024-03-04T00:00:00+00:00"]
+    assert weekly["received"] == [2]
+
+
+def test_reply_gaps_skip_same_side_runs():
+    """Test that only sender changes count as replies."""
+    import numpy as np
+    from app.db.replies import reply_gaps, response_times
+
+    # Nanosecond dates: them, them, me (+30s), me, them (+600s), me (+5s)
+    seconds = np.array([0, 10, 40, 50, 650, 655])
+    dates = (seconds + 700000000) * 10 ** 9
+    from_me = np.array([0, 0, 1, 1, 0, 1])
+    mine, theirs = reply_gaps(dates, from_me)
+    assert mine.tolist() == [30.0, 5.0]
+    assert theirs.tolist() == [600.0]
+
+    summary = response_times(dates[:1], from_me[:1])
+    assert summary["me"] == {"count": 0, "p50": None, "p90": None, "p99": None}
+
+
+def test_response_times(test_db):
+    """Test reply latency for one contact and for all contacts."""
+    from app.db.executor import shutdown_process_pool
+
+    with IMessageDB(test_db) as db:
+        times = db.get_response_times("+1234567890")
+        assert times["me"]["count"] == 1
+        assert times["me"]["p50"] == 1000.0
+        assert times["them"]["p99"] == 1000.0
+
+        try:
+            everyone = db.get_all_response_times(chunk_size=1)
+        finally:
+            shutdown_process_pool()
+        assert everyone["+1234567890"] == times
+        assert everyone["test@example.com"]["them"]["count"] == 0
+
+
+def test_global_word_frequency(test_db):
+    """Test the map-reduce word count against a single pass over the table."""
+    from concurrent.futures import ThreadPoolExecutor
+    from app.db.word_index import count_words_in_range, rowid_partitions, top_n
+
+    assert rowid_partitions(0, 10, 3) == [(0, 4), (4, 8), (8, 10)]
+    assert rowid_partitions(5, 5, 3) == []
+
+    with IMessageDB(test_db) as db, ThreadPoolExecutor(max_workers=2) as pool:
+        frequencies = db.get_global_word_frequency(limit=2, pool=pool, partitions=3)
+        assert frequencies == [("hello", 2), ("world", 2)]
+        assert frequencies == top_n(count_words_in_range(db.temp_db_path, 0, 4), 2)
+
+        # Served from the per-version result until the data changes
+        pool.shutdown()
+        assert db.get_global_word_frequency(limit=1) == [("hello", 2)]
+
+
+def test_space_saving_bounds_and_merge():
+    """Test that Space-Saving keeps heavy hitters within its error bound."""
+    import random
+    from collections import Counter
+    from app.db.word_sketch import SpaceSaving
+
+    rng = random.Random(0)
+    words = [f"w{min(int(rng.paretovariate(1.2)), 500)}" for _ in range(20000)]
+    exact = Counter(words)
+
+    # Two halves summarized separately and merged, as partitions would be
+    left, right = SpaceSaving(capacity=50), SpaceSaving(capacity=50)
+    for start in range(0, 10000, 1000):
+        left.update(words[start:start + 1000])
+        right.update(words[10000 + start:10000 + start + 1000])
+    left.merge(right)
+
+    assert left.total == len(words)
+    assert len(left.counts) <= 50
+    bound = left.total / left.capacity
+    for word, count in exact.items():
+        if count > bound:
+            assert word in left.counts
+    for word, estimate in left.counts.items():
+        assert estimate - left.errors[word] <= exact[word] <= estimate
+        assert left.errors[word] <= bound
+    assert [word for word, _ in left.top(3)] == [word for word, _ in exact.most_common(3)]
+
+
+def test_approximate_word_frequency(test_db, tmp_path):
+    """Test approximate counts with and without the sidecar summaries."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    with IMessageDB(test_db) as db, ThreadPoolExecutor(max_workers=2) as pool:
+        assert dict(db.get_word_frequency("+1234567890", limit=2, approximate=True)) == {"hello": 2, "world": 2}
+        assert dict(db.get_global_word_frequency(2, pool=pool, approximate=True)) == {"hello": 2, "world": 2}
+
+    with IMessageDB(test_db, mode="snapshot", snapshot_dir=str(tmp_path / "snapshots"),
+                    sidecar_dir=str(tmp_path)) as db:
+        db.refresh_indexes()
+        assert dict(db.get_word_frequency("test@example.com", limit=5, approximate=True)) == {
+            "different": 1, "contact": 1
+        }
+
+        # New messages are merged into the stored summaries
+        _touch_source(test_db)
+        frequencies = dict(db.get_global_word_frequency(limit=100, approximate=True))
+        assert frequencies["fresh"] == 1
+        assert frequencies["hello"] == 2
+        assert db.word_sketch.sketch().total == 12
+
+
+def test_word_sketch_update_reads_one_handle_at_a_time(test_db, tmp_path):
+    """Test that per-handle summaries match exact counts across batches."""
+    from collections import Counter
+    from app.db.word_index import WordIndex, tokenize
+    from app.db.word_sketch import WordSketchIndex
+
+    with IMessageDB(test_db) as db, db.session() as session:
+        sidecar = SidecarDB(str(tmp_path / "sidecar.db"))
+        sketches = WordSketchIndex(sidecar, batch_size=1)
+        words = WordIndex(sidecar, batch_size=1)
+        assert sketches.update(session) == words.update(session) == 4
+        for handle_id in (1, 2):
+            assert sketches.sketch([handle_id]).counts == dict(words.top_words([handle_id], 100))
+        texts = [text for text, in session.query(Message.text)]
+        assert sketches.sketch().counts == Counter(w for text in texts for w in tokenize(text))
+
+
+def test_search_messages(test_db, tmp_path):
+    """Test ranked full-text search with filters and keyset pagination."""
+    from datetime import datetime, timezone
+    from app.db.search_index import SearchUnavailable
+
+    with IMessageDB(test_db) as db:
+        with pytest.raises(SearchUnavailable):
+            db.search_messages("hello")
+
+    with IMessageDB(test_db, mode="snapshot", snapshot_dir=str(tmp_path / "snapshots"),
+                    sidecar_dir=str(tmp_path)) as db:
+        first = db.search_messages("HELLO", limit=1)
+        assert len(first["results"]) == 1
+        assert "<b>Hello</b>" in first["results"][0]["snippet"]
+        second = db.search_messages("hello", limit=1, cursor=first["next_cursor"])
+        assert second["next_cursor"] is None
+        ids = {first["results"][0]["id"], second["results"][0]["id"]}
+        assert ids == {1, 3}
+
+        # Every word must match; punctuation is not FTS5 syntax
+        assert [r["id"] for r in db.search_messages("world again!")["results"]] == [3]
+        assert db.search_messages("different", contact_id="+1234567890")["results"] == []
+        since = datetime(2001, 1, 1, 0, 40, tzinfo=timezone.utc)
+        assert [r["id"] for r in db.search_messages("hello", since=since)["results"]] == [3]
+
+        # New messages are indexed before a first page, never between pages
+        _touch_source(test_db)
+        assert db.search_messages("fresh", cursor=first["next_cursor"])["results"] == []
+        assert [r["id"] for r in db.search_messages("fresh")["results"]] == [5]
+
+        with pytest.raises(ValueError):
+            db.search_messages("?!")
+
+
+def test_search_snippets_are_escaped():
+    """Test that message text is HTML-escaped before matches are highlighted."""
+    from app.db.search_index import _MATCH_END, _MATCH_START, highlight
+
+    snippet = f"<img src=x onerror=alert(1)> {_MATCH_START}hello{_MATCH_END} & bye"
+    assert highlight(snippet) == "&lt;img src=x onerror=alert(1)&gt; <b>hello</b> &amp; bye"
+
+
+def _attributed_body(text):
+    """Build an attributedBody blob the way Messages.app archives one."""
+    data = text.encode()
+    if len(data) < 0x80:
+        length = bytes([len(data)])
+    else:
+        length = b"\x81" + len(data).to_bytes(2, "little")
+    return (
+        b"\x04\x0bstreamtyped\x81\xe8\x03\x84\x01@\x84\x84\x84\x12NSAttributedString\x00"
+        b"\x84\x84\x08NSObject\x00\x85\x92\x84\x84\x84\x08NSString\x01\x94\x84\x01+"
+        + length + data
+        + b"\x86\x84\x02iI\x01\x05\x92\x84\x84\x84\x0cNSDictionary\x00\x94\x84\x01i\x01\x86"
+    )
+
+
+def test_decode_attributed_body():
+    """Test extracting text from typedstream blobs of every length encoding."""
+    from app.db.attributed_body import decode_attributed_body, message_text
+
+    assert decode_attributed_body(_attributed_body("Hi there 👋")) == "Hi there 👋"
+    long_text = "word " * 100
+    assert decode_attributed_body(_attributed_body(long_text)) == long_text
+    assert decode_attributed_body(None) is None
+    assert decode_attributed_body(b"not an archive") is None
+    assert message_text("plain", _attributed_body("ignored")) == "plain"
+
+
+def test_attributed_body_messages_are_counted(test_db, tmp_path):
+    """Test that messages with only an attributedBody are no longer skipped."""
+    engine = create_engine(f"sqlite:///{test_db}")
+    with sessionmaker(bind=engine)() as session:
+        session.add(Message(guid="msg5", text=None, attributed_body=_attributed_body("Hello from Ventura"),
+                            handle_id=1, is_from_me=0, date=5000))
+        session.commit()
+    engine.dispose()
+
+    with IMessageDB(test_db) as db:
+        assert dict(db.get_word_frequency("+1234567890", limit=100))["hello"] == 3
+        assert db.get_global_word_frequency(limit=1) == [("hello", 3)]
+        page = db.get_messages_page("+1234567890", fields=["id", "text"])
+        assert page["messages"][-1] == {"id": 5, "text": "Hello from Ventura"}
+
+    with IMessageDB(test_db, sidecar_dir=str(tmp_path)) as db:
+        db.refresh_indexes()
+        assert db.decoded_text.lookup([5]) == {5: "Hello from Ventura"}
+        assert dict(db.get_word_frequency("+1234567890", limit=100))["ventura"] == 1
+        assert dict(db.get_word_frequency("+1234567890", limit=100, approximate=True))["hello"] == 3
+        assert [r["id"] for r in db.search_messages("ventura")["results"]] == [5]
+
+
+def test_text_scans_read_decoded_texts_from_the_sidecar(test_db, tmp_path, monkeypatch):
+    """Test that scans take attributedBody texts from the cache, not decode them."""
+    from sqlalchemy import insert
+    from app.db import attributed_body
+    from app.models.imessage import chat_message_assoc
+
+    engine = create_engine(f"sqlite:///{test_db}")
+    with sessionmaker(bind=engine)() as session:
+        session.add(Chat(guid="chat1", chat_identifier="chat1", service_name="iMessage"))
+        session.add(Message(guid="msg5", text=None, attributed_body=_attributed_body("Hello from Ventura"),
+                            handle_id=1, is_from_me=0, date=5000))
+        session.flush()
+        session.execute(insert(chat_message_assoc), [
+            {"chat_id": 1, "message_id": rowid, "message_date": rowid * 1000} for rowid in (1, 5)
+        ])
+        session.commit()
+    engine.dispose()
+
+    with IMessageDB(test_db, sidecar_dir=str(tmp_path)) as db:
+        db.refresh_indexes()
+        decoded = []
+        original = attributed_body.decode_attributed_body
+        monkeypatch.setattr(attributed_body, "decode_attributed_body",
+                            lambda blob: decoded.append(blob) or original(blob))
+        assert dict(db.get_chat_word_frequency(1, limit=100))["ventura"] == 1
+        assert decoded == []
+
+
+def test_chat_analytics(test_db):
+    """Test group chat stats, words and participants via the join tables."""
+    from sqlalchemy import insert
+    from app.models.imessage import chat_handle_assoc, chat_message_assoc
+
+    engine = create_engine(f"sqlite:///{test_db}")
+    with sessionmaker(bind=engine)() as session:
+        session.add(Chat(guid="chat1", chat_identifier="chat1", service_name="iMessage"))
+        session.add(Message(guid="msg5", text="hello group", handle_id=0, is_from_me=1, date=5000))
+        session.flush()
+        # Messages 1-4 plus my own message 5; handle 2 is a member
+        session.execute(insert(chat_message_assoc), [
+            {"chat_id": 1, "message_id": rowid, "message_date": rowid * 1000} for rowid in range(1, 6)
+        ])
+        session.execute(insert(chat_handle_assoc), [
+            {"chat_id": 1, "handle_id": 1}, {"chat_id": 1, "handle_id": 2}
+        ])
+        session.commit()
+    engine.dispose()
+
+    with IMessageDB(test_db) as db:
+        assert db.get_chat_stats(1) == {"sent": 3, "received": 2, "participants": 2}
+        assert db.get_chat_word_frequency(1, limit=1) == [("hello", 3)]
+        assert [(p["contact_id"], p["messages"]) for p in db.get_chat_participants(1)] == [
+            ("+1234567890", 1), ("test@example.com", 1)
+        ]
+        assert db.get_chat_stats(99) == {"sent": 0, "received": 0, "participants": 0}
+        assert db.get_chat_participants(99) == []
+
+
+def test_contact_leaderboard(test_db, tmp_path):
+    """Test that the incremental rollup ranks contacts like a full scan."""
+    with IMessageDB(test_db) as db:
+        scanned = db.get_contact_leaderboard("messages", 10)
+        assert [entry["contact_id"] for entry in scanned] == ["+1234567890", "test@example.com"]
+        top = scanned[0]
+        assert (top["messages"], top["sent"], top["received"]) == (3, 2, 1)
+        assert top["first_message"] == "2001-01-01T00:16:40+00:00"
+        assert top["messages_per_day"] == 3.0
+        assert top["average_length"] == pytest.approx(40 / 3)
+        assert db.get_contact_leaderboard("received", 1)[0]["contact_id"] == "+1234567890"
+        with pytest.raises(ValueError):
+            db.get_contact_leaderboard("unknown")
+
+    with IMessageDB(test_db, mode="snapshot", snapshot_dir=str(tmp_path / "snapshots"),
+                    sidecar_dir=str(tmp_path)) as db:
+        assert db.get_contact_leaderboard("messages", 10) == scanned
+        with db.session() as session:
+            assert db.contact_rollup.update(session, db._get_handle_map(session)) == 0
+
+        _touch_source(test_db)
+        top = db.get_contact_leaderboard("last_message", 1)[0]
+        assert top["messages"] == 4
+        assert top["last_message"] == "2001-01-01T01:23:20+00:00"
+
+    with IMessageDB(test_db) as db:
+        assert db.get_contact_leaderboard("messages", 10)[0] == top
+
+
+def test_sidecar_write_excludes_other_writers(tmp_path):
+    """Test that index updates hold the sidecar's write lock while they run."""
+    sidecar = SidecarDB(str(tmp_path / "sidecar.db"))
+    other = SidecarDB(sidecar.path)
+    with sidecar.write(threading.Lock()) as conn:
+        sidecar.set_high_water(conn, "test", 5)
+        # Another process's writer cannot start, so it cannot read a stale mark
+        with pytest.raises(SidecarBusy):
+            with other.write(threading.Lock(), blocking=False):
+                pass
+        lock = threading.Lock()
+        lock.acquire()
+        with pytest.raises(SidecarBusy):
+            with sidecar.write(lock, blocking=False):
+                pass
+    with other.write(threading.Lock(), blocking=False) as conn:
+        assert other.get_high_water(conn, "test") == 5
@@ -0,0 +1,24 @@
+import time
+
+from app.core.metrics import RequestTrace, _current_trace, span, timed_iter
+
+
+def test_spans_record_exclusive_time_and_rows():
+    """Test that nested spans and streamed batches are not double counted."""
+    trace = RequestTrace()
+    token = _current_trace.set(trace)
+    try:
+        with span("test_outer") as outer:
+            with span("test_inner"):
+                time.sleep(0.02)
+            batches = list(timed_iter(iter([[1, 2], [3]]), "test_fetch"))
+    finally:
+        _current_trace.reset(token)
+
+    assert batches == [[1, 2], [3]]
+    phases = trace.phases()
+    assert phases.keys() == {"test_outer", "test_inner", "test_fetch"}
+    assert phases["test_inner"] >= 0.02
+    assert outer.seconds < 0.02
+    assert [s.rows for s in trace.spans if s.phase == "test_fetch"] == [3]
+    assert "test_inner;dur=" in trace.server_timing()
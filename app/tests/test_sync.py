@@ -0,0 +1,128 @@
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.imessage import IMessageDB
+from app.models.base import Base as ServerBase
+from app.models.imessage import Handle, Message
+from app.models.message import Contact, Message as MirroredMessage, MessageAnalytics
+from app.services.sync import MessageSyncService
+from app.tests.conftest import JAN_1_2024
+
+
+@pytest.fixture
+def source_db(empty_chat_db):
+    """Create a chat.db with two contacts, one of them on two handles."""
+    engine = create_engine(f"sqlite:///{empty_chat_db}")
+    with sessionmaker(bind=engine)() as session:
+        imessage = Handle(contact_id="+15551234567", service="iMessage")
+        sms = Handle(contact_id="(555) 123-4567", service="SMS")
+        email = Handle(contact_id="friend@example.com", service="iMessage")
+        session.add_all([imessage, sms, email])
+        session.flush()
+        session.add_all([
+            Message(guid="1", text="Hello world", handle_id=imessage.id, is_from_me=1, date=JAN_1_2024),
+            Message(guid="2", text="hello again", handle_id=sms.id, is_from_me=0, date=JAN_1_2024 + 60 * 10 ** 9),
+            Message(guid="3", text="Different contact", handle_id=email.id, is_from_me=0, date=JAN_1_2024),
+            # Sent to a group chat, so there is no handle to attribute it to
+            Message(guid="4", text="to the group", handle_id=0, is_from_me=1, date=JAN_1_2024),
+        ])
+        session.commit()
+    engine.dispose()
+    return empty_chat_db
+
+
+@pytest.fixture
+def server_db():
+    """Create an in-memory stand-in for the server database."""
+    engine = create_engine("sqlite://", poolclass=StaticPool,
+                           connect_args={"check_same_thread": False})
+    ServerBase.metadata.create_all(engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def _add_message(db_path, handle_id, text, date):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with sessionmaker(bind=engine)() as session:
+        session.add(Message(guid=text, text=text, handle_id=handle_id, is_from_me=0, date=date))
+        session.commit()
+    engine.dispose()
+
+
+def test_initial_sync(source_db, server_db):
+    """Test that a first sync mirrors messages, contacts and word counts."""
+    with IMessageDB(source_db, mode="readonly") as imessage:
+        assert MessageSyncService(imessage, server_db, batch_size=2).sync_once() == 3
+
+    with server_db() as session:
+        assert session.query(MirroredMessage).count() == 3
+        contact = session.query(Contact).filter(Contact.handle_id == "+15551234567").one()
+        assert contact.phone_number == "+15551234567"
+        assert contact.total_messages == 2
+        assert contact.last_message_date.isoformat() == "2024-01-01T00:01:00"
+
+        other = session.query(Contact).filter(Contact.handle_id == "friend@example.com").one()
+        assert other.email == "friend@example.com"
+        assert other.total_messages == 1
+
+        words = dict(
+            session.query(MessageAnalytics.word, MessageAnalytics.frequency)
+            .filter(MessageAnalytics.contact_id == contact.id)
+        )
+        assert words == {"hello": 2, "world": 1, "again": 1}
+
+
+def test_incremental_sync(source_db, server_db):
+    """Test that later syncs only copy messages above the high-water mark."""
+    with IMessageDB(source_db, mode="readonly") as imessage:
+        service = MessageSyncService(imessage, server_db)
+        service.sync_once()
+        assert service.sync_once() == 0
+
+        _add_message(source_db, 1, "hello later", JAN_1_2024 + 3600 * 10 ** 9)
+        assert service.sync_once() == 1
+
+    with server_db() as session:
+        contact = session.query(Contact).filter(Contact.handle_id == "+15551234567").one()
+        assert contact.total_messages == 3
+        assert contact.last_message_date.isoformat() == "2024-01-01T01:00:00"
+        hello = session.query(MessageAnalytics).filter(
+            MessageAnalytics.contact_id == contact.id, MessageAnalytics.word == "hello"
+        ).one()
+        assert hello.frequency == 3
+        assert session.query(MirroredMessage).count() == 4
+
+
+def test_cancelled_sync_stops_after_its_current_batch(source_db, server_db):
+    """Test that cancelling the sync loop waits for the pass it interrupts."""
+    with IMessageDB(source_db, mode="readonly") as imessage:
+        service = MessageSyncService(imessage, server_db, batch_size=1)
+        started, release = threading.Event(), threading.Event()
+        synced = []
+        sync_batch = service._sync_batch
+
+        def slow_sync_batch(target, batch):
+            started.set()
+            release.wait(5)
+            synced.append(batch)
+            return sync_batch(target, batch)
+
+        service._sync_batch = slow_sync_batch
+
+        async def cancel_mid_pass():
+            task = asyncio.ensure_future(service.run_forever(60))
+            await asyncio.to_thread(started.wait, 5)
+            task.cancel()
+            await asyncio.sleep(0.05)
+            assert not task.done()
+            release.set()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_mid_pass())
+        assert len(synced) == 1
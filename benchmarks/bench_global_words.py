@@ -0,0 +1,66 @@
+"""
+Measure how the global word count scales with worker processes.
+
+Builds a synthetic chat.db, then times IMessageDB.get_global_word_frequency
+with 1, 2, 4, ... worker processes (up to the CPU count) against a
+single-process baseline that tokenizes the whole table in one pass.
+
+Usage:
+    python -m benchmarks.bench_global_words --messages 1000000
+    python -m benchmarks.bench_global_words --workers 1 2 4 8
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.db.imessage import IMessageDB
+from app.db.word_index import count_words_in_range, top_n
+from benchmarks.bench_word_frequency import build_database
+
+
+def default_workers():
+    counts = []
+    workers = 1
+    while workers < (os.cpu_count() or 1):
+        counts.append(workers)
+        workers *= 2
+    return counts + [os.cpu_count() or 1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "chat.db")
+        build_database(db_path, args.messages)
+        print(f"{args.messages} messages, top {args.limit} words, {os.cpu_count()} CPUs")
+        print(f"{'workers':<10} {'time':>13} {'speedup':>9}")
+
+        started = time.perf_counter()
+        top_n(count_words_in_range(db_path, 0, args.messages), args.limit)
+        baseline = time.perf_counter() - started
+        print(f"{'inline':<10} {baseline * 1000:>10.1f} ms {1.0:>8.2f}x")
+
+        for workers in args.workers:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn")
+            ) as pool, IMessageDB(db_path, mode="readonly") as db:
+                # Start the workers before timing
+                list(pool.map(abs, range(workers)))
+                started = time.perf_counter()
+                db.get_global_word_frequency(args.limit, pool=pool, partitions=4 * workers)
+                elapsed = time.perf_counter() - started
+            print(f"{workers:<10} {elapsed * 1000:>10.1f} ms {baseline / elapsed:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
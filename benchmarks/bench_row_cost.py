@@ -0,0 +1,97 @@
+"""
+Per-row cost of each way of reading chat.db.
+
+Reads the same (date, is_from_me, text) columns of every message through:
+
+- orm[entity]: session.query(Message), building a Message per row
+- orm[columns]: session.query() of the three columns, a Row per row
+- core: session.execute(select(...)) with yield_per partitions
+- raw: app.db.raw.fetch_batches on the sqlite3 connection, plain tuples
+
+and prints the best time over a few runs in nanoseconds per row:
+
+    python -m benchmarks.bench_row_cost --messages 1000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable, Dict
+
+from sqlalchemy import select
+
+from app.db.imessage import IMessageDB
+from app.db.raw import fetch_batches, raw_connection
+from app.models.imessage import Message
+from benchmarks.synthetic import generate_chat_db
+
+RAW_SQL = "SELECT date, is_from_me, text FROM message"
+
+
+def _orm_entity(db: IMessageDB) -> int:
+    with db.session() as session:
+        return sum(1 for _ in session.query(Message).yield_per(db.batch_size))
+
+
+def _orm_columns(db: IMessageDB) -> int:
+    with db.session() as session:
+        query = session.query(Message.date, Message.is_from_me, Message.text)
+        return sum(1 for _ in query.yield_per(db.batch_size))
+
+
+def _core(db: IMessageDB) -> int:
+    with db.session() as session:
+        result = session.execute(
+            select(Message.date, Message.is_from_me, Message.text)
+            .execution_options(yield_per=db.batch_size)
+        )
+        return sum(len(rows) for rows in result.partitions())
+
+
+def _raw(db: IMessageDB) -> int:
+    with db.session() as session:
+        batches = fetch_batches(raw_connection(session), RAW_SQL, (), db.batch_size)
+        return sum(len(rows) for rows in batches)
+
+
+READERS: Dict[str, Callable[[IMessageDB], int]] = {
+    "orm[entity]": _orm_entity,
+    "orm[columns]": _orm_columns,
+    "core": _core,
+    "raw": _raw,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the per-row cost of ORM, Core and raw reads")
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="existing chat.db to read instead of a synthetic one")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "msg-api-bench"),
+                        help="where synthetic databases are cached")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    db_path = args.db or os.path.join(args.data_dir, f"chat_{args.messages}_1000_100_{args.seed}.db")
+    if not os.path.exists(db_path):
+        generate_chat_db(db_path, args.messages, 1000, 100, args.seed)
+
+    db = IMessageDB(db_path, mode="readonly")
+    db.connect()
+    try:
+        print(f"{'reader':<14} {'rows':>10} {'best':>10} {'ns/row':>8}")
+        for name, reader in READERS.items():
+            best = float("inf")
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                rows = reader(db)
+                best = min(best, time.perf_counter() - started)
+            print(f"{name:<14} {rows:>10} {best * 1000:>8.1f}ms {best / max(rows, 1) * 1e9:>8.0f}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
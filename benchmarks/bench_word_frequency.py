@@ -0,0 +1,112 @@
+"""
+Compare peak memory and wall time of the word-frequency implementations.
+
+Builds a synthetic chat.db with one large conversation, then runs:
+
+- legacy:    the original .all() + one big word list + Counter.most_common
+- streaming: IMessageDB.get_word_frequency without a sidecar index
+- indexed:   IMessageDB.get_word_frequency served from the sidecar word index
+
+Usage:
+    python -m benchmarks.bench_word_frequency --messages 200000
+"""
+
+import argparse
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+from sqlalchemy import create_engine
+
+from app.db.imessage import IMessageDB
+from app.models.imessage import Base, Handle, Message
+
+CONTACT_ID = "+15555550100"
+VOCABULARY = [f"word{i}" for i in range(5000)]
+
+
+def build_database(path: str, messages: int, seed: int = 0) -> None:
+    """Write a chat.db with one handle and `messages` messages."""
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    rng = random.Random(seed)
+    # Zipf-like weights so a few words dominate, as in real conversations
+    weights = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "INSERT INTO handle (ROWID, id, service) VALUES (1, ?, 'iMessage')",
+        (CONTACT_ID,)
+    )
+    rows = (
+        (
+            f"msg{i}",
+            " ".join(rng.choices(VOCABULARY, weights, k=rng.randint(3, 30))),
+            1,
+            i % 2,
+            i,
+        )
+        for i in range(messages)
+    )
+    conn.executemany(
+        "INSERT INTO message (guid, text, handle_id, is_from_me, date) VALUES (?, ?, ?, ?, ?)",
+        rows
+    )
+    conn.commit()
+    conn.close()
+
+
+def legacy_word_frequency(db: IMessageDB, limit: int):
+    """The original implementation, kept here as the baseline."""
+    with db.session() as session:
+        handle = session.query(Handle).filter(Handle.contact_id == CONTACT_ID).first()
+        messages = session.query(Message.text).filter(
+            Message.handle_id == handle.id,
+            Message.text.isnot(None)
+        ).all()
+        words = []
+        for msg in messages:
+            if msg.text:
+                words.extend(re.findall(r'\b\w+\b', msg.text.lower()))
+        return Counter(words).most_common(limit)
+
+
+def measure(label: str, func) -> None:
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10} {elapsed * 1000:>10.1f} ms {peak / 2**20:>10.1f} MiB   top={result[:3]}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "chat.db")
+        build_database(db_path, args.messages)
+        print(f"{args.messages} messages, top {args.limit} words")
+        print(f"{'':<10} {'time':>13} {'peak alloc':>14}")
+
+        with IMessageDB(db_path, mode="readonly") as db:
+            measure("legacy", lambda: legacy_word_frequency(db, args.limit))
+            measure("streaming", lambda: db.get_word_frequency(CONTACT_ID, args.limit))
+
+        with IMessageDB(db_path, mode="readonly", sidecar_dir=workdir) as db:
+            measure("build", lambda: [("indexed", db.refresh_indexes())])
+            measure("indexed", lambda: db.get_word_frequency(CONTACT_ID, args.limit))
+
+
+if __name__ == "__main__":
+    main()
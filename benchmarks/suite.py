@@ -0,0 +1,311 @@
+"""
+Reproducible benchmark suite for the analytics hot paths.
+
+Runs against a seeded synthetic chat.db (see benchmarks.synthetic), which is
+generated on first use and reused afterwards. Every case runs in a fresh
+process, so its peak RSS is its own:
+
+- connect[copy|readonly|snapshot]: IMessageDB.connect() and close()
+- message_counts: IMessageDB.get_message_count_by_contact
+- word_frequency[streaming|indexed]: IMessageDB.get_word_frequency without
+  and with the sidecar word index
+- contact_leaderboard[streaming|indexed]: IMessageDB.get_contact_leaderboard
+  without and with the sidecar contact rollup
+- http[...]: the same operations through the FastAPI app, with response
+  caching off
+
+Latency (mean, p50, p95, max), throughput and peak RSS are printed and can be
+written as JSON, and two JSON reports can be compared:
+
+    python -m benchmarks.suite --messages 1000000 --output before.json
+    python -m benchmarks.suite --messages 1000000 --output after.json
+    python -m benchmarks.suite --compare before.json after.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import quote
+
+from app.db.imessage import IMessageDB
+from benchmarks.synthetic import busiest_contact, generate_chat_db
+
+# Case name -> (setup context manager, keyword arguments)
+CASES: Dict[str, Any] = {}
+
+
+def case(name: str, **kwargs: Any) -> Callable:
+    """Register a setup context manager yielding the operation to time."""
+    def register(setup: Callable) -> Callable:
+        CASES[name] = (contextmanager(setup), kwargs)
+        return setup
+    return register
+
+
+def _accessor(ctx: Dict[str, Any], sidecar: bool = False) -> IMessageDB:
+    db = IMessageDB(
+        ctx["db_path"],
+        mode="readonly",
+        sidecar_dir=ctx["sidecar_dir"] if sidecar else None,
+    )
+    db.connect()
+    return db
+
+
+def _connect(ctx: Dict[str, Any], mode: str) -> Iterator[Callable]:
+    def operation():
+        db = IMessageDB(ctx["db_path"], mode=mode, snapshot_dir=ctx["snapshot_dir"])
+        db.connect()
+        db.close()
+    yield operation
+
+
+for _mode in ("copy", "readonly", "snapshot"):
+    case(f"connect[{_mode}]", mode=_mode)(_connect)
+
+
+@case("message_counts")
+def _message_counts(ctx: Dict[str, Any]) -> Iterator[Callable]:
+    db = _accessor(ctx)
+    try:
+        yield lambda: db.get_message_count_by_contact(ctx["contact"])
+    finally:
+        db.close()
+
+
+def _word_frequency(ctx: Dict[str, Any], sidecar: bool) -> Iterator[Callable]:
+    db = _accessor(ctx, sidecar)
+    try:
+        yield lambda: db.get_word_frequency(ctx["contact"], 10)
+    finally:
+        db.close()
+
+
+case("word_frequency[streaming]", sidecar=False)(_word_frequency)
+case("word_frequency[indexed]", sidecar=True)(_word_frequency)
+
+
+def _contact_leaderboard(ctx: Dict[str, Any], sidecar: bool) -> Iterator[Callable]:
+    db = _accessor(ctx, sidecar)
+    try:
+        yield lambda: db.get_contact_leaderboard("messages", 50)
+    finally:
+        db.close()
+
+
+case("contact_leaderboard[streaming]", sidecar=False)(_contact_leaderboard)
+case("contact_leaderboard[indexed]", sidecar=True)(_contact_leaderboard)
+
+
+def _http(ctx: Dict[str, Any], path: str, sidecar: bool = False) -> Iterator[Callable]:
+    from fastapi.testclient import TestClient
+
+    from app.api.v1.endpoints.analytics import get_imessage
+    from app.core.auth import get_current_user
+    from app.core.settings import settings
+    from app.db.executor import BoundedExecutor
+    from app.db.imessage import AsyncIMessageDB
+    from app.main import app
+    from app.services.cache import ResponseCache, get_response_cache
+
+    db = _accessor(ctx, sidecar)
+    pool = BoundedExecutor(settings.IMESSAGE_MAX_WORKERS, settings.IMESSAGE_MAX_PENDING)
+    app.dependency_overrides[get_current_user] = lambda: {"email": "bench@example.com"}
+    app.dependency_overrides[get_imessage] = lambda: AsyncIMessageDB(db, pool)
+    app.dependency_overrides[get_response_cache] = lambda: ResponseCache(enabled=False)
+    # Without the context manager the app lifespan (shared accessor, sync) never starts
+    client = TestClient(app)
+    url = "/api/v1/analytics" + path.format(contact=quote(ctx["contact"]))
+
+    def operation():
+        client.get(url).raise_for_status()
+
+    try:
+        yield operation
+    finally:
+        app.dependency_overrides.clear()
+        pool.shutdown()
+        db.close()
+
+
+case("http[contact_stats]", path="/contacts/{contact}/stats")(_http)
+case("http[word_frequency]", path="/contacts/{contact}/word-frequency", sidecar=True)(_http)
+case("http[messages]", path="/contacts/{contact}/messages?limit=500")(_http)
+
+
+def _peak_rss_mib() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    index = max(0, min(len(sorted_values) - 1, round(percentile / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_case(name: str, ctx: Dict[str, Any], iterations: int, warmup: int) -> Dict[str, Any]:
+    """Time one case. Meant to run in a fresh worker process.
+
+    Returns:
+        Latencies in milliseconds, operations per second, and peak RSS of
+        the process before setup and at the end
+    """
+    setup, kwargs = CASES[name]
+    baseline = _peak_rss_mib()
+    with setup(ctx, **kwargs) as operation:
+        for _ in range(warmup):
+            operation()
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            began = time.perf_counter()
+            operation()
+            latencies.append((time.perf_counter() - began) * 1000)
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies),
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "max": latencies[-1],
+        },
+        "throughput_per_s": iterations / elapsed,
+        "baseline_rss_mib": baseline,
+        "peak_rss_mib": _peak_rss_mib(),
+    }
+
+
+def build_indexes(ctx: Dict[str, Any]) -> float:
+    """Build the sidecar indexes the indexed cases read, returning seconds taken."""
+    started = time.perf_counter()
+    db = _accessor(ctx, sidecar=True)
+    try:
+        db.refresh_indexes()
+    finally:
+        db.close()
+    return time.perf_counter() - started
+
+
+def _in_fresh_process(func: Callable, *args: Any) -> Any:
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(func, *args).result()
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path: str, new_path: str) -> None:
+    """Print the change in p50 latency and peak RSS between two reports."""
+    with open(old_path) as f:
+        old = json.load(f)["results"]
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+    print(f"{'case':<28} {'p50 old':>10} {'p50 new':>10} {'change':>8} {'rss old':>9} {'rss new':>9}")
+    for name in sorted(old.keys() | new.keys()):
+        if name not in old or name not in new:
+            print(f"{name:<28} {'only in ' + ('new' if name in new else 'old'):>10}")
+            continue
+        before, after = old[name]["latency_ms"]["p50"], new[name]["latency_ms"]["p50"]
+        print(
+            f"{name:<28} {before:>8.2f}ms {after:>8.2f}ms {(after / before - 1) * 100:>+7.1f}% "
+            f"{old[name]['peak_rss_mib']:>7.1f}Mi {new[name]['peak_rss_mib']:>7.1f}Mi"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the analytics hot paths")
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--handles", type=int, default=1000)
+    parser.add_argument("--group-chats", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="existing chat.db to benchmark instead of a synthetic one")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "msg-api-bench"),
+                        help="where synthetic databases are cached")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=sorted(CASES))
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two JSON reports instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    db_path = args.db or os.path.join(
+        args.data_dir, f"chat_{args.messages}_{args.handles}_{args.group_chats}_{args.seed}.db"
+    )
+    if not os.path.exists(db_path):
+        print(f"Generating {db_path}", file=sys.stderr)
+        generate_chat_db(db_path, args.messages, args.handles, args.group_chats, args.seed)
+
+    with tempfile.TemporaryDirectory(prefix="bench_", dir=args.data_dir) as workdir:
+        ctx = {
+            "db_path": db_path,
+            "contact": busiest_contact(db_path),
+            "snapshot_dir": os.path.join(workdir, "snapshots"),
+            "sidecar_dir": os.path.join(workdir, "sidecar"),
+        }
+        report: Dict[str, Any] = {
+            "meta": {
+                "started": datetime.now(timezone.utc).isoformat(),
+                "revision": _git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "iterations": args.iterations,
+                "warmup": args.warmup,
+            },
+            "dataset": {
+                "path": db_path,
+                "bytes": os.path.getsize(db_path),
+                "messages": None if args.db else args.messages,
+                "handles": None if args.db else args.handles,
+                "group_chats": None if args.db else args.group_chats,
+                "seed": None if args.db else args.seed,
+                "contact": ctx["contact"],
+            },
+            "results": {},
+        }
+        report["dataset"]["index_build_s"] = _in_fresh_process(build_indexes, ctx)
+
+        print(f"{'case':<28} {'p50':>10} {'p95':>10} {'ops/s':>9} {'peak RSS':>10}")
+        for name in args.cases:
+            result = _in_fresh_process(run_case, name, ctx, args.iterations, args.warmup)
+            report["results"][name] = result
+            latency = result["latency_ms"]
+            print(
+                f"{name:<28} {latency['p50']:>8.2f}ms {latency['p95']:>8.2f}ms "
+                f"{result['throughput_per_s']:>9.1f} {result['peak_rss_mib']:>7.1f}MiB"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
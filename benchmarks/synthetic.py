@@ -0,0 +1,286 @@
+"""
+Seeded generator of realistic synthetic chat.db files.
+
+Writes the chat.db tables the API reads (handle, chat, message and both join
+tables) with:
+
+- thousands of handles, phone numbers and emails, on iMessage and SMS
+- a 1:1 chat per handle plus group chats of 3-8 members
+- conversation activity and word usage following Zipf distributions
+- message dates in nanoseconds since 2001, increasing with random gaps
+- a share of messages with NULL text and only an attributedBody, as macOS
+  Ventura and later store them
+
+The same arguments always produce the same database, so benchmark runs are
+comparable between releases:
+
+    python -m benchmarks.synthetic ./chat.db --messages 1000000
+    python -m benchmarks.synthetic ./chat.db --messages 10000000 --handles 5000 --group-chats 500
+"""
+
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timezone
+from itertools import accumulate
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import create_engine
+
+from app.db.dates import APPLE_EPOCH
+from app.models.imessage import Base
+
+logger = logging.getLogger(__name__)
+
+# Rows written per executemany
+CHUNK_SIZE = 50_000
+VOCABULARY_SIZE = 20_000
+SYLLABLES = [consonant + vowel for consonant in "bcdfghjklmnprstvwyz" for vowel in "aeiou"]
+
+# Indexes real chat.db files ship with, so query plans match production
+CHAT_DB_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS message_idx_handle ON message (handle_id, date)",
+    "CREATE INDEX IF NOT EXISTS chat_message_join_idx_message_date_id_chat_id "
+    "ON chat_message_join (chat_id, message_date, message_id)",
+    "CREATE INDEX IF NOT EXISTS chat_message_join_idx_message_id_only ON chat_message_join (message_id)",
+    "CREATE INDEX IF NOT EXISTS chat_handle_join_idx_handle_id ON chat_handle_join (handle_id)",
+]
+
+
+def attributed_body(text: str) -> bytes:
+    """Archive text as a typedstream NSAttributedString, as Messages.app does."""
+    data = text.encode()
+    if len(data) < 0x80:
+        length = bytes([len(data)])
+    elif len(data) < 0x10000:
+        length = b"\x81" + len(data).to_bytes(2, "little")
+    else:
+        length = b"\x82" + len(data).to_bytes(4, "little")
+    return (
+        b"\x04\x0bstreamtyped\x81\xe8\x03\x84\x01@\x84\x84\x84\x12NSAttributedString\x00"
+        b"\x84\x84\x08NSObject\x00\x85\x92\x84\x84\x84\x08NSString\x01\x94\x84\x01+"
+        + length + data
+        + b"\x86\x84\x02iI\x01\x05\x92\x84\x84\x84\x0cNSDictionary\x00\x94\x84\x01i\x01\x86"
+    )
+
+
+def zipf_cum_weights(size: int, exponent: float = 1.0) -> List[float]:
+    """Cumulative weights making rank r about (r + 1) ** -exponent as likely."""
+    return list(accumulate(1 / (rank + 1) ** exponent for rank in range(size)))
+
+
+def make_vocabulary(rng: random.Random, size: int = VOCABULARY_SIZE) -> List[str]:
+    """Invent `size` distinct pronounceable words, shortest most likely."""
+    words = set()
+    while len(words) < size:
+        syllables = rng.choice((1, 2, 2, 2, 3, 3, 4))
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(syllables)))
+    vocabulary = sorted(words)
+    # Ranks are assigned after sorting so the result depends only on the seed
+    rng.shuffle(vocabulary)
+    vocabulary.sort(key=len)
+    return vocabulary
+
+
+def _make_handles(rng: random.Random, count: int) -> List[tuple]:
+    handles = []
+    for rowid in range(1, count + 1):
+        if rng.random() < 0.2:
+            contact_id = f"user{rowid}@example.com"
+            service = "iMessage"
+        else:
+            contact_id = f"+1555{rowid:07d}"
+            service = "iMessage" if rng.random() < 0.8 else "SMS"
+        handles.append((rowid, contact_id, "us", service))
+    return handles
+
+
+def generate_chat_db(
+    path: str,
+    messages: int = 10_000,
+    handles: int = 500,
+    group_chats: int = 50,
+    seed: int = 0,
+    attributed_body_share: float = 0.5,
+    years: float = 5.0,
+) -> Dict[str, Any]:
+    """Write a synthetic chat.db.
+
+    Args:
+        path: File to create; must not exist yet
+        messages: Number of messages
+        handles: Number of contacts, each with a 1:1 chat
+        group_chats: Number of group chats
+        seed: Seed for every random choice
+        attributed_body_share: Fraction of messages stored only as an
+            attributedBody with NULL text
+        years: Time span the messages are spread over, ending 2024-01-01
+
+    Returns:
+        Dict describing the database, including busiest_contact, the
+        contact_id with the most messages
+
+    Raises:
+        FileExistsError: If path already exists
+        ValueError: If there are fewer than 3 handles
+    """
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    if handles < 3:
+        raise ValueError("At least 3 handles are needed to form group chats")
+
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng)
+    word_weights = zipf_cum_weights(len(vocabulary))
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        for statement in CHAT_DB_INDEXES:
+            conn.execute(statement)
+
+        handle_rows = _make_handles(rng, handles)
+        conn.executemany(
+            "INSERT INTO handle (ROWID, id, country, service) VALUES (?, ?, ?, ?)", handle_rows
+        )
+
+        # Chat n (n <= handles) is the 1:1 chat with handle n; the rest are groups
+        members = {rowid: [rowid] for rowid in range(1, handles + 1)}
+        chat_rows = [
+            (rowid, f"iMessage;-;{contact_id}", contact_id, service, None, None)
+            for rowid, contact_id, _, service in handle_rows
+        ]
+        for number in range(1, group_chats + 1):
+            rowid = handles + number
+            members[rowid] = rng.sample(range(1, handles + 1), rng.randint(3, min(8, handles)))
+            chat_rows.append(
+                (rowid, f"iMessage;+;chat{seed}{number}", f"chat{seed}{number}", "iMessage",
+                 f"chat{seed}{number}", f"Group {number}")
+            )
+        conn.executemany(
+            "INSERT INTO chat (ROWID, guid, chat_identifier, service_name, room_name, display_name) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            chat_rows
+        )
+        conn.executemany(
+            "INSERT INTO chat_handle_join (chat_id, handle_id) VALUES (?, ?)",
+            ((chat_id, handle_id) for chat_id, handle_ids in members.items() for handle_id in handle_ids)
+        )
+
+        # Shuffle which chats are busiest, but keep the choice seeded
+        chat_ids = list(members)
+        rng.shuffle(chat_ids)
+        chat_weights = zipf_cum_weights(len(chat_ids))
+
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp() - years * 365.25 * 86400
+        seconds = start - APPLE_EPOCH.timestamp()
+        mean_gap = years * 365.25 * 86400 / max(messages, 1)
+
+        for offset in range(0, messages, CHUNK_SIZE):
+            count = min(CHUNK_SIZE, messages - offset)
+            chats = rng.choices(chat_ids, cum_weights=chat_weights, k=count)
+            lengths = [min(60, int(rng.expovariate(1 / 8)) + 1) for _ in range(count)]
+            words = rng.choices(vocabulary, cum_weights=word_weights, k=sum(lengths))
+
+            message_rows = []
+            join_rows = []
+            position = 0
+            for index, (chat_id, length) in enumerate(zip(chats, lengths)):
+                rowid = offset + index + 1
+                seconds += rng.expovariate(1 / mean_gap)
+                date = int(seconds * 1e9)
+                text = " ".join(words[position:position + length])
+                position += length
+
+                from_me = rng.random() < 0.5
+                if from_me:
+                    # Your messages to a group have no handle
+                    handle_id = 0 if chat_id > handles else members[chat_id][0]
+                else:
+                    handle_id = rng.choice(members[chat_id])
+                body = None
+                if rng.random() < attributed_body_share:
+                    text, body = None, attributed_body(text)
+
+                delivered = date + int(rng.expovariate(1 / 2) * 1e9)
+                message_rows.append((
+                    rowid, f"{seed:08X}-0000-0000-0000-{rowid:012X}", text, body, handle_id,
+                    date, delivered + int(rng.expovariate(1 / 600) * 1e9), delivered,
+                    int(from_me), 1, 1,
+                ))
+                join_rows.append((chat_id, rowid, date))
+
+            conn.executemany(
+                "INSERT INTO message (ROWID, guid, text, attributedBody, handle_id, date, "
+                "date_read, date_delivered, is_from_me, is_read, is_delivered) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                message_rows
+            )
+            conn.executemany(
+                "INSERT INTO chat_message_join (chat_id, message_id, message_date) VALUES (?, ?, ?)",
+                join_rows
+            )
+            conn.commit()
+
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+    return {
+        "path": path,
+        "messages": messages,
+        "handles": handles,
+        "group_chats": group_chats,
+        "seed": seed,
+        "attributed_body_share": attributed_body_share,
+        "bytes": os.path.getsize(path),
+        "busiest_contact": busiest_contact(path),
+    }
+
+
+def busiest_contact(path: str) -> Optional[str]:
+    """Return the contact_id of the handle with the most messages."""
+    conn = sqlite3.connect(path)
+    try:
+        row = conn.execute(
+            "SELECT h.id FROM message m JOIN handle h ON h.ROWID = m.handle_id "
+            "GROUP BY m.handle_id ORDER BY COUNT(*) DESC, m.handle_id LIMIT 1"
+        ).fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic chat.db")
+    parser.add_argument("path", help="database file to create")
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--handles", type=int, default=1000)
+    parser.add_argument("--group-chats", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--attributed-body-share", type=float, default=0.5,
+                        help="fraction of messages with only an attributedBody")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    started = time.perf_counter()
+    summary = generate_chat_db(
+        args.path, args.messages, args.handles, args.group_chats, args.seed,
+        args.attributed_body_share
+    )
+    logger.info("Wrote %s messages (%.1f MiB) in %.1fs; busiest contact %s",
+                summary["messages"], summary["bytes"] / 2 ** 20,
+                time.perf_counter() - started, summary["busiest_contact"])
+
+
+if __name__ == "__main__":
+    main()
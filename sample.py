@@ -77,18 +77,13 @@ def custom_analysis_example():
     with IMessageDB() as db:
         contact_id = "+1234567890"  # Replace with actual phone number or email
         
-        # Get all messages for time-based analysis
-        session = db.SessionLocal()
-        messages = (session.query(db.Message)
-                   .filter(db.Message.handle_id == contact_id)
-                   .all())
-        
-        # Example: Messages by hour of day
+        # Hourly histogram over the whole history, folded into hour of day.
+        # message.date is Apple-epoch time, so never feed it to
+        # datetime.fromtimestamp() directly.
+        activity = db.get_activity(contact_id, bucket="hour", tz="America/New_York")
         messages_by_hour = defaultdict(int)
-        for msg in messages:
-            if msg.date:  # Unix timestamp
-                hour = datetime.fromtimestamp(msg.date).hour
-                messages_by_hour[hour] += 1
+        for start, sent, received in zip(activity["starts"], activity["sent"], activity["received"]):
+            messages_by_hour[datetime.fromisoformat(start).hour] += sent + received
         
         print("\nCustom analysis - Messages by hour:")
         for hour in sorted(messages_by_hour.keys()):